@@ -0,0 +1,401 @@
+# *
+# * Project Name: Radio User Interface
+# * File: activity_log.py
+# *
+# * Copyright (C) 2024 Fabrizio Palumbo (IU0IJV)
+# *
+# * This program is distributed under the terms of the MIT license.
+# * You can obtain a copy of the license at:
+# * https://opensource.org/licenses/MIT
+# *
+# * DESCRIPTION:
+# * Registro dell'attività dei canali: aperture dello squelch trasformate in eventi e archiviate.
+# *
+# * NOTES:
+# * - ActivityDetector riceve lo stato della radio (flag RX di COMMAND_GET_STATUS) e l'RSSI
+# *   e produce un evento (frequenza, inizio, durata, RSSI di picco) per ogni trasmissione:
+# *     - l'apertura deve durare almeno open_hold secondi (disturbi isolati ignorati);
+# *     - pause più brevi di hang secondi non chiudono l'evento (isteresi nel tempo);
+# *     - eventi più brevi di min_duration vengono scartati;
+# *     - in alternativa ai flag si possono usare due soglie RSSI (apertura > chiusura).
+# * - ActivityStore scrive gli eventi su SQLite in blocchi (un thread, una transazione per
+# *   blocco), in sola aggiunta. Oltre alla tabella degli eventi, indicizzata per istante e per
+# *   frequenza, mantiene un riepilogo orario per frequenza: le classifiche su un intervallo
+# *   leggono al più una riga per ora e frequenza, più gli eventi delle due ore di bordo.
+# * - Uso da riga di comando:
+# *     python activity_log.py busiest [--hours 24] [--limit 20] [--db activity.db]
+# *     python activity_log.py list [--frequency HZ] [--hours 24]
+
+import collections
+import math
+import sqlite3
+import sys
+import threading
+import time
+
+
+DEFAULT_PATH = "activity.db"
+STATUS_RX = 0x0003                  # Flag di ricezione (squelch aperto) in COMMAND_GET_STATUS
+HOUR = 3600
+
+ActivityEvent = collections.namedtuple("ActivityEvent", "frequency start duration peak")
+ChannelActivity = collections.namedtuple("ChannelActivity", "frequency events seconds peak")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id        INTEGER PRIMARY KEY,
+    frequency INTEGER NOT NULL,
+    start     REAL NOT NULL,
+    duration  REAL NOT NULL,
+    peak      INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_start ON events (start);
+CREATE INDEX IF NOT EXISTS events_frequency ON events (frequency, start);
+CREATE TABLE IF NOT EXISTS activity_hourly (
+    hour      INTEGER NOT NULL,
+    frequency INTEGER NOT NULL,
+    events    INTEGER NOT NULL,
+    seconds   REAL NOT NULL,
+    peak      INTEGER NOT NULL,
+    PRIMARY KEY (hour, frequency)
+) WITHOUT ROWID;
+"""
+
+ROLLUP = """
+INSERT INTO activity_hourly (hour, frequency, events, seconds, peak) VALUES (?, ?, 1, ?, ?)
+ON CONFLICT (hour, frequency) DO UPDATE SET
+    events = events + 1, seconds = seconds + excluded.seconds, peak = MAX(peak, excluded.peak)
+"""
+
+
+#-------------------------------------------------------------------------------------------------------------------------
+# Rilevatore delle aperture dello squelch
+#-------------------------------------------------------------------------------------------------------------------------
+#
+class ActivityDetector:
+    """
+    Macchina a stati chiuso -> in apertura -> aperto -> in chiusura -> chiuso.
+
+    on_event:     callback(ActivityEvent) per ogni evento concluso.
+    open_hold:    durata minima (s) dell'apertura perché inizi un evento.
+    hang:         pausa (s) tollerata prima di chiudere l'evento.
+    min_duration: durata minima (s) degli eventi registrati.
+    rssi_open / rssi_close: soglie RSSI grezze opzionali; se indicate sostituiscono i flag
+                  di stato (aperto sopra rssi_open, chiuso sotto rssi_close).
+    """
+
+    CLOSED, OPENING, OPEN, CLOSING = range(4)
+
+    def __init__(self, on_event=None, open_hold=0.2, hang=1.5, min_duration=0.5, rssi_open=None, rssi_close=None):
+        self.on_event = on_event
+        self.open_hold = open_hold
+        self.hang = hang
+        self.min_duration = min_duration
+        self.rssi_open = rssi_open
+        self.rssi_close = rssi_close if rssi_close is not None else rssi_open
+
+        self.frequency = None           # Canale osservato (None = rilevamento sospeso)
+        self.state = self.CLOSED
+        self.events = 0                 # Eventi prodotti
+        self.discarded = 0              # Aperture troppo brevi
+
+        self._squelch_open = False      # Ultimo stato grezzo (flag o soglie)
+        self._start = 0.0
+        self._closed_at = 0.0
+        self._last = 0.0                # Istante dell'ultimo campione
+        self._peak = 0
+        self._lock = threading.Lock()
+
+    # -----------------------------------------------------------------------------
+    def tune(self, frequency, t=None):
+        """
+        Cambio di canale: l'evento in corso si chiude. None sospende il rilevamento
+        (scansione, monitor) finché non viene indicata una frequenza.
+        """
+        with self._lock:
+            if frequency == self.frequency:
+                return
+            self._finish(self._last if t is None else t)
+            self.frequency = frequency
+            self._squelch_open = False
+
+    # -----------------------------------------------------------------------------
+    def status(self, flags, t=None):
+        if self.rssi_open is not None:
+            return
+        with self._lock:
+            self._sample(bool(flags & STATUS_RX), None, time.time() if t is None else t)
+
+    # -----------------------------------------------------------------------------
+    def rssi(self, raw, t=None):
+        with self._lock:
+            squelch_open = self._squelch_open
+            if self.rssi_open is not None:
+                if raw >= self.rssi_open:
+                    squelch_open = True
+                elif raw < self.rssi_close:
+                    squelch_open = False
+            self._sample(squelch_open, raw, time.time() if t is None else t)
+
+    # -----------------------------------------------------------------------------
+    def flush(self, t=None):
+        """
+        Chiude l'evento in corso (es. alla chiusura del programma).
+        """
+        with self._lock:
+            self._finish(self._last if t is None else t)
+
+    # -----------------------------------------------------------------------------
+    def _sample(self, squelch_open, raw, t):
+        if self.frequency is None:
+            return
+        self._last = t
+        self._squelch_open = squelch_open
+        state = self.state
+
+        if state == self.CLOSED:
+            if squelch_open:
+                self.state = self.OPENING
+                self._start = t
+                self._peak = raw or 0
+            return
+
+        if raw is not None and raw > self._peak:
+            self._peak = raw
+
+        if state == self.OPENING:
+            if not squelch_open:
+                self.state = self.CLOSED            # Disturbo isolato
+            elif t - self._start >= self.open_hold:
+                self.state = self.OPEN
+        elif state == self.OPEN:
+            if not squelch_open:
+                self.state = self.CLOSING
+                self._closed_at = t
+        elif squelch_open:
+            self.state = self.OPEN                  # Pausa breve: stessa trasmissione
+        elif t - self._closed_at >= self.hang:
+            self._finish(t)
+
+    # -----------------------------------------------------------------------------
+    def _finish(self, t):
+        state, self.state = self.state, self.CLOSED
+        if state not in (self.OPEN, self.CLOSING) or self.frequency is None:
+            return
+        end = self._closed_at if state == self.CLOSING else t
+        duration = end - self._start
+        if duration < self.min_duration:
+            self.discarded += 1
+            return
+        self.events += 1
+        if self.on_event is not None:
+            self.on_event(ActivityEvent(self.frequency, self._start, duration, self._peak))
+
+    # -----------------------------------------------------------------------------
+    def stats(self):
+        return {"events": self.events, "discarded": self.discarded, "frequency": self.frequency}
+
+
+#-------------------------------------------------------------------------------------------------------------------------
+# Archivio degli eventi
+#-------------------------------------------------------------------------------------------------------------------------
+#
+class ActivityStore:
+    """
+    Eventi di attività su SQLite, in sola aggiunta. record() non accede al disco: gli eventi
+    vengono scritti dal thread avviato con start() (o da flush()).
+    """
+
+    def __init__(self, path=DEFAULT_PATH, flush_interval=5.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.recorded = 0               # Eventi ricevuti
+        self.flushed = 0                # Eventi scritti
+
+        self._db = None
+        self._lock = threading.Lock()   # Connessione al database
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # -----------------------------------------------------------------------------
+    @property
+    def db(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.executescript(SCHEMA)
+        return self._db
+
+    # -----------------------------------------------------------------------------
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run, daemon=True)
+            self._thread.start()
+        return self._thread
+
+    # -----------------------------------------------------------------------------
+    def stop(self):
+        """
+        Ferma il thread, scrive gli eventi rimasti e chiude il database.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(self.flush_interval + 1.0)
+        self.flush()
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    # -----------------------------------------------------------------------------
+    def run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    # -----------------------------------------------------------------------------
+    def record(self, event):
+        with self._pending_lock:
+            self._pending.append(event)
+            self.recorded += 1
+
+    # -----------------------------------------------------------------------------
+    def flush(self):
+        """
+        Scrive gli eventi in attesa e aggiorna il riepilogo orario in un'unica transazione.
+        """
+        with self._pending_lock:
+            events, self._pending = self._pending, []
+        if not events:
+            return 0
+        rows = [(e.frequency, e.start, e.duration, e.peak) for e in events]
+        hourly = [(int(e.start // HOUR), e.frequency, e.duration, e.peak) for e in events]
+        try:
+            with self._lock:
+                db = self.db
+                with db:
+                    db.executemany("INSERT INTO events (frequency, start, duration, peak) VALUES (?, ?, ?, ?)", rows)
+                    db.executemany(ROLLUP, hourly)
+        except sqlite3.Error as e:
+            print(f"Errore scrittura registro attività: {e}")
+            return 0
+        self.flushed += len(events)
+        return len(events)
+
+    # -----------------------------------------------------------------------------
+    def events(self, frequency=None, since=None, until=None, limit=None):
+        """
+        Eventi in ordine di inizio, filtrati per frequenza e intervallo [since, until).
+        """
+        where, params = [], []
+        if frequency is not None:
+            where.append("frequency = ?")
+            params.append(frequency)
+        if since is not None:
+            where.append("start >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("start < ?")
+            params.append(until)
+        sql = "SELECT frequency, start, duration, peak FROM events"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY start"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        with self._lock:
+            return [ActivityEvent(*row) for row in self.db.execute(sql, params)]
+
+    # -----------------------------------------------------------------------------
+    def busiest(self, since=None, until=None, limit=10, by="seconds"):
+        """
+        Canali più attivi nell'intervallo [since, until) (default: ultime 24 ore), ordinati
+        per tempo di attività ("seconds") o numero di eventi ("events").
+        Le ore intere vengono lette dal riepilogo orario, i bordi dalla tabella degli eventi.
+        """
+        until = time.time() if until is None else until
+        since = until - 24 * HOUR if since is None else since
+        first_hour = math.ceil(since / HOUR)
+        last_hour = math.floor(until / HOUR)
+
+        totals = {}
+
+        def add(frequency, events, seconds, peak):
+            previous = totals.get(frequency)
+            if previous is not None:
+                events += previous[0]
+                seconds += previous[1]
+                peak = max(peak, previous[2])
+            totals[frequency] = (events, seconds, peak)
+
+        edge_sql = ("SELECT frequency, COUNT(*), SUM(duration), MAX(peak) FROM events "
+                    "WHERE start >= ? AND start < ? GROUP BY frequency")
+        with self._lock:
+            db = self.db
+            if first_hour < last_hour:
+                for row in db.execute("SELECT frequency, SUM(events), SUM(seconds), MAX(peak) FROM activity_hourly "
+                                      "WHERE hour >= ? AND hour < ? GROUP BY frequency", (first_hour, last_hour)):
+                    add(*row)
+                edges = ((since, first_hour * HOUR), (last_hour * HOUR, until))
+            else:
+                edges = ((since, until),)
+            for low, high in edges:
+                if low < high:
+                    for row in db.execute(edge_sql, (low, high)):
+                        add(*row)
+
+        ranking = [ChannelActivity(frequency, *values) for frequency, values in totals.items()]
+        ranking.sort(key=lambda channel: (getattr(channel, by), channel.events), reverse=True)
+        return ranking[:limit]
+
+    # -----------------------------------------------------------------------------
+    def count(self):
+        with self._lock:
+            return self.db.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+
+    # -----------------------------------------------------------------------------
+    def stats(self):
+        return {"recorded": self.recorded, "flushed": self.flushed, "pending": len(self._pending)}
+
+
+# -----------------------------------------------------------------------------
+def _main(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Registro dell'attività dei canali")
+    parser.add_argument("--db", default=DEFAULT_PATH, help=f"file del registro (default {DEFAULT_PATH})")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    busiest = commands.add_parser("busiest", help="canali più attivi")
+    busiest.add_argument("--hours", type=float, default=24.0, help="intervallo fino a ora (default 24 h)")
+    busiest.add_argument("--limit", type=int, default=20)
+    busiest.add_argument("--by", choices=("seconds", "events"), default="seconds")
+
+    lister = commands.add_parser("list", help="elenca gli eventi")
+    lister.add_argument("--frequency", type=int)
+    lister.add_argument("--hours", type=float, default=24.0)
+
+    args = parser.parse_args(argv[1:])
+    store = ActivityStore(args.db)
+    since = time.time() - args.hours * HOUR
+    try:
+        if args.command == "busiest":
+            t0 = time.perf_counter()
+            ranking = store.busiest(since=since, limit=args.limit, by=args.by)
+            elapsed = time.perf_counter() - t0
+            for channel in ranking:
+                print(f"{channel.frequency:>11}  {channel.events:>6} eventi  {channel.seconds:>9.1f} s  "
+                      f"picco {channel.peak}")
+            print(f"{len(ranking)} canali in {elapsed * 1000:.1f} ms")
+        else:
+            for event in store.events(frequency=args.frequency, since=since):
+                start = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(event.start))
+                print(f"{event.frequency:>11}  {start}  {event.duration:>7.1f} s  picco {event.peak}")
+    finally:
+        store.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main(sys.argv))
@@ -0,0 +1,268 @@
+# *
+# * Project Name: Radio User Interface
+# * File: auto_squelch.py
+# *
+# * Copyright (C) 2024 Fabrizio Palumbo (IU0IJV)
+# *
+# * This program is distributed under the terms of the MIT license.
+# * You can obtain a copy of the license at:
+# * https://opensource.org/licenses/MIT
+# *
+# * DESCRIPTION:
+# * Squelch automatico: soglia calcolata dalla stima continua del rumore di fondo.
+# *
+# * NOTES:
+# * - Il rumore di fondo è un quantile basso (default 20%) dei campioni RSSI, stimato in
+# *   streaming: ogni campione sposta la stima di un passo verso l'alto o verso il basso
+# *   (O(1), nessuna finestra da ordinare). Il passo è proporzionale alla dispersione dei
+# *   campioni sotto la stima (media esponenziale): i segnali, sempre sopra il rumore, non
+# *   ingrandiscono il passo.
+# * - Con lo squelch aperto (flag RX di COMMAND_GET_STATUS, passato a status()) i campioni
+# *   oltre la soglia calcolata appartengono a un segnale e non vengono usati: una
+# *   trasmissione lunga non fa salire la stima del rumore fino alla portante. Un aumento
+# *   del rumore superiore al margine apre lo squelch e quindi non viene inseguito: si
+# *   distingue da una portante solo cambiando banda o regolando lo squelch a mano.
+# * - Una lunga serie di campioni sopra la stima con lo squelch chiuso indica che il rumore è
+# *   salito: il passo verso l'alto cresce a ogni campione della serie, fino a RISE_LIMIT volte.
+# * - Un segnale presente per meno dell'80% del tempo non sposta il quantile del 20%: la
+# *   stima resta sul rumore anche su un canale occupato.
+# * - Una stima per banda (segmenti di 1 MHz): al cambio di banda la soglia già nota viene
+# *   applicata subito, senza attendere nuovi campioni.
+# * - Soglia = rumore + margine (unità RSSI grezze, come COMMAND_SET_SQUELCH). I comandi
+# *   vengono inviati al massimo ogni min_interval secondi e solo per variazioni di almeno
+# *   `hysteresis` unità.
+# * - Verifica senza radio (portante continua, canale libero e occupato):  python auto_squelch.py
+
+import random
+import sys
+import threading
+import time
+
+
+BAND_WIDTH = 1_000_000          # Ampiezza (Hz) dei segmenti con stima indipendente
+RISE_RUN = 10                   # Campioni consecutivi sopra la stima prima di accelerare la salita
+RISE_LIMIT = 8                  # Moltiplicatore massimo del passo verso l'alto
+STATUS_RX = 0x0003              # Flag di ricezione (squelch aperto) in COMMAND_GET_STATUS
+
+
+# -----------------------------------------------------------------------------
+def band_key(frequency, width=BAND_WIDTH):
+    return int(frequency) // width
+
+
+#-------------------------------------------------------------------------------------------------------------------------
+# Stima di un quantile
+#-------------------------------------------------------------------------------------------------------------------------
+#
+class QuantileTracker:
+    """
+    Stima in streaming del quantile q (approssimazione stocastica): a regime la frazione
+    di campioni sotto la stima tende a q.
+
+    gain:        passo relativo alla dispersione dei campioni sotto la stima.
+    min_samples: campioni necessari prima che la stima sia considerata affidabile.
+    """
+
+    def __init__(self, q=0.2, gain=0.1, min_samples=20):
+        self.q = q
+        self.gain = gain
+        self.min_samples = min_samples
+        self.value = None
+        self.spread = 1.0               # Media esponenziale di (stima - campione) per i campioni sotto la stima
+        self.count = 0
+        self.run = 0                    # Campioni consecutivi sopra la stima
+
+    # -----------------------------------------------------------------------------
+    def update(self, x, accelerate=True):
+        """
+        Nuovo campione. accelerate=False non consente la salita accelerata (es. squelch aperto).
+        """
+        self.count += 1
+        if self.value is None:
+            self.value = float(x)
+            return self.value
+        d = x - self.value
+        if d < 0:
+            self.spread += self.gain * (-d - self.spread)
+            self.run = 0
+        elif d > 0 and accelerate:
+            self.run += 1
+        elif d > 0:
+            self.run = 0
+        step = self.gain * max(self.spread, 0.5)
+        if d > 0:
+            self.value += step * self.q * min(RISE_LIMIT, 1 + max(0, self.run - RISE_RUN))
+        elif d < 0:
+            self.value -= step * (1.0 - self.q)
+        return self.value
+
+    # -----------------------------------------------------------------------------
+    @property
+    def ready(self):
+        return self.count >= self.min_samples
+
+
+#-------------------------------------------------------------------------------------------------------------------------
+# Squelch automatico
+#-------------------------------------------------------------------------------------------------------------------------
+#
+class AutoSquelch:
+    """
+    Regola lo squelch a `margin` unità sopra il rumore di fondo della banda corrente.
+
+    set_squelch:  funzione(livello 0-255) che invia la soglia alla radio.
+    margin:       distanza della soglia dal rumore (unità RSSI grezze).
+    quantile:     quantile dei campioni usato come rumore di fondo.
+    min_interval: intervallo minimo (s) tra due comandi.
+    hysteresis:   variazione minima della soglia per inviare un nuovo comando.
+    """
+
+    def __init__(self, set_squelch, margin=12, quantile=0.2, min_interval=2.0, hysteresis=2, min_samples=20):
+        self.set_squelch = set_squelch
+        self.margin = margin
+        self.quantile = quantile
+        self.min_interval = min_interval
+        self.hysteresis = hysteresis
+        self.min_samples = min_samples
+
+        self.enabled = False
+        self.band = None                # Banda corrente (band_key)
+        self.level = None               # Ultima soglia inviata
+        self.samples = 0
+        self.commands = 0               # Soglie inviate
+        self.held = 0                   # Variazioni non inviate per il limite di frequenza
+        self.squelch_open = False       # Ultimo stato dello squelch riportato dalla radio
+        self.ignored = 0                # Campioni di segnale non usati per la stima
+
+        self._trackers = {}             # banda -> QuantileTracker
+        self._last_sent = 0.0
+        self._lock = threading.Lock()
+
+    # -----------------------------------------------------------------------------
+    def enable(self, enabled=True):
+        with self._lock:
+            self.enabled = enabled
+            self.level = None           # Alla riattivazione la soglia viene inviata subito
+            if enabled:
+                self._apply(force=True)
+
+    # -----------------------------------------------------------------------------
+    def tune(self, frequency):
+        """
+        Cambio di frequenza: se la banda cambia e ha già una stima, la soglia viene applicata subito.
+        """
+        band = band_key(frequency)
+        with self._lock:
+            if band == self.band:
+                return
+            self.band = band
+            self._apply(force=True)
+
+    # -----------------------------------------------------------------------------
+    def status(self, flags):
+        """
+        Stato della radio (COMMAND_GET_STATUS): con lo squelch aperto i campioni di segnale vengono esclusi.
+        """
+        self.squelch_open = bool(flags & STATUS_RX)
+
+    # -----------------------------------------------------------------------------
+    def sample(self, rssi):
+        """
+        Nuovo campione RSSI della banda corrente (dal thread di smistamento dei frame).
+        """
+        with self._lock:
+            if self.band is None:
+                return
+            squelch_open = self.squelch_open
+            if squelch_open:
+                # Squelch aperto: solo i campioni sotto la soglia calcolata possono essere rumore
+                # (prima che la stima sia pronta nessun campione a squelch aperto è affidabile)
+                level = self.threshold()
+                if level is None or rssi >= level:
+                    self.ignored += 1
+                    return
+            tracker = self._trackers.get(self.band)
+            if tracker is None:
+                tracker = self._trackers[self.band] = QuantileTracker(self.quantile, min_samples=self.min_samples)
+            tracker.update(rssi, accelerate=not squelch_open)
+            self.samples += 1
+            self._apply()
+
+    # -----------------------------------------------------------------------------
+    def threshold(self, band=None):
+        """
+        Soglia calcolata per la banda (default: quella corrente), oppure None se non ancora nota.
+        """
+        tracker = self._trackers.get(self.band if band is None else band)
+        if tracker is None or not tracker.ready:
+            return None
+        return min(max(round(tracker.value + self.margin), 0), 255)
+
+    # -----------------------------------------------------------------------------
+    def floors(self):
+        return {band: round(tracker.value, 1) for band, tracker in self._trackers.items() if tracker.ready}
+
+    # -----------------------------------------------------------------------------
+    def _apply(self, force=False):
+        if not self.enabled:
+            return
+        level = self.threshold()
+        if level is None or level == self.level:
+            return
+        now = time.monotonic()
+        if not force:
+            if self.level is not None and abs(level - self.level) < self.hysteresis:
+                return
+            if now - self._last_sent < self.min_interval:
+                self.held += 1
+                return
+        self.level = level
+        self._last_sent = now
+        self.commands += 1
+        self.set_squelch(level)
+
+    # -----------------------------------------------------------------------------
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "level": self.level,
+            "samples": self.samples,
+            "commands": self.commands,
+            "held": self.held,
+            "ignored": self.ignored,
+            "bands": len(self._trackers),
+        }
+
+
+# -----------------------------------------------------------------------------
+def _simulate(margin=12, seconds=60, rate=10, noise=40, carrier=150, seed=1):
+    """
+    Squelch automatico attivo su un canale che riceve prima solo rumore, poi una portante continua
+    per `seconds` secondi (campioni a `rate` Hz, come le interrogazioni del pannello).
+    Restituisce (rumore stimato, soglia) a fine portante.
+    """
+    rng = random.Random(seed)
+    level = [255]
+    squelch = AutoSquelch(lambda value: level.__setitem__(0, value), margin=margin, min_interval=0.0)
+    squelch.tune(145_500_000)
+    squelch.enable()
+    for i in range(600 + seconds * rate):
+        rssi = round(rng.gauss(noise, 3)) if i < 600 else carrier
+        squelch.status(STATUS_RX if rssi >= level[0] else 0)
+        squelch.sample(rssi)
+    return squelch.floors()[band_key(145_500_000)], level[0]
+
+
+# -----------------------------------------------------------------------------
+def _main(argv):
+    failures = 0
+    for seconds in (10, 60, 300):
+        floor, level = _simulate(seconds=seconds)
+        ok = floor < 45 and level < 150        # Il rumore stimato resta vicino a quello vero (40)
+        failures += not ok
+        print(f"Portante continua per {seconds} s: rumore {floor}, soglia {level} -> {'OK' if ok else 'ERRORE'}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main(sys.argv))
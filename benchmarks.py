@@ -0,0 +1,350 @@
+# *
+# * Project Name: Radio User Interface
+# * File: benchmarks.py
+# *
+# * Copyright (C) 2024 Fabrizio Palumbo (IU0IJV)
+# *
+# * This program is distributed under the terms of the MIT license.
+# * You can obtain a copy of the license at:
+# * https://opensource.org/licenses/MIT
+# *
+# * DESCRIPTION:
+# * Benchmark dei percorsi critici del controllo radio, eseguibili senza hardware.
+# *
+# * NOTES:
+# * - codec:     parse dei frame CI-V + decodifica BCD, codifica dei comandi SET frequenza/step.
+# * - roundtrip: latenza richiesta/risposta dei comandi GET contro la radio virtuale su pty
+# *              (civ_simulator.py, solo Linux/macOS).
+# * - ui:        avvio di Toplevel1 e costo di update_smeter / update_frequency_display con una
+# *              finestra Tk nascosta (richiede un display).
+# * - I risultati vengono stampati in JSON e confrontati con il file di riferimento: un valore
+# *   peggiore oltre la tolleranza viene segnalato come regressione (codice di uscita 1).
+# * - benchmark_baseline.json contiene solo i gruppi codec e roundtrip: è stato salvato senza
+# *   display e il gruppo ui non ha ancora un riferimento, quindi le sue regressioni non vengono
+# *   segnalate. Va inizializzato su una macchina con display (o sotto Xvfb) con
+# *     python benchmarks.py --save-baseline --only ui
+# *   (gli altri gruppi già salvati vengono conservati). Le misure senza riferimento sono
+# *   elencate in "unbaselined".
+# * - Codici di uscita: 0 tutto confrontato, 1 regressione, 2 verifica incompleta (un gruppo
+# *   richiesto non eseguibile, ad es. ui senza display, o misure senza riferimento). Con
+# *   --allow-incomplete la verifica incompleta viene solo segnalata; per escludere un gruppo
+# *   si usa --only con gli altri.
+# * - Uso:
+# *     python benchmarks.py                        esegue tutto e confronta con benchmark_baseline.json
+# *     python benchmarks.py --only codec ui        solo alcuni gruppi
+# *     python benchmarks.py --save-baseline        salva i risultati come nuovo riferimento
+# *     python benchmarks.py --output risultati.json --tolerance 0.25
+# *     python benchmarks.py --allow-incomplete     senza display: ui segnalato ma non bloccante
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+PANEL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ifradio 10.pyw")
+DEFAULT_TOLERANCE = 0.20        # Peggioramento relativo oltre il quale si segnala una regressione
+IO_TOLERANCE = 1.0              # Misure che passano dal pty e dallo scheduler del sistema operativo
+EXIT_REGRESSION = 1
+EXIT_INCOMPLETE = 2             # Gruppo richiesto non eseguito o misure senza riferimento
+
+
+# -----------------------------------------------------------------------------
+def metric(value, unit, higher_is_better, tolerance=None):
+    """
+    Un risultato; tolerance sostituisce quella generale per le misure più rumorose.
+    """
+    result = {"value": round(value, 3), "unit": unit, "higher_is_better": higher_is_better}
+    if tolerance is not None:
+        result["tolerance"] = tolerance
+    return result
+
+
+# -----------------------------------------------------------------------------
+def _rate(fn, count, repeat=3):
+    """
+    Esegue fn() `repeat` volte e restituisce le operazioni al secondo del passaggio migliore.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return count / best
+
+
+#-------------------------------------------------------------------------------------------------------------------------
+# Codec CI-V
+#-------------------------------------------------------------------------------------------------------------------------
+#
+def bench_codec():
+    from civ_codec import (
+        CIV_START_BYTE, CIV_END_BYTE, CIV_ADDRESS_COMPUTER, CIV_ADDRESS_RADIO,
+        COMMAND_SET_FREQUENCY, COMMAND_SET_STEP, FrameParser, decode_bcd, encode_frequency, encode_frame
+    )
+
+    reply = bytes((CIV_START_BYTE, CIV_START_BYTE, CIV_ADDRESS_COMPUTER, CIV_ADDRESS_RADIO, 0x03,
+                   0x01, 0x45, 0x50, 0x00, 0x00, CIV_END_BYTE))
+    frames_per_chunk, chunks = 32, 2000
+    chunk = reply * frames_per_chunk
+    payload = reply[5:-1]
+
+    def parse_decode():
+        parser = FrameParser()
+        for _ in range(chunks):
+            for message in parser.feed(chunk):
+                decode_bcd(message[5:-1])
+
+    def parse_only():
+        parser = FrameParser()
+        for _ in range(chunks):
+            parser.feed(chunk)
+
+    def decode_only():
+        for _ in range(64000):
+            decode_bcd(payload)
+
+    frequencies = range(144_000_000, 144_000_000 + 12_500 * 20_000, 12_500)
+
+    def encode_set_frequency():
+        # Stesso percorso di set_frequency: BCD + frame completo
+        for f in frequencies:
+            encode_frame(COMMAND_SET_FREQUENCY, encode_frequency(f))
+
+    def encode_set_step():
+        for f in frequencies:
+            encode_frame(COMMAND_SET_STEP, encode_frequency(f % 1_000_000))
+
+    total = frames_per_chunk * chunks
+    return {
+        "codec.parse_decode_frames_per_s": metric(_rate(parse_decode, total), "frame/s", True),
+        "codec.parse_frames_per_s": metric(_rate(parse_only, total), "frame/s", True),
+        "codec.decode_bcd_per_s": metric(_rate(decode_only, 64000), "op/s", True),
+        "codec.encode_set_frequency_per_s": metric(_rate(encode_set_frequency, len(frequencies)), "op/s", True),
+        "codec.encode_set_step_per_s": metric(_rate(encode_set_step, len(frequencies)), "op/s", True),
+    }
+
+
+#-------------------------------------------------------------------------------------------------------------------------
+# Round-trip contro la radio virtuale
+#-------------------------------------------------------------------------------------------------------------------------
+#
+def bench_roundtrip(samples=300):
+    if not hasattr(os, "openpty"):
+        raise RuntimeError("pseudo-terminali non disponibili")
+
+    from civ_simulator import PtySimulator, RadioSimulator
+    from radio_core import RadioCore, STATE_COMMANDS
+
+    sim = PtySimulator(RadioSimulator(seed=1), latency=0.0).start()
+    radio = RadioCore(sim.port, min_interval=0)
+    try:
+        if not radio.connect():
+            raise RuntimeError(f"impossibile aprire {sim.port}")
+        radio.read("frequency")             # Riscaldamento
+
+        results = {}
+        for name in ("frequency", "rssi", "status"):
+            latencies = []
+            for _ in range(samples):
+                t0 = time.perf_counter()
+                radio.read(name)
+                latencies.append(time.perf_counter() - t0)
+            latencies.sort()
+            results[f"roundtrip.get_{name}_p50_ms"] = metric(latencies[len(latencies) // 2] * 1000, "ms", False, IO_TOLERANCE)
+            results[f"roundtrip.get_{name}_p95_ms"] = metric(latencies[int(len(latencies) * 0.95)] * 1000, "ms", False, IO_TOLERANCE)
+
+        # Richieste in pipeline: tutte le GET in volo insieme, come fa lo schedulatore
+        command = STATE_COMMANDS["rssi"]
+
+        def pipelined():
+            seen = radio.reply_count(command)
+            radio.transmitter.send_now([(command, ())] * samples)
+            radio.wait_replies(command, seen + samples, 5.0)
+
+        results["roundtrip.pipelined_get_per_s"] = metric(_rate(pipelined, samples, repeat=5), "op/s", True, IO_TOLERANCE)
+        return results
+    finally:
+        radio.shutdown()
+        sim.stop()
+
+
+#-------------------------------------------------------------------------------------------------------------------------
+# Interfaccia grafica (Tk nascosto)
+#-------------------------------------------------------------------------------------------------------------------------
+#
+def _load_panel():
+    """
+    Carica il pannello come modulo (senza eseguire il blocco __main__).
+    """
+    import importlib.machinery
+    import importlib.util
+
+    loader = importlib.machinery.SourceFileLoader("ifradio_panel", PANEL_FILE)
+    spec = importlib.util.spec_from_loader("ifradio_panel", loader)
+    module = importlib.util.module_from_spec(spec)
+    loader.exec_module(module)
+    return module
+
+
+# -----------------------------------------------------------------------------
+def bench_ui(updates=2000):
+    import tkinter as tk
+
+    t0 = time.perf_counter()
+    panel = _load_panel()
+    import_time = time.perf_counter() - t0
+
+    root = tk.Tk()                      # Solleva TclError se non c'è un display
+    root.withdraw()
+    try:
+        panel.root = root
+        t0 = time.perf_counter()
+        panel.radio_panel = panel.Toplevel1(root)
+        root.update_idletasks()
+        startup = time.perf_counter() - t0
+
+        smeter = panel.radio_panel.smeter
+        smeter.ballistics = False           # Misura il costo del disegno, non dell'animazione
+        smeter.calibration.build_all()
+
+        def smeter_updates():
+            for i in range(updates):
+                smeter.update_smeter((i * 7) % 400)
+            root.update_idletasks()
+
+        def frequency_updates():
+            for i in range(updates):
+                panel.radio_panel.update_frequency_display(145_000_000 + 12_500 * (i % 64))
+            root.update_idletasks()
+
+        ui = panel.UiDispatcher(fps=30)
+
+        def dispatch_updates():
+            # Percorso reale: post dal thread di elaborazione, flush una volta per frame
+            for i in range(updates):
+                ui.post("smeter", smeter.update_smeter, (i * 7) % 400, force=True)
+                ui.post("frequency", panel.radio_panel.update_frequency_display, 145_000_000 + 12_500 * (i % 64))
+                if i % 10 == 9:
+                    ui.flush()
+            root.update_idletasks()
+
+        return {
+            "ui.panel_import_ms": metric(import_time * 1000, "ms", False),
+            "ui.toplevel_startup_ms": metric(startup * 1000, "ms", False),
+            "ui.update_smeter_us": metric(1e6 / _rate(smeter_updates, updates), "us", False),
+            "ui.update_frequency_display_us": metric(1e6 / _rate(frequency_updates, updates), "us", False),
+            "ui.dispatch_post_flush_us": metric(1e6 / _rate(dispatch_updates, updates), "us", False),
+        }
+    finally:
+        root.destroy()
+
+
+BENCHMARKS = {
+    "codec": bench_codec,
+    "roundtrip": bench_roundtrip,
+    "ui": bench_ui,
+}
+
+
+#-------------------------------------------------------------------------------------------------------------------------
+# Confronto con il riferimento
+#-------------------------------------------------------------------------------------------------------------------------
+#
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Restituisce la lista delle regressioni: (nome, valore di riferimento, valore attuale, variazione).
+    """
+    regressions = []
+    for name, current in results.items():
+        reference = baseline.get(name)
+        if reference is None or not reference["value"]:
+            continue
+        change = (current["value"] - reference["value"]) / reference["value"]
+        worse = -change if current["higher_is_better"] else change
+        if worse > current.get("tolerance", tolerance):
+            regressions.append((name, reference["value"], current["value"], change))
+    return regressions
+
+
+# -----------------------------------------------------------------------------
+def _main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark del controllo radio")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="gruppi da eseguire")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="file JSON di riferimento")
+    parser.add_argument("--save-baseline", action="store_true", help="salva i risultati come riferimento")
+    parser.add_argument("--output", help="scrive i risultati JSON anche in questo file")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="peggioramento relativo ammesso")
+    parser.add_argument("--allow-incomplete", action="store_true",
+                        help="uscita 0 anche con gruppi non eseguiti o misure senza riferimento")
+    args = parser.parse_args(argv[1:])
+
+    results = {}
+    skipped = {}
+    for group in args.only or BENCHMARKS:
+        try:
+            results.update(BENCHMARKS[group]())
+        except Exception as e:
+            # Gruppo non eseguibile in questo ambiente (es. nessun display o nessun pty)
+            skipped[group] = f"{type(e).__name__}: {e}"
+
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+        "skipped": skipped,
+    }
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f).get("results", {})
+    regressions = compare(results, baseline, args.tolerance)
+    report["regressions"] = [
+        {"name": name, "baseline": ref, "current": cur, "change": round(change, 3)}
+        for name, ref, cur, change in regressions
+    ]
+    unbaselined = [] if args.save_baseline else sorted(name for name in results if name not in baseline)
+    report["unbaselined"] = unbaselined
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+    if args.save_baseline:
+        if os.path.exists(args.baseline):
+            # Conserva i gruppi non eseguiti in questo ambiente
+            with open(args.baseline, "r", encoding="utf-8") as f:
+                previous = json.load(f)
+            merged = dict(previous.get("results", {}))
+            merged.update(results)
+            report["results"] = merged
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"environment": report["environment"], "results": report["results"]}, f, indent=2)
+            f.write("\n")
+        print(f"Riferimento salvato in {args.baseline}", file=sys.stderr)
+
+    for group, reason in skipped.items():
+        print(f"Gruppo non eseguito: {group} ({reason})", file=sys.stderr)
+    if unbaselined:
+        print(f"Senza riferimento (nessun controllo di regressione): {', '.join(unbaselined)}", file=sys.stderr)
+    for name, ref, cur, change in regressions:
+        print(f"REGRESSIONE {name}: {ref} -> {cur} ({change:+.0%})", file=sys.stderr)
+
+    if regressions:
+        return EXIT_REGRESSION
+    if (skipped or unbaselined) and not args.allow_incomplete:
+        return EXIT_INCOMPLETE
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main(sys.argv))
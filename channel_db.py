@@ -0,0 +1,294 @@
+# *
+# * Project Name: Radio User Interface
+# * File: channel_db.py
+# *
+# * Copyright (C) 2024 Fabrizio Palumbo (IU0IJV)
+# *
+# * This program is distributed under the terms of the MIT license.
+# * You can obtain a copy of the license at:
+# * https://opensource.org/licenses/MIT
+# *
+# * DESCRIPTION:
+# * Archivio persistente dei canali di memoria (SQLite).
+# *
+# * NOTES:
+# * - Ogni canale ha frequenza, modo, step, larghezza di banda, nome ed etichette (tag).
+# * - Indici su frequenza e su tag: ricerche per intervallo e del canale più vicino in
+# *   tempo logaritmico anche con decine di migliaia di canali.
+# * - L'importazione CSV avviene in un'unica transazione. Colonne riconosciute:
+# *     frequency, mode, step, bandwidth, name, tags     (tag separati da ';')
+# *   solo frequency è obbligatoria; la frequenza può essere in Hz o in MHz con il punto.
+# * - Uso da riga di comando:
+# *     python channel_db.py import <file.csv> [--db channels.db] [--replace]
+# *     python channel_db.py list [--tag TAG] [--from HZ] [--to HZ]
+# *     python channel_db.py find <frequenza Hz>
+
+import collections
+import csv
+import os
+import sqlite3
+import sys
+import threading
+
+
+DEFAULT_PATH = "channels.db"
+MODES = ("FM", "AM", "SSB", "CW")          # Indice = codice COMMAND_SET_MODE
+
+Channel = collections.namedtuple("Channel", "id frequency mode step bandwidth name tags")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS channels (
+    id        INTEGER PRIMARY KEY,
+    frequency INTEGER NOT NULL,
+    mode      TEXT,
+    step      INTEGER,
+    bandwidth INTEGER,
+    name      TEXT NOT NULL DEFAULT '',
+    tags      TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS channels_frequency ON channels (frequency);
+CREATE TABLE IF NOT EXISTS channel_tags (
+    tag        TEXT NOT NULL,
+    channel_id INTEGER NOT NULL REFERENCES channels (id) ON DELETE CASCADE,
+    PRIMARY KEY (tag, channel_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS channel_tags_channel ON channel_tags (channel_id);
+"""
+
+COLUMNS = "id, frequency, mode, step, bandwidth, name, tags"
+
+
+# -----------------------------------------------------------------------------
+def parse_frequency(text):
+    """
+    Frequenza in Hz da testo: "145500000" oppure "145.5" (MHz).
+    """
+    text = text.strip().replace(",", ".")
+    if "." in text:
+        return round(float(text) * 1_000_000)
+    return int(text)
+
+
+# -----------------------------------------------------------------------------
+def split_tags(text):
+    return sorted({tag.strip().lower() for tag in (text or "").replace(",", ";").split(";") if tag.strip()})
+
+
+#-------------------------------------------------------------------------------------------------------------------------
+# Archivio dei canali
+#-------------------------------------------------------------------------------------------------------------------------
+#
+class ChannelStore:
+    """
+    Canali di memoria su SQLite. Il file viene aperto al primo utilizzo.
+    Thread-safe: la stessa connessione è condivisa sotto un lock.
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self._db = None
+        self._lock = threading.Lock()
+
+    # -----------------------------------------------------------------------------
+    @property
+    def available(self):
+        """
+        True se l'archivio è già aperto o il file esiste: la verifica non crea il file.
+        """
+        return self._db is not None or os.path.exists(self.path)
+
+    # -----------------------------------------------------------------------------
+    @property
+    def db(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA foreign_keys = ON")
+            self._db.executescript(SCHEMA)
+        return self._db
+
+    # -----------------------------------------------------------------------------
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    # -----------------------------------------------------------------------------
+    def _query(self, sql, params=()):
+        with self._lock:
+            return [Channel(*row) for row in self.db.execute(sql, params)]
+
+    # -----------------------------------------------------------------------------
+    def count(self):
+        with self._lock:
+            return self.db.execute("SELECT COUNT(*) FROM channels").fetchone()[0]
+
+    # -----------------------------------------------------------------------------
+    def add(self, frequency, mode=None, step=None, bandwidth=None, name="", tags=()):
+        """
+        Aggiunge un canale e ne restituisce l'id.
+        """
+        return self.add_many([(frequency, mode, step, bandwidth, name, tags)])[0]
+
+    # -----------------------------------------------------------------------------
+    def add_many(self, rows, replace=False):
+        """
+        Aggiunge in un'unica transazione una sequenza di
+        (frequenza, modo, step, banda, nome, tag). Con replace=True svuota prima l'archivio.
+        """
+        ids = []
+        with self._lock:
+            db = self.db
+            with db:
+                if replace:
+                    db.execute("DELETE FROM channel_tags")
+                    db.execute("DELETE FROM channels")
+                tag_rows = []
+                for frequency, mode, step, bandwidth, name, tags in rows:
+                    tags = split_tags(tags) if isinstance(tags, str) else sorted(set(tags))
+                    cursor = db.execute(
+                        "INSERT INTO channels (frequency, mode, step, bandwidth, name, tags) VALUES (?, ?, ?, ?, ?, ?)",
+                        (frequency, mode, step, bandwidth, name or "", ";".join(tags))
+                    )
+                    ids.append(cursor.lastrowid)
+                    tag_rows.extend((tag, cursor.lastrowid) for tag in tags)
+                db.executemany("INSERT INTO channel_tags (tag, channel_id) VALUES (?, ?)", tag_rows)
+        return ids
+
+    # -----------------------------------------------------------------------------
+    def import_csv(self, file, replace=False):
+        """
+        Importa un file CSV (percorso o file aperto) con intestazione. Restituisce il numero di canali.
+        """
+        if isinstance(file, str):
+            with open(file, newline="", encoding="utf-8-sig") as f:
+                return self.import_csv(f, replace)
+
+        def rows():
+            for line, record in enumerate(csv.DictReader(file), start=2):
+                record = {key.strip().lower(): (value or "").strip() for key, value in record.items() if key}
+                try:
+                    frequency = parse_frequency(record["frequency"])
+                except (KeyError, ValueError):
+                    raise ValueError(f"Riga {line}: frequenza non valida")
+                mode = record.get("mode", "").upper() or None
+                step = int(record["step"]) if record.get("step") else None
+                bandwidth = int(record["bandwidth"]) if record.get("bandwidth") else None
+                yield frequency, mode, step, bandwidth, record.get("name", ""), record.get("tags", "")
+
+        return len(self.add_many(rows(), replace))
+
+    # -----------------------------------------------------------------------------
+    def delete(self, channel_id):
+        with self._lock:
+            with self.db:
+                self.db.execute("DELETE FROM channels WHERE id = ?", (channel_id,))
+
+    # -----------------------------------------------------------------------------
+    def get(self, channel_id):
+        found = self._query(f"SELECT {COLUMNS} FROM channels WHERE id = ?", (channel_id,))
+        return found[0] if found else None
+
+    # -----------------------------------------------------------------------------
+    def select(self, tag=None, low=None, high=None, mode=None):
+        """
+        Canali filtrati per tag, intervallo di frequenza [low, high] e modo, in ordine di frequenza.
+        """
+        where, params = [], []
+        if tag is not None:
+            where.append("id IN (SELECT channel_id FROM channel_tags WHERE tag = ?)")
+            params.append(tag.lower())
+        if low is not None:
+            where.append("frequency >= ?")
+            params.append(low)
+        if high is not None:
+            where.append("frequency <= ?")
+            params.append(high)
+        if mode is not None:
+            where.append("mode = ?")
+            params.append(mode.upper())
+        sql = f"SELECT {COLUMNS} FROM channels"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        return self._query(sql + " ORDER BY frequency, id", params)
+
+    # -----------------------------------------------------------------------------
+    def nearest(self, frequency, tolerance=None):
+        """
+        Canale con la frequenza più vicina (entro `tolerance` Hz se indicata), oppure None.
+        Due ricerche sull'indice: il primo canale sotto e il primo sopra la frequenza.
+        """
+        below = self._query(
+            f"SELECT {COLUMNS} FROM channels WHERE frequency <= ? ORDER BY frequency DESC, id LIMIT 1", (frequency,))
+        above = self._query(
+            f"SELECT {COLUMNS} FROM channels WHERE frequency > ? ORDER BY frequency, id LIMIT 1", (frequency,))
+        candidates = below + above
+        if not candidates:
+            return None
+        best = min(candidates, key=lambda channel: abs(channel.frequency - frequency))
+        if tolerance is not None and abs(best.frequency - frequency) > tolerance:
+            return None
+        return best
+
+    # -----------------------------------------------------------------------------
+    def tags(self):
+        """
+        Etichette presenti con il numero di canali: {tag: numero}.
+        """
+        with self._lock:
+            return dict(self.db.execute("SELECT tag, COUNT(*) FROM channel_tags GROUP BY tag ORDER BY tag"))
+
+
+# -----------------------------------------------------------------------------
+def _print_channels(channels):
+    for channel in channels:
+        print(f"{channel.frequency:>11}  {channel.mode or '-':<3}  {channel.step or '':>6}  "
+              f"{channel.name:<24}  {channel.tags}")
+
+
+# -----------------------------------------------------------------------------
+def _main(argv):
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Archivio dei canali di memoria")
+    parser.add_argument("--db", default=DEFAULT_PATH, help=f"file dell'archivio (default {DEFAULT_PATH})")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    importer = commands.add_parser("import", help="importa un file CSV")
+    importer.add_argument("file")
+    importer.add_argument("--replace", action="store_true", help="svuota l'archivio prima dell'importazione")
+
+    lister = commands.add_parser("list", help="elenca i canali")
+    lister.add_argument("--tag")
+    lister.add_argument("--from", dest="low", type=parse_frequency)
+    lister.add_argument("--to", dest="high", type=parse_frequency)
+
+    finder = commands.add_parser("find", help="canale più vicino a una frequenza")
+    finder.add_argument("frequency", type=parse_frequency)
+
+    args = parser.parse_args(argv[1:])
+    store = ChannelStore(args.db)
+    try:
+        if args.command == "import":
+            t0 = time.perf_counter()
+            count = store.import_csv(args.file, replace=args.replace)
+            print(f"{count} canali importati in {time.perf_counter() - t0:.3f} s ({store.count()} in archivio)")
+        elif args.command == "list":
+            _print_channels(store.select(tag=args.tag, low=args.low, high=args.high))
+        else:
+            channel = store.nearest(args.frequency)
+            if channel is None:
+                print("Nessun canale in archivio")
+                return 1
+            _print_channels([channel])
+    except ValueError as e:
+        print(e)
+        return 2
+    finally:
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main(sys.argv))
@@ -0,0 +1,257 @@
+# *
+# * Project Name: Radio User Interface
+# * File: civ_capture.py
+# *
+# * Copyright (C) 2024 Fabrizio Palumbo (IU0IJV)
+# *
+# * This program is distributed under the terms of the MIT license.
+# * You can obtain a copy of the license at:
+# * https://opensource.org/licenses/MIT
+# *
+# * DESCRIPTION:
+# * Cattura del flusso seriale CI-V grezzo e riproduzione senza porta seriale.
+# *
+# * NOTES:
+# * - Il file di cattura contiene un'intestazione e una sequenza di record:
+# *     double  istante relativo all'inizio della cattura (s)
+# *     uint8   direzione (0 = ricevuto dalla radio, 1 = inviato alla radio)
+# *     uint16  lunghezza
+# *     ...     byte esattamente come letti/scritti sulla porta
+# * - La riproduzione passa i blocchi ricevuti al FrameParser e i frame a un gestore
+# *   (nel pannello process_civ_message), in tempo reale, N volte più veloce o alla
+# *   massima velocità, misurando i tempi di ogni fase.
+# * - Uso da riga di comando:
+# *     python civ_capture.py dump <file>
+# *     python civ_capture.py replay <file> [velocità]     (velocità 0 = massima)
+
+import struct
+import sys
+import threading
+import time
+
+from civ_codec import FrameParser
+
+
+DIRECTION_RX = 0
+DIRECTION_TX = 1
+DIRECTION_NAMES = ("RX", "TX")
+
+MAGIC = b"IFRCAP01"
+HEADER = struct.Struct("<8sd")          # magic, istante di inizio (time.time())
+RECORD = struct.Struct("<dBH")          # istante relativo, direzione, lunghezza
+
+
+#-------------------------------------------------------------------------------------------------------------------------
+# Scrittura
+#-------------------------------------------------------------------------------------------------------------------------
+#
+class CaptureWriter:
+    """
+    Registra i blocchi letti e scritti sulla porta seriale. Thread-safe: lettura e
+    scrittura avvengono in thread diversi.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.records = 0
+        self.bytes = 0
+        self._file = open(path, "wb")
+        self._file.write(HEADER.pack(MAGIC, time.time()))
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+
+    # -----------------------------------------------------------------------------
+    def write(self, direction, data, t=None):
+        """
+        Aggiunge un blocco; t è l'istante time.perf_counter() in cui è stato letto o scritto.
+        """
+        if t is None:
+            t = time.perf_counter()
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(RECORD.pack(t - self._t0, direction, len(data)))
+            self._file.write(data)
+            self.records += 1
+            self.bytes += len(data)
+
+    # -----------------------------------------------------------------------------
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# -----------------------------------------------------------------------------
+def read_capture(path):
+    """
+    Legge un file di cattura e restituisce (istante di inizio, [(t, direzione, dati), ...]).
+    """
+    with open(path, "rb") as f:
+        content = f.read()
+
+    magic, started = HEADER.unpack_from(content, 0)
+    if magic != MAGIC:
+        raise ValueError(f"{path}: non è un file di cattura CI-V")
+
+    records = []
+    offset = HEADER.size
+    end = len(content)
+    while offset + RECORD.size <= end:
+        t, direction, length = RECORD.unpack_from(content, offset)
+        offset += RECORD.size
+        if offset + length > end:
+            break                       # Record troncato (cattura interrotta)
+        records.append((t, direction, content[offset:offset + length]))
+        offset += length
+    return started, records
+
+
+#-------------------------------------------------------------------------------------------------------------------------
+# Riproduzione
+#-------------------------------------------------------------------------------------------------------------------------
+#
+class CaptureReplayer:
+    """
+    Riproduce i byte ricevuti di una cattura attraverso il parser e un gestore dei frame.
+
+    handler: funzione handler(frame) chiamata per ogni frame completo.
+    speed:   1.0 = tempo reale, N = N volte più veloce, 0 o None = massima velocità.
+    """
+
+    def __init__(self, path, handler, speed=1.0, parser=None):
+        self.path = path
+        self.handler = handler
+        self.speed = speed
+        self.parser = parser if parser is not None else FrameParser()
+
+        self.chunks = 0
+        self.bytes = 0
+        self.frames = 0
+        self.tx_records = 0
+        self.parse_time = 0.0           # Tempo trascorso nel parser (s)
+        self.handler_time = 0.0         # Tempo trascorso nel gestore dei frame (s)
+        self.wall_time = 0.0
+        self.capture_time = 0.0         # Durata originale della cattura
+
+        self._stop = threading.Event()
+
+    # -----------------------------------------------------------------------------
+    def stop(self):
+        self._stop.set()
+
+    # -----------------------------------------------------------------------------
+    def run(self):
+        _, records = read_capture(self.path)
+        if records:
+            self.capture_time = records[-1][0] - records[0][0]
+
+        clock = time.perf_counter
+        parser = self.parser
+        handler = self.handler
+        paced = bool(self.speed)
+        t_first = records[0][0] if records else 0.0
+        start = clock()
+
+        for t, direction, data in records:
+            if self._stop.is_set():
+                break
+            if direction != DIRECTION_RX:
+                self.tx_records += 1
+                continue
+
+            if paced:
+                delay = (t - t_first) / self.speed - (clock() - start)
+                if delay > 0:
+                    self._stop.wait(delay)
+
+            t0 = clock()
+            frames = parser.feed(data)
+            t1 = clock()
+            for frame in frames:
+                handler(frame)
+            t2 = clock()
+
+            self.parse_time += t1 - t0
+            self.handler_time += t2 - t1
+            self.chunks += 1
+            self.bytes += len(data)
+            self.frames += len(frames)
+
+        self.wall_time = clock() - start
+        return self.stats()
+
+    # -----------------------------------------------------------------------------
+    def stats(self):
+        wall = self.wall_time or 1e-9
+        return {
+            "chunks": self.chunks,
+            "bytes": self.bytes,
+            "frames": self.frames,
+            "tx_records": self.tx_records,
+            "capture_s": round(self.capture_time, 3),
+            "wall_s": round(self.wall_time, 3),
+            "bytes_per_s": round(self.bytes / wall),
+            "frames_per_s": round(self.frames / wall),
+            "parse_us_per_frame": round(self.parse_time / self.frames * 1e6, 2) if self.frames else 0.0,
+            "handler_us_per_frame": round(self.handler_time / self.frames * 1e6, 2) if self.frames else 0.0,
+            "discarded_bytes": self.parser.discarded_bytes,
+            "malformed": self.parser.malformed,
+        }
+
+    # -----------------------------------------------------------------------------
+    def summary(self):
+        s = self.stats()
+        return (f"{s['frames']} frame, {s['bytes']} byte in {s['wall_s']:.3f} s "
+                f"(cattura {s['capture_s']:.3f} s)  {s['frames_per_s']} frame/s  {s['bytes_per_s']} byte/s  "
+                f"parser {s['parse_us_per_frame']} us/frame  gestore {s['handler_us_per_frame']} us/frame  "
+                f"scartati {s['discarded_bytes']} byte, {s['malformed']} frame malformati")
+
+
+# -----------------------------------------------------------------------------
+def _main(argv):
+    if len(argv) < 3 or argv[1] not in ("dump", "replay"):
+        print("Uso: python civ_capture.py dump <file>")
+        print("     python civ_capture.py replay <file> [velocità, 0 = massima]")
+        return 1
+
+    if argv[1] == "dump":
+        started, records = read_capture(argv[2])
+        print(f"# Cattura del {time.ctime(started)}: {len(records)} record")
+        for t, direction, data in records:
+            print(f"{t:12.6f}  {DIRECTION_NAMES[direction]}  {data.hex(' ').upper()}")
+        return 0
+
+    from civ_codec import REPLY_DECODERS
+
+    counts = {}
+
+    def decode(frame):
+        # Decodifica come il pannello, senza interfaccia: conta le risposte per comando
+        command = frame[4]
+        decoder = REPLY_DECODERS.get(command)
+        if decoder is not None:
+            try:
+                decoder(frame[5:-1])
+            except IndexError:
+                pass
+        counts[command] = counts.get(command, 0) + 1
+
+    speed = float(argv[3]) if len(argv) > 3 else 0.0
+    replayer = CaptureReplayer(argv[2], decode, speed=speed)
+    replayer.run()
+    print(replayer.summary())
+    for command, count in sorted(counts.items()):
+        print(f"  comando 0x{command:02X}: {count}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main(sys.argv))
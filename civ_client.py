@@ -0,0 +1,265 @@
+# *
+# * Project Name: Radio User Interface
+# * File: civ_client.py
+# *
+# * Copyright (C) 2024 Fabrizio Palumbo (IU0IJV)
+# *
+# * This program is distributed under the terms of the MIT license.
+# * You can obtain a copy of the license at:
+# * https://opensource.org/licenses/MIT
+# *
+# * DESCRIPTION:
+# * Client CI-V basato su asyncio con correlazione richiesta/risposta.
+# *
+# * NOTES:
+# * - Le risposte vengono associate alle richieste in attesa tramite l'opcode.
+# * - Ogni richiesta ha un timeout e un numero limitato di ritrasmissioni.
+# * - Più richieste con opcode diversi possono essere in volo contemporaneamente
+# *   (fino a max_in_flight), ad esempio:
+# *       freq, sql, gain = await asyncio.gather(radio.get_frequency(), radio.get_squelch(), radio.get_rfgain())
+
+import asyncio
+import sys
+import time
+import serial
+
+from civ_codec import (
+    COMMAND_SET_FREQUENCY, COMMAND_GET_FREQUENCY, COMMAND_SET_MODE,
+    COMMAND_SET_SQUELCH, COMMAND_GET_SQUELCH, COMMAND_GET_RSSI,
+    COMMAND_SET_RFGAIN, COMMAND_GET_RFGAIN, COMMAND_SET_BANDWIDTH, COMMAND_GET_BANDWIDTH,
+    COMMAND_SET_TX_POWER, COMMAND_GET_TX_POWER, COMMAND_GET_STATUS,
+    COMMAND_SET_STEP, COMMAND_GET_STEP,
+    encode_frequency, REPLY_DECODERS,
+)
+from civ_receiver import SerialReceiver
+from civ_transmitter import CommandTransmitter
+
+
+#-------------------------------------------------------------------------------------------------------------------------
+# Client asyncio
+#-------------------------------------------------------------------------------------------------------------------------
+#
+class CivClient:
+    """
+    Client asincrono per la radio.
+
+    send:          funzione send(command, data) che accoda il frame verso la radio
+                   (ad esempio CommandTransmitter.submit). Deve essere non bloccante.
+    max_in_flight: numero massimo di richieste contemporaneamente in attesa di risposta.
+    timeout:       attesa massima (s) per ogni tentativo.
+    retries:       ritrasmissioni dopo il primo tentativo.
+
+    I frame ricevuti vanno passati a frame_received() nel thread del loop
+    (oppure a frame_received_threadsafe() da un altro thread).
+    """
+
+    def __init__(self, send, max_in_flight=4, timeout=0.5, retries=2):
+        self.send = send
+        self.timeout = timeout
+        self.retries = retries
+        self.listeners = []             # callback(command, data) chiamate per ogni frame ricevuto
+
+        self.requests = 0
+        self.replies = 0
+        self.retransmissions = 0
+        self.timeouts = 0
+        self.unsolicited = 0            # Risposte senza una richiesta in attesa
+
+        self._pending = {}              # opcode -> future della richiesta in volo
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._loop = None
+        self._closers = []
+
+    # -----------------------------------------------------------------------------
+    @classmethod
+    async def open_serial(cls, port, baudrate=115200, **kwargs):
+        """
+        Apre la porta seriale e restituisce un client collegato a ricevitore e trasmettitore.
+        """
+        loop = asyncio.get_running_loop()
+        ser = serial.Serial(
+            port=port,
+            baudrate=baudrate,
+            bytesize=serial.EIGHTBITS,
+            parity=serial.PARITY_NONE,
+            stopbits=serial.STOPBITS_ONE,
+            timeout=0.1
+        )
+        transmitter = CommandTransmitter(lambda: ser, min_interval=0)
+        client = cls(transmitter.submit, **kwargs)
+        client._loop = loop
+        receiver = SerialReceiver(lambda: ser, on_frame=client.frame_received_threadsafe)
+
+        receiver.start()
+        transmitter.start()
+        # La porta si chiude solo a thread di lettura terminato (entro il timeout della porta)
+        client._closers = [receiver.stop, lambda: receiver.join(ser.timeout + 0.5), transmitter.stop, ser.close]
+        return client
+
+    # -----------------------------------------------------------------------------
+    def close(self):
+        for closer in self._closers:
+            closer()
+        self._closers = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    # -----------------------------------------------------------------------------
+    def frame_received_threadsafe(self, frame, t_rx=None):
+        self._loop.call_soon_threadsafe(self.frame_received, frame)
+
+    # -----------------------------------------------------------------------------
+    def frame_received(self, frame):
+        """
+        Associa il frame alla richiesta in attesa con lo stesso opcode.
+        """
+        command = frame[4]
+        data = frame[5:-1]
+
+        future = self._pending.get(command)
+        if future is not None and not future.done():
+            decoder = REPLY_DECODERS.get(command)
+            try:
+                value = decoder(data) if decoder else bytes(data)
+            except IndexError:
+                # Payload troncato: si attende la ritrasmissione
+                print(f"Risposta CI-V incompleta per il comando 0x{command:02X}")
+            else:
+                self.replies += 1
+                future.set_result(value)
+        else:
+            self.unsolicited += 1
+
+        for listener in self.listeners:
+            listener(command, data)
+
+    # -----------------------------------------------------------------------------
+    async def request(self, command, data=(), timeout=None, retries=None):
+        """
+        Invia un comando GET e attende la risposta decodificata.
+        Solleva TimeoutError se la radio non risponde entro i tentativi previsti.
+        """
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+
+        # Una richiesta con lo stesso opcode è già in volo: ne condivide la risposta
+        future = self._pending.get(command)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        timeout = self.timeout if timeout is None else timeout
+        retries = self.retries if retries is None else retries
+
+        future = self._loop.create_future()
+        self._pending[command] = future
+        self.requests += 1
+        try:
+            async with self._slots:
+                for attempt in range(retries + 1):
+                    if future.done():
+                        break
+                    if attempt:
+                        self.retransmissions += 1
+                    self.send(command, data)
+                    try:
+                        await asyncio.wait_for(asyncio.shield(future), timeout)
+                        break
+                    except asyncio.TimeoutError:
+                        continue
+                else:
+                    self.timeouts += 1
+                    error = TimeoutError(f"Nessuna risposta al comando 0x{command:02X} dopo {retries + 1} tentativi")
+                    future.set_exception(error)
+                    future.exception()  # Segna l'eccezione come letta anche senza altri in attesa
+                    raise error
+            return future.result()
+        finally:
+            del self._pending[command]
+            if not future.done():
+                future.cancel()
+
+    # -----------------------------------------------------------------------------
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "replies": self.replies,
+            "retransmissions": self.retransmissions,
+            "timeouts": self.timeouts,
+            "unsolicited": self.unsolicited,
+            "in_flight": len(self._pending),
+        }
+
+    #---------------------------------------------------------------------------------------------------------------------
+    # Letture
+    #---------------------------------------------------------------------------------------------------------------------
+    async def get_frequency(self):
+        return await self.request(COMMAND_GET_FREQUENCY)
+
+    async def get_squelch(self):
+        return await self.request(COMMAND_GET_SQUELCH)
+
+    async def get_rfgain(self):
+        return await self.request(COMMAND_GET_RFGAIN)
+
+    async def get_rssi(self):
+        return await self.request(COMMAND_GET_RSSI)
+
+    async def get_status(self):
+        return await self.request(COMMAND_GET_STATUS)
+
+    async def get_bandwidth(self):
+        return await self.request(COMMAND_GET_BANDWIDTH)
+
+    async def get_txpower(self):
+        return await self.request(COMMAND_GET_TX_POWER)
+
+    async def get_step(self):
+        return await self.request(COMMAND_GET_STEP)
+
+    #---------------------------------------------------------------------------------------------------------------------
+    # Impostazioni (la radio non conferma i comandi SET)
+    #---------------------------------------------------------------------------------------------------------------------
+    def set_frequency(self, frequency):
+        self.send(COMMAND_SET_FREQUENCY, encode_frequency(frequency))
+
+    def set_step(self, step):
+        self.send(COMMAND_SET_STEP, encode_frequency(step))
+
+    def set_mode(self, mode):
+        self.send(COMMAND_SET_MODE, [mode])
+
+    def set_squelch(self, squelch_level):
+        self.send(COMMAND_SET_SQUELCH, [squelch_level])
+
+    def set_rfgain(self, val):
+        self.send(COMMAND_SET_RFGAIN, [val])
+
+    def set_bw(self, val):
+        self.send(COMMAND_SET_BANDWIDTH, [val])
+
+    def set_txpower(self, val):
+        self.send(COMMAND_SET_TX_POWER, [val])
+
+
+# -----------------------------------------------------------------------------
+async def _main(port):
+    async with await CivClient.open_serial(port) as radio:
+        t0 = time.perf_counter()
+        frequency, squelch, rfgain, rssi, status = await asyncio.gather(
+            radio.get_frequency(), radio.get_squelch(), radio.get_rfgain(),
+            radio.get_rssi(), radio.get_status()
+        )
+        elapsed = (time.perf_counter() - t0) * 1000
+        print(f"Frequenza: {frequency} Hz  Squelch: {squelch}  RF gain: {rfgain}  "
+              f"RSSI: {rssi}  Stato: 0x{status:04X}  ({elapsed:.1f} ms)")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Uso: python civ_client.py <porta>")
+        sys.exit(1)
+    asyncio.run(_main(sys.argv[1]))
@@ -0,0 +1,331 @@
+# *
+# * Project Name: Radio User Interface
+# * File: civ_codec.py
+# *
+# * Copyright (C) 2024 Fabrizio Palumbo (IU0IJV)
+# *
+# * This program is distributed under the terms of the MIT license.
+# * You can obtain a copy of the license at:
+# * https://opensource.org/licenses/MIT
+# *
+# * DESCRIPTION:
+# * Codifica/decodifica del protocollo CI-V usato dal modulo BK4819.
+# *
+# * NOTES:
+# * - Le conversioni BCD usano tabelle precalcolate (nessuna stringa, nessun int() per cifra).
+# * - FrameParser lavora su un bytearray con offset di lettura: nessuno slicing di liste,
+# *   verifica del preambolo FE FE e degli indirizzi, risincronizzazione dopo dati spuri.
+# * - Eseguendo il modulo si ottiene un micro-benchmark (frame/secondo prima e dopo).
+
+# Definizione degli indirizzi del protocollo CI-V
+CIV_START_BYTE = 0xFE
+CIV_END_BYTE = 0xFD
+CIV_JAM_BYTE = 0xFC             # Segnale di collisione sul bus CI-V
+CIV_ADDRESS_RADIO = 0xE0        # Indirizzo radio di destinazione
+CIV_ADDRESS_COMPUTER = 0x00     # Indirizzo del computer
+
+COMMAND_SET_FREQUENCY = 0x05    # Comando per impostare la frequenza
+COMMAND_GET_FREQUENCY = 0x03    # Comando per leggere la frequenza
+COMMAND_SET_MODE = 0x06         # Comando per impostare la modalità operativa
+COMMAND_SET_SQUELCH = 0x14      # Comando per impostare lo squelch
+COMMAND_GET_SQUELCH = 0x15      # Comando per leggere il livello dello squelch
+COMMAND_SET_AGC = 0x16          # Comando per impostare il tipo di AGC
+
+COMMAND_GET_RSSI = 0x19         # Comando per ottenere il valore dello S-meter
+COMMAND_SET_MONITOR = 0x1A      # comando per attivare o disattivare la funzioen monitor
+COMMAND_SET_RFGAIN = 0x1C       # comando per settare il valore di RFGain
+COMMAND_GET_RFGAIN = 0x1D       # comando per settare il valore di RFGain
+COMMAND_SET_BANDWIDTH = 0x1E
+COMMAND_GET_BANDWIDTH = 0x1F
+COMMAND_SET_TX_POWER  = 0x20
+COMMAND_GET_TX_POWER  = 0x21
+COMMAND_GET_STATUS = 0x22       # Comando per ottenere lo stato della radio
+
+COMMAND_SET_STEP = 0x23
+COMMAND_GET_STEP = 0x24
+
+COMMAND_SET_SCAN = 0
+
+CIV_HEADER_LEN = 3              # indirizzo destinazione + indirizzo sorgente + comando
+CIV_MAX_FRAME = 64              # Oltre questa lunghezza senza terminatore si risincronizza
+
+_PREAMBLE = bytes((CIV_START_BYTE, CIV_START_BYTE))
+_COMMAND_HEADER = bytes((CIV_START_BYTE, CIV_START_BYTE, CIV_ADDRESS_RADIO, CIV_ADDRESS_COMPUTER))
+_END = bytes((CIV_END_BYTE,))
+
+
+#-------------------------------------------------------------------------------------------------------------------------
+# Tabelle BCD precalcolate
+#-------------------------------------------------------------------------------------------------------------------------
+#
+# Trasmissione: coppia di cifre 0-99 -> byte, ordine dei nibble usato da set_frequency/set_step
+# (cifra delle unità nel nibble alto, cifra delle decine nel nibble basso)
+BCD_ENCODE_SWAPPED = tuple(((v % 10) << 4) | (v // 10) for v in range(100))
+
+# Ricezione: byte -> coppia di cifre, nibble alto = decine, nibble basso = unità
+BCD_DECODE = tuple(((b >> 4) & 0x0F) * 10 + (b & 0x0F) for b in range(256))
+
+
+# -----------------------------------------------------------------------------
+def encode_frequency(frequency):
+    """
+    Converte una frequenza (o uno step) in Hz nei 6 byte BCD attesi dalla radio.
+    Byte 1: 10 Hz e 1 Hz ... Byte 5: 1 GHz e 100 MHz, Byte 6 riservato (0x00).
+    """
+    table = BCD_ENCODE_SWAPPED
+    return [
+        table[frequency % 100],
+        table[(frequency // 100) % 100],
+        table[(frequency // 10_000) % 100],
+        table[(frequency // 1_000_000) % 100],
+        table[(frequency // 100_000_000) % 100],
+        0x00,
+    ]
+
+
+# -----------------------------------------------------------------------------
+def decode_bcd(data):
+    """
+    Decodifica un valore BCD ricevuto dalla radio (primo byte = cifre più significative).
+    """
+    table = BCD_DECODE
+    value = 0
+    for b in data:
+        value = value * 100 + table[b]
+    return value
+
+
+# -----------------------------------------------------------------------------
+def _u8(data):
+    return data[0]
+
+def _u16(data):
+    return data[0] + data[1] * 256
+
+
+# Decodifica del payload delle risposte, per opcode
+REPLY_DECODERS = {
+    COMMAND_GET_FREQUENCY: decode_bcd,
+    COMMAND_GET_SQUELCH: _u8,
+    COMMAND_GET_RFGAIN: _u8,
+    COMMAND_GET_RSSI: _u16,
+    COMMAND_GET_STATUS: _u16,
+    COMMAND_GET_BANDWIDTH: _u8,
+    COMMAND_GET_TX_POWER: _u8,
+    COMMAND_GET_STEP: decode_bcd,
+}
+
+
+# -----------------------------------------------------------------------------
+def encode_frame(command, data=()):
+    """
+    Costruisce il messaggio CI-V completo da inviare alla radio.
+    data è una sequenza di byte: un intero solleva TypeError (bytes(1) sarebbe b'\x00').
+    """
+    if isinstance(data, int):
+        raise TypeError(f"Dati del comando 0x{command:02X}: attesa una sequenza di byte, non {data!r}")
+    return _COMMAND_HEADER + bytes((command,)) + bytes(data) + _END
+
+
+#-------------------------------------------------------------------------------------------------------------------------
+# Parser incrementale dei frame
+#-------------------------------------------------------------------------------------------------------------------------
+#
+class FrameParser:
+    """
+    Parser in streaming dei messaggi CI-V.
+
+    I dati ricevuti vengono accodati in un unico bytearray e letti tramite un offset:
+    i byte consumati vengono eliminati solo quando conviene (compattazione differita).
+    Ogni frame restituito è normalizzato nella forma FE FE <dest> <sorg> <cmd> <dati...> FD.
+
+    local_address:  indirizzo a cui devono essere destinati i frame (None = nessun controllo)
+    remote_address: indirizzo da cui devono provenire i frame (None = nessun controllo)
+    """
+
+    COMPACT_THRESHOLD = 4096
+
+    def __init__(self, local_address=CIV_ADDRESS_COMPUTER, remote_address=CIV_ADDRESS_RADIO):
+        self.local_address = local_address
+        self.remote_address = remote_address
+        self._buf = bytearray()
+        self._pos = 0
+
+        self.frames = 0                 # Frame validi restituiti
+        self.discarded_bytes = 0        # Byte scartati durante la risincronizzazione
+        self.malformed = 0              # Frame troppo corti o troppo lunghi
+        self.rejected = 0               # Frame con indirizzi non validi (es. eco dei comandi)
+
+    # -----------------------------------------------------------------------------
+    def reset(self):
+        self._buf.clear()
+        self._pos = 0
+
+    # -----------------------------------------------------------------------------
+    def pending(self):
+        """Numero di byte in attesa di completare un frame."""
+        return len(self._buf) - self._pos
+
+    # -----------------------------------------------------------------------------
+    def feed(self, data):
+        """
+        Aggiunge i byte ricevuti e restituisce la lista dei frame completi e validi.
+        """
+        buf = self._buf
+        buf += data
+        pos = self._pos
+        end_of_data = len(buf)
+        frames = []
+
+        while pos < end_of_data:
+            # Ricerca del preambolo FE FE
+            start = buf.find(_PREAMBLE, pos)
+            if start < 0:
+                # Conserva un eventuale FE finale che potrebbe essere l'inizio di un preambolo
+                keep = 1 if buf[end_of_data - 1] == CIV_START_BYTE else 0
+                self.discarded_bytes += end_of_data - keep - pos
+                pos = end_of_data - keep
+                break
+            if start > pos:
+                self.discarded_bytes += start - pos
+
+            # Salta i byte di preambolo ripetuti
+            header = start + 2
+            while header < end_of_data and buf[header] == CIV_START_BYTE:
+                header += 1
+
+            end = buf.find(CIV_END_BYTE, header)
+            if end < 0:
+                if end_of_data - start > CIV_MAX_FRAME:
+                    # Terminatore mai arrivato: scarta il preambolo e risincronizza
+                    self.malformed += 1
+                    self.discarded_bytes += header - start
+                    pos = header
+                    continue
+                pos = start
+                break
+
+            # Un nuovo preambolo prima del terminatore indica un frame troncato
+            restart = buf.find(_PREAMBLE, header, end)
+            if restart >= 0:
+                self.malformed += 1
+                self.discarded_bytes += restart - start
+                pos = restart
+                continue
+
+            pos = end + 1
+            if end - header < CIV_HEADER_LEN or buf[header] == CIV_JAM_BYTE:
+                self.malformed += 1
+                self.discarded_bytes += end + 1 - start
+                continue
+
+            if ((self.local_address is not None and buf[header] != self.local_address) or
+                    (self.remote_address is not None and buf[header + 1] != self.remote_address)):
+                self.rejected += 1
+                continue
+
+            frames.append(_PREAMBLE + buf[header:end + 1])
+
+        # Compattazione differita del buffer
+        if pos >= end_of_data:
+            buf.clear()
+            pos = 0
+        elif pos > self.COMPACT_THRESHOLD:
+            del buf[:pos]
+            pos = 0
+        self._pos = pos
+
+        self.frames += len(frames)
+        return frames
+
+
+#-------------------------------------------------------------------------------------------------------------------------
+# Micro-benchmark: implementazioni originali contro quelle tabellari
+#-------------------------------------------------------------------------------------------------------------------------
+#
+def _legacy_encode_frequency(frequency):
+    frequency_str = f"{frequency:010d}"
+    data = [0x00] * 6
+    data[0] = (int(frequency_str[9]) << 4) | int(frequency_str[8])
+    data[1] = (int(frequency_str[7]) << 4) | int(frequency_str[6])
+    data[2] = (int(frequency_str[5]) << 4) | int(frequency_str[4])
+    data[3] = (int(frequency_str[3]) << 4) | int(frequency_str[2])
+    data[4] = (int(frequency_str[1]) << 4) | int(frequency_str[0])
+    data[5] = 0x00
+    return data
+
+
+def _legacy_decode_bcd(data):
+    frequency = 0
+    for i in range(len(data)):
+        high_nibble = (data[i] >> 4) & 0x0F
+        low_nibble = data[i] & 0x0F
+        frequency = (frequency * 100) + (high_nibble * 10) + low_nibble
+    return frequency
+
+
+def _legacy_split_frames(response_buffer, data):
+    frames = []
+    response_buffer.extend(data)
+    while CIV_END_BYTE in response_buffer:
+        end_index = response_buffer.index(CIV_END_BYTE)
+        message = response_buffer[:end_index + 1]
+        response_buffer = response_buffer[end_index + 1:]
+        if len(message) >= 6 and message[0] == CIV_START_BYTE and message[1] == CIV_START_BYTE:
+            frames.append(message)
+    return response_buffer, frames
+
+
+# -----------------------------------------------------------------------------
+def benchmark(frames_per_chunk=32, chunks=2000):
+    """
+    Confronta le implementazioni originali con quelle del codec e stampa i frame/secondo.
+    """
+    import time
+
+    reply = bytes((CIV_START_BYTE, CIV_START_BYTE, CIV_ADDRESS_COMPUTER, CIV_ADDRESS_RADIO, 0x03,
+                   0x01, 0x45, 0x50, 0x00, 0x00, CIV_END_BYTE))
+    chunk = reply * frames_per_chunk
+    total_frames = frames_per_chunk * chunks
+    results = {}
+
+    def run(label, fn, count):
+        t0 = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - t0
+        results[label] = count / elapsed
+        print(f"{label:<34} {count / elapsed:>14,.0f} /s")
+
+    def legacy_parse():
+        buffer = []
+        for _ in range(chunks):
+            buffer, frames = _legacy_split_frames(buffer, chunk)
+            for message in frames:
+                _legacy_decode_bcd(message[5:-1])
+
+    def codec_parse():
+        parser = FrameParser()
+        for _ in range(chunks):
+            for message in parser.feed(chunk):
+                decode_bcd(message[5:-1])
+
+    frequencies = range(144_000_000, 144_000_000 + 12_500 * 20_000, 12_500)
+
+    def legacy_encode():
+        for f in frequencies:
+            _legacy_encode_frequency(f)
+
+    def codec_encode():
+        for f in frequencies:
+            encode_frequency(f)
+
+    print("Micro-benchmark codec CI-V")
+    run("parse+decode originale (frame)", legacy_parse, total_frames)
+    run("parse+decode codec (frame)", codec_parse, total_frames)
+    run("encode frequenza originale", legacy_encode, len(frequencies))
+    run("encode frequenza codec", codec_encode, len(frequencies))
+    return results
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,320 @@
+# *
+# * Project Name: Radio User Interface
+# * File: civ_dualwatch.py
+# *
+# * Copyright (C) 2024 Fabrizio Palumbo (IU0IJV)
+# *
+# * This program is distributed under the terms of the MIT license.
+# * You can obtain a copy of the license at:
+# * https://opensource.org/licenses/MIT
+# *
+# * DESCRIPTION:
+# * Doppio ascolto: il ricevitore alterna le frequenze dei VFO misurando RSSI e squelch.
+# *
+# * NOTES:
+# * - Per ogni canale: COMMAND_SET_FREQUENCY, dwell, COMMAND_GET_RSSI + COMMAND_GET_STATUS.
+# * - Come in civ_sweep, misura e sintonia sono in pipeline: le due richieste del canale
+# *   corrente e la sintonia del successivo partono nella stessa scrittura; la radio li
+# *   esegue in ordine, le risposte vengono associate ai canali in ordine di arrivo.
+# *   Un ciclo completo A/B dura quindi circa 2 x dwell più il tempo di una risposta.
+# * - Quando un canale ha lo squelch aperto (flag RX) il ricevitore resta su quel canale
+# *   e lo misura ogni hold_interval secondi; l'alternanza riprende dopo `hang` secondi di
+# *   squelch chiuso.
+# * - Uso senza interfaccia:  python civ_dualwatch.py <porta> <frequenza A> <frequenza B> [secondi]
+
+import collections
+import sys
+import threading
+import time
+
+from civ_codec import COMMAND_SET_FREQUENCY, COMMAND_GET_RSSI, COMMAND_GET_STATUS, encode_frequency
+
+
+STATUS_RX = 0x0003              # Flag di ricezione (squelch aperto) in COMMAND_GET_STATUS
+
+
+#-------------------------------------------------------------------------------------------------------------------------
+# Doppio ascolto
+#-------------------------------------------------------------------------------------------------------------------------
+#
+class DualWatch:
+    """
+    Alternanza del ricevitore tra due (o più) frequenze.
+
+    write:         funzione write([(command, data), ...]) che scrive subito i comandi in
+                   un'unica scrittura (es. CommandTransmitter.send_now).
+    dwell:         tempo di permanenza (s) su ogni canale prima della misura.
+    window:        numero massimo di misure in attesa di risposta.
+    reply_timeout: attesa massima (s) di una risposta prima di considerarla persa.
+    hang:          secondi di squelch chiuso dopo i quali l'alternanza riprende.
+    hold_interval: intervallo (s) tra le misure del canale attivo durante la pausa.
+    on_sample:     callback(indice, rssi, aperto) per ogni canale misurato.
+    on_hold:       callback(indice o None) quando il ricevitore si ferma su un canale o riparte.
+    on_stop:       callback(indice del canale attivo o None) alla fine.
+
+    Le risposte COMMAND_GET_RSSI e COMMAND_GET_STATUS vanno passate a rssi_received() e
+    status_received(); durante il doppio ascolto nessun altro deve interrogarle.
+    """
+
+    def __init__(self, write, dwell=0.03, window=4, reply_timeout=0.5, hang=2.0, hold_interval=0.1,
+                 on_sample=None, on_hold=None, on_stop=None):
+        self.write = write
+        self.dwell = dwell
+        self.window = window
+        self.reply_timeout = reply_timeout
+        self.hang = hang
+        self.hold_interval = hold_interval
+        self.on_sample = on_sample
+        self.on_hold = on_hold
+        self.on_stop = on_stop
+
+        self.frequencies = []
+        self.rssi = []                  # Ultimo RSSI di ogni canale
+        self.open = []                  # Ultimo stato dello squelch di ogni canale
+        self.holding = None             # Canale su cui il ricevitore è fermo (None = alternanza)
+        self.cycles = 0                 # Cicli completi di alternanza
+        self.samples = 0
+        self.lost = 0
+        self.holds = 0
+        self.cycle_time = 0.0           # Durata media di un ciclo (s, media esponenziale)
+
+        self._rssi_pending = collections.deque()
+        self._status_pending = collections.deque()
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread = None
+        self._last_open = 0.0
+        self._cycle_start = None
+
+    # -----------------------------------------------------------------------------
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def cycle_rate(self):
+        return 1.0 / self.cycle_time if self.cycle_time > 0 else 0.0
+
+    # -----------------------------------------------------------------------------
+    def start(self, frequencies):
+        if len(frequencies) < 2:
+            raise ValueError("Servono almeno due frequenze")
+        if self.running:
+            self.stop()
+            self._thread.join()
+
+        self.frequencies = list(frequencies)
+        self.rssi = [0] * len(self.frequencies)
+        self.open = [False] * len(self.frequencies)
+        self.holding = None
+        self.cycles = 0
+        self.samples = 0
+        self.lost = 0
+        self.holds = 0
+        self.cycle_time = 0.0
+        self._cycle_start = None
+        self._rssi_pending.clear()
+        self._status_pending.clear()
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self._thread
+
+    # -----------------------------------------------------------------------------
+    def stop(self):
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+
+    # -----------------------------------------------------------------------------
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    # -----------------------------------------------------------------------------
+    def rssi_received(self, raw):
+        with self._cond:
+            if not self._rssi_pending:
+                return
+            self.rssi[self._rssi_pending.popleft()] = raw
+
+    # -----------------------------------------------------------------------------
+    def status_received(self, flags):
+        """
+        Conclude la misura del canale più vecchio in attesa (la risposta di stato arriva dopo l'RSSI).
+        """
+        hold_changed = False
+        with self._cond:
+            if not self._status_pending:
+                return
+            index = self._status_pending.popleft()
+            now = time.perf_counter()
+            squelch_open = bool(flags & STATUS_RX)
+            self.open[index] = squelch_open
+            self.samples += 1
+
+            if squelch_open:
+                self._last_open = now
+                if self.holding is None:
+                    self.holding = index
+                    self.holds += 1
+                    self._cycle_start = None
+                    hold_changed = True
+            elif self.holding is None and index == len(self.frequencies) - 1:
+                # Fine di un ciclo di alternanza
+                if self._cycle_start is not None:
+                    elapsed = now - self._cycle_start
+                    self.cycle_time = elapsed if not self.cycle_time else 0.8 * self.cycle_time + 0.2 * elapsed
+                    self.cycles += 1
+                self._cycle_start = now
+            rssi = self.rssi[index]
+            self._cond.notify_all()
+
+        if self.on_sample is not None:
+            self.on_sample(index, rssi, squelch_open)
+        if hold_changed and self.on_hold is not None:
+            self.on_hold(index)
+
+    # -----------------------------------------------------------------------------
+    def stats(self):
+        return {
+            "cycles": self.cycles,
+            "cycle_ms": round(self.cycle_time * 1000, 1),
+            "cycles_per_second": round(self.cycle_rate, 1),
+            "samples": self.samples,
+            "holds": self.holds,
+            "lost": self.lost,
+        }
+
+    # -----------------------------------------------------------------------------
+    def _wait_slot(self, limit):
+        """
+        Attende che le misure in attesa scendano sotto `limit`; le risposte scadute sono perse.
+        """
+        with self._cond:
+            while len(self._status_pending) > limit and not (self._stop and limit > 0):
+                if not self._cond.wait(self.reply_timeout) and self._status_pending:
+                    self._status_pending.popleft()
+                    if self._rssi_pending:
+                        self._rssi_pending.popleft()
+                    self.lost += 1
+
+    # -----------------------------------------------------------------------------
+    def _measure(self, index, following=None):
+        """
+        Richieste RSSI e stato del canale `index` e, nella stessa scrittura, sintonia di `following`.
+        """
+        commands = [(COMMAND_GET_RSSI, ()), (COMMAND_GET_STATUS, ())]
+        if following is not None:
+            commands.append((COMMAND_SET_FREQUENCY, encode_frequency(self.frequencies[following])))
+        with self._cond:
+            self._rssi_pending.append(index)
+            self._status_pending.append(index)
+        self.write(commands)
+
+    # -----------------------------------------------------------------------------
+    def _sleep_until(self, deadline):
+        remaining = deadline - time.perf_counter()
+        if remaining > 0:
+            with self._cond:
+                self._cond.wait_for(lambda: self._stop, remaining)
+
+    # -----------------------------------------------------------------------------
+    def _run(self):
+        count = len(self.frequencies)
+        index = 0
+        self.write([(COMMAND_SET_FREQUENCY, encode_frequency(self.frequencies[0]))])
+        last_tune = time.perf_counter()
+
+        while not self._stop:
+            holding = self.holding
+            if holding is not None:
+                # Pausa su un canale attivo: le misure già in volo riguardano anche gli altri canali
+                self._wait_slot(0)
+                if self._stop:
+                    break
+                if index != holding:
+                    index = holding
+                    self.write([(COMMAND_SET_FREQUENCY, encode_frequency(self.frequencies[index]))])
+                    last_tune = time.perf_counter()
+                self._sleep_until(last_tune + self.dwell)
+                self._measure(index)
+                self._wait_slot(0)
+
+                with self._cond:
+                    released = not self.open[index] and time.perf_counter() - self._last_open >= self.hang
+                    if released:
+                        self.holding = None
+                if released:
+                    if self.on_hold is not None:
+                        self.on_hold(None)
+                    index = (index + 1) % count
+                    self.write([(COMMAND_SET_FREQUENCY, encode_frequency(self.frequencies[index]))])
+                    last_tune = time.perf_counter()
+                else:
+                    last_tune = time.perf_counter() + self.hold_interval - self.dwell
+                continue
+
+            self._wait_slot(self.window - 1)
+            if self._stop:
+                break
+            self._sleep_until(last_tune + self.dwell)
+            if self._stop or self.holding is not None:
+                continue
+
+            # Misura del canale corrente e, nella stessa scrittura, sintonia del successivo
+            following = (index + 1) % count
+            self._measure(index, following)
+            last_tune = time.perf_counter()
+            index = following
+
+        self._wait_slot(0)
+        if self.on_stop is not None:
+            self.on_stop(self.holding)
+
+
+# -----------------------------------------------------------------------------
+def _main(argv):
+    import serial
+    from civ_receiver import SerialReceiver
+    from civ_transmitter import CommandTransmitter
+
+    if len(argv) < 4:
+        print("Uso: python civ_dualwatch.py <porta> <frequenza A> <frequenza B> [secondi]")
+        return 1
+
+    port, frequency_a, frequency_b = argv[1], int(argv[2]), int(argv[3])
+    seconds = float(argv[4]) if len(argv) > 4 else 10.0
+
+    ser = serial.Serial(port=port, baudrate=115200, timeout=0.1)
+    transmitter = CommandTransmitter(lambda: ser)
+    watch = DualWatch(transmitter.send_now,
+                      on_hold=lambda index: print(f"Attività su {watch.frequencies[index]}" if index is not None
+                                                  else "Ripresa dell'alternanza"))
+
+    def on_frame(frame, t_rx):
+        if frame[4] == COMMAND_GET_RSSI and len(frame) >= 8:
+            watch.rssi_received(frame[5] + frame[6] * 256)
+        elif frame[4] == COMMAND_GET_STATUS and len(frame) >= 8:
+            watch.status_received(frame[5] + frame[6] * 256)
+
+    receiver = SerialReceiver(lambda: ser, on_frame=on_frame)
+    receiver.start()
+
+    watch.start([frequency_a, frequency_b])
+    try:
+        time.sleep(seconds)
+    except KeyboardInterrupt:
+        pass
+    watch.stop()
+    watch.join()
+    receiver.stop()
+    receiver.join(ser.timeout + 0.5)
+    ser.close()
+
+    print(f"# {watch.stats()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main(sys.argv))
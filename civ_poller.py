@@ -0,0 +1,238 @@
+# *
+# * Project Name: Radio User Interface
+# * File: civ_poller.py
+# *
+# * Copyright (C) 2024 Fabrizio Palumbo (IU0IJV)
+# *
+# * This program is distributed under the terms of the MIT license.
+# * You can obtain a copy of the license at:
+# * https://opensource.org/licenses/MIT
+# *
+# * DESCRIPTION:
+# * Schedulatore adattivo multi-frequenza per l'interrogazione dello stato della radio.
+# *
+# * NOTES:
+# * - Ogni parametro ha la propria frequenza di interrogazione (es. S-meter 10 Hz, squelch 1 Hz).
+# * - Un parametro non viene reinterrogato finché la richiesta precedente è in attesa di risposta.
+# * - In caso di timeout o di collegamento saturo la frequenza viene ridotta automaticamente
+# *   e poi recuperata gradualmente quando le risposte tornano regolari.
+
+import collections
+import threading
+import time
+
+
+RATE_WINDOW = 5.0               # Finestra (s) per il calcolo della frequenza effettiva
+BACKOFF_TIMEOUT = 0.5           # Fattore applicato alla frequenza dopo un timeout
+BACKOFF_SATURATED = 0.8         # Fattore applicato quando il collegamento è saturo
+RECOVERY_STEP = 0.05            # Recupero del fattore ad ogni risposta ricevuta
+
+
+#-------------------------------------------------------------------------------------------------------------------------
+# Parametro interrogato
+#-------------------------------------------------------------------------------------------------------------------------
+#
+class PollTask:
+    """
+    Stato di interrogazione di un singolo parametro.
+    """
+
+    def __init__(self, name, command, rate_hz, min_rate_hz, timeout):
+        self.name = name
+        self.command = command
+        self.target_hz = rate_hz
+        self.min_factor = min(1.0, min_rate_hz / rate_hz)
+        self.timeout = timeout
+        self.factor = 1.0               # Riduzione corrente della frequenza (1.0 = nessuna)
+
+        self.next_due = 0.0
+        self.sent_at = None             # Istante dell'ultima richiesta ancora senza risposta
+        self.sent = 0
+        self.replies = 0
+        self.timeouts = 0
+        self.reply_times = collections.deque(maxlen=256)
+
+    # -----------------------------------------------------------------------------
+    @property
+    def interval(self):
+        return 1.0 / (self.target_hz * self.factor)
+
+    # -----------------------------------------------------------------------------
+    def achieved_hz(self, now):
+        times = self.reply_times
+        while times and now - times[0] > RATE_WINDOW:
+            times.popleft()
+        if len(times) < 2:
+            return 0.0
+        return (len(times) - 1) / max(now - times[0], 1e-6)
+
+    # -----------------------------------------------------------------------------
+    def backoff(self, factor):
+        self.factor = max(self.min_factor, self.factor * factor)
+
+
+#-------------------------------------------------------------------------------------------------------------------------
+# Schedulatore
+#-------------------------------------------------------------------------------------------------------------------------
+#
+class PollScheduler:
+    """
+    Thread che invia i comandi GET rispettando la frequenza di ciascun parametro.
+
+    send:      funzione send(command, data) usata per inviare le richieste.
+    is_active: funzione che indica se la porta è aperta (se False non si interroga).
+    saturated: funzione opzionale che indica se il collegamento è saturo
+               (ad esempio coda di trasmissione troppo lunga).
+    latency:   istogramma opzionale (metodo observe) dei tempi richiesta-risposta in secondi.
+    """
+
+    def __init__(self, send, is_active=lambda: True, saturated=None):
+        self.send = send
+        self.is_active = is_active
+        self.saturated = saturated
+        self.latency = None
+        self.tasks = {}                 # nome -> PollTask
+        self._by_command = {}           # opcode -> PollTask
+        self._cond = threading.Condition()
+        self._stop = False
+        self._paused = False
+        self._thread = None
+
+    # -----------------------------------------------------------------------------
+    def add(self, name, command, rate_hz, min_rate_hz=None, timeout=None):
+        """
+        Registra un parametro da interrogare a rate_hz (ridotto fino a min_rate_hz in caso di problemi).
+        """
+        if min_rate_hz is None:
+            min_rate_hz = rate_hz / 10
+        if timeout is None:
+            timeout = max(0.3, 2.0 / rate_hz)
+        task = PollTask(name, command, rate_hz, min_rate_hz, timeout)
+        with self._cond:
+            self.tasks[name] = task
+            self._by_command[command] = task
+            self._cond.notify()
+        return task
+
+    # -----------------------------------------------------------------------------
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop = False
+            self._thread = threading.Thread(target=self.run, daemon=True)
+            self._thread.start()
+        return self._thread
+
+    # -----------------------------------------------------------------------------
+    def stop(self):
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+
+    # -----------------------------------------------------------------------------
+    def pause(self):
+        """
+        Sospende le interrogazioni (es. durante una scansione che usa le stesse risposte).
+        """
+        with self._cond:
+            self._paused = True
+
+    # -----------------------------------------------------------------------------
+    def resume(self):
+        with self._cond:
+            self._paused = False
+            for task in self.tasks.values():
+                task.sent_at = None
+                task.next_due = 0.0
+            self._cond.notify()
+
+    # -----------------------------------------------------------------------------
+    def request_now(self, name):
+        """
+        Anticipa l'interrogazione di un parametro (es. frequenza dopo un cambio di banda).
+        """
+        with self._cond:
+            task = self.tasks.get(name)
+            if task is not None:
+                task.next_due = 0.0
+                self._cond.notify()
+
+    # -----------------------------------------------------------------------------
+    def reply_received(self, command):
+        """
+        Da chiamare per ogni frame ricevuto: chiude la richiesta in attesa e recupera la frequenza.
+        """
+        task = self._by_command.get(command)
+        if task is None:
+            return
+        now = time.monotonic()
+        with self._cond:
+            if task.sent_at is not None and self.latency is not None:
+                self.latency.observe(now - task.sent_at)
+            task.sent_at = None
+            task.replies += 1
+            task.reply_times.append(now)
+            task.factor = min(1.0, task.factor + RECOVERY_STEP)
+
+    # -----------------------------------------------------------------------------
+    def run(self):
+        while True:
+            with self._cond:
+                if self._stop:
+                    return
+                now = time.monotonic()
+                due = [t for t in self.tasks.values() if t.next_due <= now]
+                if not due:
+                    wait = min((t.next_due for t in self.tasks.values()), default=now + 1.0) - now
+                    self._cond.wait(wait)
+                    continue
+
+                active = not self._paused and self.is_active()
+                saturated = active and self.saturated is not None and self.saturated()
+                to_send = []
+                for task in due:
+                    task.next_due = now + task.interval
+                    if not active:
+                        task.sent_at = None
+                        continue
+                    if task.sent_at is not None:
+                        if now - task.sent_at < task.timeout:
+                            continue                    # Risposta ancora attesa: non accumula richieste
+                        task.timeouts += 1
+                        task.backoff(BACKOFF_TIMEOUT)
+                        task.next_due = now + task.interval
+                    if saturated:
+                        task.backoff(BACKOFF_SATURATED)
+                        task.next_due = now + task.interval
+                        continue
+                    task.sent_at = now
+                    task.sent += 1
+                    to_send.append(task.command)
+
+            # Invio fuori dal lock
+            for command in to_send:
+                self.send(command)
+
+    # -----------------------------------------------------------------------------
+    def stats(self):
+        """
+        Frequenza obiettivo, frequenza corrente (dopo il backoff) ed effettiva per ogni parametro.
+        """
+        now = time.monotonic()
+        with self._cond:
+            return {
+                name: {
+                    "target_hz": task.target_hz,
+                    "current_hz": round(task.target_hz * task.factor, 2),
+                    "achieved_hz": round(task.achieved_hz(now), 2),
+                    "sent": task.sent,
+                    "replies": task.replies,
+                    "timeouts": task.timeouts,
+                }
+                for name, task in self.tasks.items()
+            }
+
+    # -----------------------------------------------------------------------------
+    def summary(self):
+        return "  ".join(
+            f"{name} {s['achieved_hz']:.1f}/{s['target_hz']:g} Hz" for name, s in self.stats().items()
+        )
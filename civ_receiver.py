@@ -0,0 +1,237 @@
+# *
+# * Project Name: Radio User Interface
+# * File: civ_receiver.py
+# *
+# * Copyright (C) 2024 Fabrizio Palumbo (IU0IJV)
+# *
+# * This program is distributed under the terms of the MIT license.
+# * You can obtain a copy of the license at:
+# * https://opensource.org/licenses/MIT
+# *
+# * DESCRIPTION:
+# * Motore di ricezione CI-V guidato dagli eventi per la porta seriale.
+# *
+# * NOTES:
+# * - Il framing (preambolo, indirizzi, risincronizzazione) è delegato a civ_codec.FrameParser.
+# * - Legge a blocchi tutto il contenuto di `in_waiting` (oppure attende il primo byte
+# *   sfruttando il timeout della porta), senza sleep tra un burst e l'altro.
+# * - I frame completi vengono consegnati al processore tramite coda bloccante o callback,
+# *   insieme all'istante di ricezione per misurare la latenza ricezione -> dispatch.
+
+import threading
+import time
+import queue
+import serial
+
+from civ_codec import FrameParser
+from civ_capture import DIRECTION_RX
+
+LATENCY_WINDOW = 256            # Numero di campioni recenti usati per i percentili
+
+
+#-------------------------------------------------------------------------------------------------------------------------
+# Statistiche di latenza
+#-------------------------------------------------------------------------------------------------------------------------
+#
+class LatencyStats:
+    """
+    Accumula la latenza ricezione -> dispatch dei frame (in secondi).
+    Mantiene i totali e una finestra circolare degli ultimi campioni per i percentili.
+    """
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.window = window
+        self.reset()
+
+    # -----------------------------------------------------------------------------
+    def reset(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+        self._recent = [0.0] * self.window
+        self._index = 0
+
+    # -----------------------------------------------------------------------------
+    def record(self, t_rx, t_dispatch=None):
+        """
+        Registra un campione a partire dall'istante di ricezione (time.perf_counter()).
+        """
+        if t_dispatch is None:
+            t_dispatch = time.perf_counter()
+        latency = t_dispatch - t_rx
+
+        self.count += 1
+        self.total += latency
+        self.last = latency
+        if latency > self.max:
+            self.max = latency
+        self._recent[self._index] = latency
+        self._index = (self._index + 1) % self.window
+
+    # -----------------------------------------------------------------------------
+    def snapshot(self):
+        """
+        Restituisce un dizionario con i valori correnti (in millisecondi).
+        """
+        recent = sorted(self._recent[:min(self.count, self.window)])
+        if recent:
+            p50 = recent[len(recent) // 2]
+            p95 = recent[min(len(recent) - 1, int(len(recent) * 0.95))]
+        else:
+            p50 = p95 = 0.0
+
+        return {
+            "frames": self.count,
+            "last_ms": self.last * 1000,
+            "mean_ms": (self.total / self.count * 1000) if self.count else 0.0,
+            "p50_ms": p50 * 1000,
+            "p95_ms": p95 * 1000,
+            "max_ms": self.max * 1000,
+        }
+
+    # -----------------------------------------------------------------------------
+    def summary(self):
+        s = self.snapshot()
+        return (f"frame: {s['frames']}  latenza rx->dispatch  media {s['mean_ms']:.2f} ms  "
+                f"p50 {s['p50_ms']:.2f} ms  p95 {s['p95_ms']:.2f} ms  max {s['max_ms']:.2f} ms")
+
+
+#-------------------------------------------------------------------------------------------------------------------------
+# Ricevitore seriale
+#-------------------------------------------------------------------------------------------------------------------------
+#
+class SerialReceiver:
+    """
+    Thread di lettura della porta seriale con framing incrementale dei messaggi CI-V.
+
+    port_getter: funzione che restituisce l'oggetto serial.Serial corrente (può cambiare
+                 quando l'utente seleziona un'altra porta) oppure None.
+    frame_queue: coda in cui vengono inseriti i frame come tuple (frame, t_rx).
+    on_frame:    in alternativa alla coda, callback chiamata dal thread di lettura con (frame, t_rx).
+    capture:     CaptureWriter opzionale su cui registrare i byte letti dalla porta.
+    on_error:    callback opzionale(eccezione) per gli errori di lettura (es. dispositivo rimosso);
+                 se presente sostituisce la stampa dell'errore.
+    """
+
+    def __init__(self, port_getter, frame_queue=None, on_frame=None, idle_wait=0.5, parser=None,
+                 capture=None, on_error=None):
+        self.port_getter = port_getter
+        self.parser = parser if parser is not None else FrameParser()
+        self.frames = frame_queue if frame_queue is not None else queue.Queue()
+        self.on_frame = on_frame
+        self.idle_wait = idle_wait          # Attesa quando la porta non è disponibile
+        self.latency = LatencyStats()
+        self.capture = capture
+        self.on_error = on_error
+
+        self.bytes_received = 0
+        self.frames_received = 0
+
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    # -----------------------------------------------------------------------------
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run, daemon=True)
+            self._thread.start()
+        return self._thread
+
+    # -----------------------------------------------------------------------------
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    # -----------------------------------------------------------------------------
+    def wake(self):
+        """
+        Interrompe l'attesa a porta chiusa (es. subito dopo l'apertura di una porta).
+        """
+        self._wake.set()
+
+    # -----------------------------------------------------------------------------
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    # -----------------------------------------------------------------------------
+    def run(self):
+        """
+        Ciclo del thread di lettura: legge a blocchi e suddivide i dati in frame.
+        """
+        while not self._stop.is_set():
+            port = self.port_getter()
+            if not (port and port.is_open):
+                self.parser.reset()
+                self._idle()
+                continue
+
+            try:
+                # Legge tutto ciò che è già disponibile, altrimenti attende il primo byte
+                # (la chiamata ritorna non appena arriva un dato o allo scadere del timeout della porta)
+                waiting = port.in_waiting
+                chunk = port.read(waiting if waiting > 0 else 1)
+            except serial.SerialException as e:
+                self._error(e, "Errore lettura seriale")
+                continue
+            except Exception as e:
+                self._error(e, "Errore generico nel thread di ricezione")
+                continue
+
+            if chunk:
+                t_rx = time.perf_counter()
+                if self.capture is not None:
+                    self.capture.write(DIRECTION_RX, chunk, t_rx)
+                self.feed(chunk, t_rx)
+
+    # -----------------------------------------------------------------------------
+    def _error(self, error, message):
+        self.parser.reset()
+        if self.on_error is not None:
+            self.on_error(error)
+        else:
+            print(f"{message}: {error}")
+        self._idle()
+
+    # -----------------------------------------------------------------------------
+    def _idle(self):
+        self._wake.wait(self.idle_wait)
+        self._wake.clear()
+
+    # -----------------------------------------------------------------------------
+    def feed(self, chunk, t_rx=None):
+        """
+        Aggiunge i byte ricevuti al buffer ed estrae tutti i frame completi.
+        """
+        if t_rx is None:
+            t_rx = time.perf_counter()
+
+        self.bytes_received += len(chunk)
+        for frame in self.parser.feed(chunk):
+            self._deliver(frame, t_rx)
+
+    # -----------------------------------------------------------------------------
+    def _deliver(self, frame, t_rx):
+        self.frames_received += 1
+        if self.on_frame is not None:
+            self.latency.record(t_rx)
+            self.on_frame(frame, t_rx)
+        else:
+            self.frames.put((frame, t_rx))
+
+    # -----------------------------------------------------------------------------
+    def dispatch_forever(self, handler):
+        """
+        Consuma la coda dei frame in modo bloccante (nessun polling) e registra la latenza.
+        Un elemento None nella coda termina il ciclo.
+        """
+        while True:
+            item = self.frames.get()
+            if item is None:
+                break
+            frame, t_rx = item
+            self.latency.record(t_rx)
+            handler(frame)
@@ -0,0 +1,441 @@
+# *
+# * Project Name: Radio User Interface
+# * File: civ_server.py
+# *
+# * Copyright (C) 2024 Fabrizio Palumbo (IU0IJV)
+# *
+# * This program is distributed under the terms of the MIT license.
+# * You can obtain a copy of the license at:
+# * https://opensource.org/licenses/MIT
+# *
+# * DESCRIPTION:
+# * Server TCP che condivide una radio tra più client.
+# *
+# * NOTES:
+# * - Il server possiede la porta seriale (tramite RadioCore): i client non la aprono e
+# *   non interrogano la radio, ricevono le variazioni di stato decodificate.
+# * - Protocollo testuale a righe (utilizzabile anche con telnet / nc):
+# *     get <nome>            -> "<nome> <valore>"   (valore in memoria, nessun traffico seriale)
+# *     state                 -> tutti i parametri, poi "."
+# *     dirty                 -> parametri scritti e non ancora confermati dalla radio, poi "."
+# *     set <nome> <valore>   -> "OK set <nome>" quando il comando è passato alla radio,
+# *                              "ERR <nome>: porta non aperta" se la porta seriale è chiusa
+# *     monitor               -> commuta il monitor
+# *     sub [nome ...]        -> ricezione delle variazioni ("<nome> <valore>"), tutte o solo quelle indicate
+# *     unsub / quit
+# *   Gli errori sono restituiti come "ERR <messaggio>".
+# * - Un solo thread con I/O non bloccante (selectors) gestisce tutti i client.
+# * - I comandi SET dei client sono passati alla radio a turno (round robin, uno per client
+# *   per giro) e solo se la coda di trasmissione non è piena: un client che invia molti
+# *   comandi non ritarda quelli degli altri.
+# * - Un client lento non blocca gli altri: oltre `max_buffer` byte in uscita le sue
+# *   variazioni vengono accumulate per nome (resta solo l'ultimo valore) e inviate quando
+# *   il buffer si svuota.
+# * - Uso senza interfaccia:
+# *     python civ_server.py <porta seriale> [--host 0.0.0.0] [--port 7300]
+
+import collections
+import selectors
+import socket
+import sys
+import threading
+
+from radio_core import SETTERS, SETTER_RANGES
+
+
+DEFAULT_PORT = 7300
+MAX_LINE = 256                  # Lunghezza massima di una riga ricevuta
+
+
+#-------------------------------------------------------------------------------------------------------------------------
+# Client
+#-------------------------------------------------------------------------------------------------------------------------
+#
+class ClientConnection:
+    """
+    Stato di un client collegato: buffer di ingresso e uscita, comandi in attesa, sottoscrizione.
+    """
+
+    def __init__(self, sock, address):
+        self.sock = sock
+        self.address = address
+        self.inbuf = bytearray()
+        self.outbuf = bytearray()
+        self.commands = collections.deque()     # Comandi SET in attesa del proprio turno
+        self.subscribed = None                  # None = nessuna, insieme vuoto = tutte, altrimenti i nomi
+        self.dirty = {}                         # Variazioni accumulate mentre il buffer è pieno
+        self.closing = False
+        self.writing = False                    # Registrato nel selettore anche in scrittura
+
+        self.commands_received = 0
+        self.updates_sent = 0
+        self.updates_coalesced = 0
+
+    # -----------------------------------------------------------------------------
+    def wants(self, name):
+        return self.subscribed is not None and (not self.subscribed or name in self.subscribed)
+
+    # -----------------------------------------------------------------------------
+    def send_line(self, text):
+        self.outbuf += text.encode("utf-8") + b"\n"
+
+
+#-------------------------------------------------------------------------------------------------------------------------
+# Server
+#-------------------------------------------------------------------------------------------------------------------------
+#
+class ControlServer:
+    """
+    Espone un RadioCore su TCP.
+
+    radio:        RadioCore già avviato (la porta può essere aperta anche dopo).
+    max_clients:  numero massimo di client contemporanei.
+    max_buffer:   byte in uscita oltre i quali le variazioni di un client vengono accumulate.
+    max_pending:  comandi in coda di trasmissione oltre i quali si attende prima di passarne altri.
+    """
+
+    def __init__(self, radio, host="127.0.0.1", port=DEFAULT_PORT, max_clients=64, max_buffer=65536, max_pending=8):
+        self.radio = radio
+        self.host = host
+        self.port = port
+        self.max_clients = max_clients
+        self.max_buffer = max_buffer
+        self.max_pending = max_pending
+
+        self.clients = {}               # socket -> ClientConnection
+        self.connections = 0
+        self.rejected = 0
+        self.commands_forwarded = 0
+        self.updates_published = 0
+
+        self._updates = []              # (nome, valore) dal thread di smistamento del nucleo
+        self._lock = threading.Lock()
+        self._woken = False
+        self._selector = None
+        self._listener = None
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._stop = False
+        self._thread = None
+
+    # -----------------------------------------------------------------------------
+    def start(self):
+        """
+        Apre il socket in ascolto e avvia il thread del server. Restituisce la porta effettiva.
+        """
+        self._listener = socket.create_server((self.host, self.port))
+        self._listener.setblocking(False)
+        self.port = self._listener.getsockname()[1]
+
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._listener, selectors.EVENT_READ, None)
+        self._wake_r.setblocking(False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ, None)
+
+        self.radio.add_listener(self._on_state)
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self.port
+
+    # -----------------------------------------------------------------------------
+    def stop(self):
+        self._stop = True
+        self._wake()
+        if self._thread is not None:
+            self._thread.join(2.0)
+        self.radio.remove_listener(self._on_state)
+
+    # -----------------------------------------------------------------------------
+    def stats(self):
+        return {
+            "clients": len(self.clients),
+            "connections": self.connections,
+            "rejected": self.rejected,
+            "commands_forwarded": self.commands_forwarded,
+            "updates_published": self.updates_published,
+            "updates_coalesced": sum(client.updates_coalesced for client in list(self.clients.values())),
+        }
+
+    # -----------------------------------------------------------------------------
+    def _wake(self):
+        try:
+            self._wake_w.send(b"\0")
+        except OSError:
+            pass
+
+    # -----------------------------------------------------------------------------
+    def _on_state(self, name, value):
+        # Thread di smistamento del nucleo (o chi chiama i setter): solo accodamento
+        with self._lock:
+            self._updates.append((name, value))
+            if self._woken:
+                return
+            self._woken = True
+        self._wake()
+
+    # -----------------------------------------------------------------------------
+    def _run(self):
+        selector = self._selector
+        try:
+            while not self._stop:
+                # Con comandi in attesa si ricontrolla presto la coda di trasmissione
+                waiting = any(client.commands for client in self.clients.values())
+                for key, events in selector.select(0.01 if waiting else 1.0):
+                    sock = key.fileobj
+                    if sock is self._listener:
+                        self._accept()
+                    elif sock is self._wake_r:
+                        try:
+                            self._wake_r.recv(4096)
+                        except BlockingIOError:
+                            pass
+                    else:
+                        client = self.clients.get(sock)
+                        if client is None:
+                            continue
+                        if events & selectors.EVENT_READ:
+                            self._read(client)
+                        if events & selectors.EVENT_WRITE and not client.closing:
+                            self._write(client)
+
+                self._publish()
+                self._forward()
+                self._flush_all()
+        finally:
+            for client in list(self.clients.values()):
+                self._close(client)
+            selector.close()
+            self._listener.close()
+
+    # -----------------------------------------------------------------------------
+    def _accept(self):
+        try:
+            sock, address = self._listener.accept()
+        except BlockingIOError:
+            return
+        if len(self.clients) >= self.max_clients:
+            self.rejected += 1
+            sock.close()
+            return
+        sock.setblocking(False)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        client = ClientConnection(sock, address)
+        self.clients[sock] = client
+        self.connections += 1
+        self._selector.register(sock, selectors.EVENT_READ, None)
+
+    # -----------------------------------------------------------------------------
+    def _close(self, client):
+        self.clients.pop(client.sock, None)
+        try:
+            self._selector.unregister(client.sock)
+        except (KeyError, ValueError):
+            pass
+        client.sock.close()
+
+    # -----------------------------------------------------------------------------
+    def _read(self, client):
+        try:
+            data = client.sock.recv(4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self._close(client)
+            return
+
+        client.inbuf += data
+        while True:
+            end = client.inbuf.find(b"\n")
+            if end < 0:
+                if len(client.inbuf) > MAX_LINE:
+                    client.inbuf.clear()
+                    client.send_line("ERR riga troppo lunga")
+                break
+            line = client.inbuf[:end].decode("utf-8", "replace").strip()
+            del client.inbuf[:end + 1]
+            if line:
+                client.commands_received += 1
+                self._execute(client, line)
+
+    # -----------------------------------------------------------------------------
+    def _execute(self, client, line):
+        words = line.split()
+        verb = words[0].lower()
+        state = self.radio.snapshot()
+
+        if verb == "get" and len(words) == 2:
+            name = words[1]
+            if name not in state:
+                client.send_line(f"ERR parametro sconosciuto: {name}")
+            else:
+                client.send_line(f"{name} {_format(state[name])}")
+        elif verb == "state":
+            for name, value in state.items():
+                client.send_line(f"{name} {_format(value)}")
+            client.send_line(".")
+        elif verb == "dirty":
+            for name, value in self.radio.dirty().items():
+                client.send_line(f"{name} {_format(value)}")
+            client.send_line(".")
+        elif verb == "set" and len(words) == 3:
+            name = words[1]
+            if name not in SETTERS:
+                client.send_line(f"ERR parametro non impostabile: {name}")
+                return
+            try:
+                value = int(words[2], 0)
+            except ValueError:
+                value = None
+            low, high = SETTER_RANGES[name]
+            if value is None or not low <= value <= high:
+                client.send_line(f"ERR valore non valido: {words[2]}")
+                return
+            client.commands.append((name, value))
+        elif verb == "monitor":
+            client.commands.append(("monitor", None))
+        elif verb == "sub":
+            client.subscribed = set(words[1:])
+            client.send_line("OK sub")
+        elif verb == "unsub":
+            client.subscribed = None
+            client.dirty.clear()
+            client.send_line("OK unsub")
+        elif verb == "quit":
+            client.send_line("OK quit")
+            client.closing = True
+        else:
+            client.send_line(f"ERR comando non valido: {line}")
+
+    # -----------------------------------------------------------------------------
+    def _forward(self):
+        """
+        Passa i comandi SET alla radio, uno per client a ogni giro, finché la coda di
+        trasmissione non è piena.
+        """
+        transmitter = self.radio.transmitter
+        while transmitter.pending() < self.max_pending:
+            ready = [client for client in list(self.clients.values()) if client.commands]
+            if not ready:
+                return
+            for client in ready:
+                name, value = client.commands.popleft()
+                try:
+                    if name == "monitor":
+                        sent = self.radio.toggle_monitor()
+                    else:
+                        sent = SETTERS[name](self.radio, value)
+                except Exception as e:
+                    # Un comando non valido non deve fermare il server per tutti i client
+                    client.send_line(f"ERR {name}: {e}")
+                    continue
+                # False anche per un SET soppresso perché non cambia nulla: è un errore solo a porta chiusa
+                if not sent and not self.radio.is_open:
+                    client.send_line(f"ERR {name}: porta non aperta")
+                    continue
+                self.commands_forwarded += 1
+                client.send_line(f"OK set {name}")
+
+    # -----------------------------------------------------------------------------
+    def _publish(self):
+        """
+        Distribuisce le variazioni di stato ai client sottoscritti.
+        """
+        with self._lock:
+            updates = self._updates
+            self._updates = []
+            self._woken = False
+        if not updates:
+            return
+
+        self.updates_published += len(updates)
+        # Ogni riga viene codificata una sola volta per tutti i client
+        lines = [(name, f"{name} {_format(value)}\n".encode("utf-8")) for name, value in updates]
+        for client in self.clients.values():
+            if client.subscribed is None:
+                continue
+            for (name, value), (_, line) in zip(updates, lines):
+                if not client.wants(name):
+                    continue
+                if client.dirty or len(client.outbuf) > self.max_buffer:
+                    # Client in ritardo: resta solo l'ultimo valore per nome
+                    if name in client.dirty:
+                        client.updates_coalesced += 1
+                    client.dirty[name] = value
+                else:
+                    client.outbuf += line
+                    client.updates_sent += 1
+
+    # -----------------------------------------------------------------------------
+    def _flush_all(self):
+        for client in list(self.clients.values()):
+            if client.dirty and len(client.outbuf) <= self.max_buffer:
+                for name, value in client.dirty.items():
+                    client.send_line(f"{name} {_format(value)}")
+                    client.updates_sent += 1
+                client.dirty.clear()
+            if client.outbuf:
+                self._write(client)
+            elif client.closing:
+                self._close(client)
+            # Il selettore viene modificato solo quando cambia l'interesse in scrittura
+            writing = bool(client.outbuf)
+            if writing != client.writing and client.sock in self.clients:
+                client.writing = writing
+                events = selectors.EVENT_READ | (selectors.EVENT_WRITE if writing else 0)
+                self._selector.modify(client.sock, events, None)
+
+    # -----------------------------------------------------------------------------
+    def _write(self, client):
+        try:
+            sent = client.sock.send(client.outbuf)
+        except BlockingIOError:
+            return
+        except OSError:
+            self._close(client)
+            return
+        del client.outbuf[:sent]
+        if not client.outbuf and client.closing:
+            self._close(client)
+
+
+# -----------------------------------------------------------------------------
+def _format(value):
+    if isinstance(value, bool):
+        return str(int(value))
+    return "-" if value is None else str(value)
+
+
+# -----------------------------------------------------------------------------
+def _main(argv):
+    import argparse
+    import time
+    from radio_session import RadioSession
+
+    parser = argparse.ArgumentParser(description="Condivide una radio tra più client TCP")
+    parser.add_argument("serial_port", help="porta seriale della radio (es. COM11, /dev/ttyUSB0)")
+    parser.add_argument("--host", default="127.0.0.1", help="indirizzo di ascolto (0.0.0.0 per la LAN)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"porta TCP (default {DEFAULT_PORT})")
+    args = parser.parse_args(argv[1:])
+
+    session = RadioSession(args.serial_port)
+    if not session.open():
+        return 1
+    server = ControlServer(session.radio, args.host, args.port)
+    port = server.start()
+    print(f"Radio {args.serial_port} condivisa su {args.host}:{port}")
+
+    try:
+        while True:
+            time.sleep(10)
+            print(f"Server - {server.stats()}")
+    except KeyboardInterrupt:
+        pass
+    server.stop()
+    session.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main(sys.argv))
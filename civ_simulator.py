@@ -0,0 +1,376 @@
+# *
+# * Project Name: Radio User Interface
+# * File: civ_simulator.py
+# *
+# * Copyright (C) 2024 Fabrizio Palumbo (IU0IJV)
+# *
+# * This program is distributed under the terms of the MIT license.
+# * You can obtain a copy of the license at:
+# * https://opensource.org/licenses/MIT
+# *
+# * DESCRIPTION:
+# * Radio BK4819 virtuale con interfaccia CI-V su pseudo-terminale (pty).
+# *
+# * NOTES:
+# * - Apre un pty e stampa il nome della porta da usare nel pannello (--port) o nei
+# *   programmi di prova (civ_client.py, civ_sweep.py). Solo Linux/macOS.
+# * - Implementa tutti i comandi usati dal pannello, con lo stesso framing e lo stesso
+# *   formato BCD della radio reale.
+# * - Le risposte escono in ordine dopo una latenza configurabile con jitter; è possibile
+# *   introdurre errori sui byte e definire segnali sintetici per il calcolo dell'RSSI.
+# * - Uso:  python civ_simulator.py [--latency 0.005] [--jitter 0.002] [--error-rate 0]
+# *                                 [--signal 145500000:220:12500 ...] [--link /tmp/ttyIFRADIO]
+
+import argparse
+import heapq
+import os
+import random
+import sys
+import threading
+import time
+
+from civ_codec import (
+    CIV_START_BYTE, CIV_END_BYTE, CIV_ADDRESS_RADIO, CIV_ADDRESS_COMPUTER, BCD_ENCODE_SWAPPED,
+    COMMAND_SET_FREQUENCY, COMMAND_GET_FREQUENCY, COMMAND_SET_MODE,
+    COMMAND_SET_SQUELCH, COMMAND_GET_SQUELCH, COMMAND_SET_AGC, COMMAND_GET_RSSI,
+    COMMAND_SET_MONITOR, COMMAND_SET_RFGAIN, COMMAND_GET_RFGAIN,
+    COMMAND_SET_BANDWIDTH, COMMAND_GET_BANDWIDTH, COMMAND_SET_TX_POWER, COMMAND_GET_TX_POWER,
+    COMMAND_GET_STATUS, COMMAND_SET_STEP, COMMAND_GET_STEP,
+    FrameParser
+)
+
+
+STATUS_RX = 0x0001              # Squelch aperto (ricezione)
+STATUS_MONITOR = 0x0002         # Monitor attivo
+STATUS_TX = 0x0004
+
+# Decodifica dei byte inviati dal pannello (cifra delle unità nel nibble alto)
+_BCD_DECODE_SWAPPED = {b: v for v, b in enumerate(BCD_ENCODE_SWAPPED)}
+
+
+# -----------------------------------------------------------------------------
+def decode_frequency(data):
+    """
+    Inversa di civ_codec.encode_frequency: byte meno significativo per primo, nibble scambiati.
+    """
+    value = 0
+    for i, b in enumerate(data[:5]):
+        value += _BCD_DECODE_SWAPPED.get(b, 0) * 100 ** i
+    return value
+
+
+# -----------------------------------------------------------------------------
+def encode_bcd(value, length=5):
+    """
+    Formato delle risposte, letto da civ_codec.decode_bcd: byte più significativo per primo.
+    """
+    out = bytearray(length)
+    for i in range(length - 1, -1, -1):
+        value, pair = divmod(value, 100)
+        out[i] = ((pair // 10) << 4) | (pair % 10)
+    return bytes(out)
+
+
+#-------------------------------------------------------------------------------------------------------------------------
+# Segnali sintetici
+#-------------------------------------------------------------------------------------------------------------------------
+#
+class Signal:
+    """
+    Portante sintetica: livello RSSI grezzo al centro, decrescente linearmente fino a ±width/2.
+    """
+
+    def __init__(self, frequency, level, width=12500):
+        self.frequency = frequency
+        self.level = level
+        self.width = width
+
+    # -----------------------------------------------------------------------------
+    @classmethod
+    def parse(cls, spec):
+        """
+        Formato "frequenza:livello[:larghezza]", ad esempio "145500000:220:12500".
+        """
+        parts = [int(p) for p in spec.split(":")]
+        return cls(*parts)
+
+    # -----------------------------------------------------------------------------
+    def level_at(self, frequency):
+        half = self.width / 2
+        distance = abs(frequency - self.frequency)
+        if distance >= half:
+            return 0
+        return self.level * (1 - distance / half)
+
+
+#-------------------------------------------------------------------------------------------------------------------------
+# Stato e comandi della radio
+#-------------------------------------------------------------------------------------------------------------------------
+#
+class RadioSimulator:
+    """
+    Stato della radio virtuale e risposta ai comandi CI-V (senza I/O, utilizzabile anche nei test).
+    """
+
+    def __init__(self, signals=(), noise_floor=20, noise=4, seed=None):
+        self.frequency = 145_500_000
+        self.step = 12_500
+        self.mode = 0
+        self.squelch = 0
+        self.rfgain = 0
+        self.bandwidth = 0
+        self.tx_power = 0
+        self.agc = 0
+        self.monitor = False
+
+        self.signals = list(signals)
+        self.noise_floor = noise_floor
+        self.noise = noise
+        self.random = random.Random(seed)
+
+        self.commands = 0
+        self.unknown = 0
+
+        self._handlers = {
+            COMMAND_SET_FREQUENCY: self._set_frequency,
+            COMMAND_GET_FREQUENCY: lambda data: encode_bcd(self.frequency),
+            COMMAND_SET_MODE: lambda data: self._set("mode", data),
+            COMMAND_SET_SQUELCH: lambda data: self._set("squelch", data),
+            COMMAND_GET_SQUELCH: lambda data: bytes((self.squelch,)),
+            COMMAND_SET_AGC: lambda data: self._set("agc", data),
+            COMMAND_GET_RSSI: lambda data: self.rssi().to_bytes(2, "little"),
+            COMMAND_SET_MONITOR: self._set_monitor,
+            COMMAND_SET_RFGAIN: lambda data: self._set("rfgain", data),
+            COMMAND_GET_RFGAIN: lambda data: bytes((self.rfgain,)),
+            COMMAND_SET_BANDWIDTH: lambda data: self._set("bandwidth", data),
+            COMMAND_GET_BANDWIDTH: lambda data: bytes((self.bandwidth,)),
+            COMMAND_SET_TX_POWER: lambda data: self._set("tx_power", data),
+            COMMAND_GET_TX_POWER: lambda data: bytes((self.tx_power,)),
+            COMMAND_GET_STATUS: lambda data: self.status().to_bytes(2, "little"),
+            COMMAND_SET_STEP: self._set_step,
+            COMMAND_GET_STEP: lambda data: encode_bcd(self.step),
+        }
+
+    # -----------------------------------------------------------------------------
+    def rssi(self, frequency=None):
+        """
+        RSSI grezzo: rumore di fondo più il contributo dei segnali vicini alla frequenza.
+        """
+        if frequency is None:
+            frequency = self.frequency
+        level = self.noise_floor + self.random.uniform(-self.noise, self.noise)
+        for signal in self.signals:
+            level += signal.level_at(frequency)
+        return min(max(int(level), 0), 0xFFFF)
+
+    # -----------------------------------------------------------------------------
+    def status(self):
+        flags = 0
+        if self.monitor:
+            flags |= STATUS_MONITOR
+        if self.monitor or self.rssi() >= self.squelch:
+            flags |= STATUS_RX
+        return flags
+
+    # -----------------------------------------------------------------------------
+    def handle(self, frame):
+        """
+        Esegue un comando (frame completo FE FE E0 00 cmd ... FD) e restituisce il frame
+        di risposta, oppure None per i comandi senza risposta.
+        """
+        self.commands += 1
+        command = frame[4]
+        data = frame[5:-1]
+        handler = self._handlers.get(command)
+        if handler is None:
+            self.unknown += 1
+            return None
+        payload = handler(data)
+        if payload is None:
+            return None
+        return bytes((CIV_START_BYTE, CIV_START_BYTE, CIV_ADDRESS_COMPUTER, CIV_ADDRESS_RADIO, command)) + payload + bytes((CIV_END_BYTE,))
+
+    # -----------------------------------------------------------------------------
+    def _set(self, name, data):
+        if data:
+            setattr(self, name, data[0])
+
+    def _set_frequency(self, data):
+        self.frequency = decode_frequency(data)
+
+    def _set_step(self, data):
+        self.step = decode_frequency(data)
+
+    def _set_monitor(self, data):
+        self.monitor = not self.monitor
+
+
+#-------------------------------------------------------------------------------------------------------------------------
+# Porta virtuale
+#-------------------------------------------------------------------------------------------------------------------------
+#
+class PtySimulator:
+    """
+    Espone un RadioSimulator su un pseudo-terminale.
+
+    latency:    ritardo (s) tra la ricezione di un comando e la risposta.
+    jitter:     variazione casuale massima (s) aggiunta alla latenza.
+    error_rate: probabilità per byte di inviare un byte alterato (un bit invertito).
+    link:       percorso opzionale di un collegamento simbolico al pty (nome di porta stabile).
+    """
+
+    def __init__(self, radio=None, latency=0.005, jitter=0.0, error_rate=0.0, link=None):
+        import tty
+
+        self.radio = radio if radio is not None else RadioSimulator()
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.link = link
+
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.corrupted = 0
+
+        self.master, self._slave = os.openpty()
+        tty.setraw(self._slave)             # Nessuna eco né conversione dei caratteri
+        self.port = os.ttyname(self._slave)
+        if link:
+            if os.path.lexists(link):
+                os.remove(link)
+            os.symlink(self.port, link)
+
+        self._parser = FrameParser(local_address=CIV_ADDRESS_RADIO, remote_address=CIV_ADDRESS_COMPUTER)
+        self._replies = []                  # heap (istante di invio, sequenza, frame)
+        self._sequence = 0
+        self._last_due = 0.0
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._threads = []
+
+    # -----------------------------------------------------------------------------
+    def start(self):
+        for target in (self._read_loop, self._write_loop):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    # -----------------------------------------------------------------------------
+    def stop(self):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify()
+        if self.link and os.path.islink(self.link):
+            os.remove(self.link)
+
+    # -----------------------------------------------------------------------------
+    def _read_loop(self):
+        import select
+
+        while not self._stop.is_set():
+            ready, _, _ = select.select([self.master], [], [], 0.2)
+            if not ready:
+                continue
+            try:
+                data = os.read(self.master, 4096)
+            except OSError:
+                break
+            self.bytes_in += len(data)
+            now = time.perf_counter()
+            for frame in self._parser.feed(data):
+                reply = self.radio.handle(frame)
+                if reply is not None:
+                    self._schedule(reply, now)
+
+    # -----------------------------------------------------------------------------
+    def _schedule(self, reply, now):
+        due = now + self.latency + (self.radio.random.uniform(0, self.jitter) if self.jitter else 0.0)
+        with self._cond:
+            # Le risposte non si sorpassano: la radio reale risponde in ordine
+            due = max(due, self._last_due)
+            self._last_due = due
+            heapq.heappush(self._replies, (due, self._sequence, reply))
+            self._sequence += 1
+            self._cond.notify()
+
+    # -----------------------------------------------------------------------------
+    def _write_loop(self):
+        while not self._stop.is_set():
+            with self._cond:
+                if not self._replies:
+                    self._cond.wait(0.2)
+                    continue
+                delay = self._replies[0][0] - time.perf_counter()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                # Tutte le risposte già scadute partono con un'unica scrittura
+                batch = bytearray()
+                now = time.perf_counter()
+                while self._replies and self._replies[0][0] <= now:
+                    batch += heapq.heappop(self._replies)[2]
+
+            if self.error_rate:
+                self._corrupt(batch)
+            try:
+                os.write(self.master, batch)
+            except OSError:
+                break
+            self.bytes_out += len(batch)
+
+    # -----------------------------------------------------------------------------
+    def _corrupt(self, batch):
+        rnd = self.radio.random
+        for i in range(len(batch)):
+            if rnd.random() < self.error_rate:
+                batch[i] ^= 1 << rnd.randrange(8)
+                self.corrupted += 1
+
+    # -----------------------------------------------------------------------------
+    def stats(self):
+        return {
+            "commands": self.radio.commands,
+            "unknown": self.radio.unknown,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "corrupted": self.corrupted,
+            "discarded": self._parser.discarded_bytes,
+        }
+
+
+# -----------------------------------------------------------------------------
+def _main(argv):
+    parser = argparse.ArgumentParser(description="Radio BK4819 CI-V virtuale su pty")
+    parser.add_argument("--latency", type=float, default=0.005, help="latenza delle risposte (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="jitter massimo delle risposte (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="probabilità di errore per byte")
+    parser.add_argument("--signal", action="append", default=[], metavar="FREQ:LIVELLO[:LARGHEZZA]",
+                        help="segnale sintetico (ripetibile)")
+    parser.add_argument("--noise-floor", type=int, default=20, help="RSSI grezzo in assenza di segnale")
+    parser.add_argument("--seed", type=int, default=None, help="seme del generatore casuale")
+    parser.add_argument("--link", default=None, help="collegamento simbolico al pty")
+    args = parser.parse_args(argv[1:])
+
+    if not hasattr(os, "openpty"):
+        print("Il simulatore richiede un sistema con pseudo-terminali (Linux/macOS)")
+        return 1
+
+    radio = RadioSimulator([Signal.parse(s) for s in args.signal], noise_floor=args.noise_floor, seed=args.seed)
+    sim = PtySimulator(radio, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, link=args.link)
+    sim.start()
+    print(f"Radio virtuale su {args.link or sim.port}  (Ctrl+C per terminare)")
+
+    try:
+        while True:
+            time.sleep(5)
+            print(sim.stats())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sim.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main(sys.argv))
@@ -0,0 +1,364 @@
+# *
+# * Project Name: Radio User Interface
+# * File: civ_sweep.py
+# *
+# * Copyright (C) 2024 Fabrizio Palumbo (IU0IJV)
+# *
+# * This program is distributed under the terms of the MIT license.
+# * You can obtain a copy of the license at:
+# * https://opensource.org/licenses/MIT
+# *
+# * DESCRIPTION:
+# * Motore di scansione dello spettro guidato dal PC (pulsante SCAN).
+# *
+# * NOTES:
+# * - Per ogni punto: COMMAND_SET_FREQUENCY, attesa del tempo di permanenza (dwell),
+# *   COMMAND_GET_RSSI.
+# * - Sintonia e misura sono in pipeline: la richiesta RSSI del punto N e la sintonia del
+# *   punto N+1 partono nella stessa scrittura (la radio esegue i comandi in ordine), e le
+# *   risposte vengono associate ai punti in ordine di arrivo. Il limite è solo il dwell.
+# * - I risultati sono in array compatti (frequenza uint32, RSSI uint16).
+# * - Oltre a un intervallo start/stop/step si può scandire un elenco di frequenze
+# *   (scansione delle memorie), con il modo di ciascun canale: il cambio di modo viaggia
+# *   nella stessa scrittura della sintonia e solo quando cambia rispetto al punto precedente.
+# * - Uso senza interfaccia:  python civ_sweep.py <porta> <inizio Hz> <fine Hz> <step Hz> [dwell s]
+
+import array
+import collections
+import sys
+import threading
+import time
+
+from civ_codec import COMMAND_SET_FREQUENCY, COMMAND_SET_MODE, COMMAND_GET_RSSI, encode_frequency
+
+
+#-------------------------------------------------------------------------------------------------------------------------
+# Buffer dei risultati
+#-------------------------------------------------------------------------------------------------------------------------
+#
+class SweepBuffer:
+    """
+    Risultati di una scansione: frequenze e RSSI grezzo in array preallocati.
+    """
+
+    def __init__(self, frequencies):
+        self.frequencies = array.array('I', frequencies)
+        self.rssi = array.array('H', bytes(2 * len(self.frequencies)))
+        self.valid = bytearray(len(self.frequencies))   # 1 = punto misurato in questa scansione
+
+    # -----------------------------------------------------------------------------
+    @classmethod
+    def from_range(cls, start_hz, stop_hz, step_hz):
+        return cls(range(start_hz, stop_hz + 1, step_hz))
+
+    # -----------------------------------------------------------------------------
+    def __len__(self):
+        return len(self.frequencies)
+
+    # -----------------------------------------------------------------------------
+    def clear(self):
+        self.valid[:] = bytes(len(self.valid))
+
+    # -----------------------------------------------------------------------------
+    def peak(self):
+        """Restituisce (frequenza, RSSI) del punto più forte."""
+        if not len(self.rssi):
+            return None
+        index = max(range(len(self.rssi)), key=self.rssi.__getitem__)
+        return self.frequencies[index], self.rssi[index]
+
+
+#-------------------------------------------------------------------------------------------------------------------------
+# Motore di scansione
+#-------------------------------------------------------------------------------------------------------------------------
+#
+class SweepEngine:
+    """
+    Scansione start/stop/step con misura dell'RSSI in ogni punto.
+
+    write:         funzione write([(command, data), ...]) che scrive subito i comandi in
+                   un'unica scrittura (es. CommandTransmitter.send_now).
+    dwell:         tempo di permanenza (s) tra la sintonia e la misura.
+    window:        numero massimo di misure in attesa di risposta.
+    reply_timeout: attesa massima (s) di una risposta prima di considerarla persa.
+    threshold:     funzione che restituisce la soglia RSSI grezza per lo stop su segnale;
+                   una soglia 0 (squelch tutto aperto) o None disattiva lo stop su segnale.
+    on_point:      callback(indice, frequenza, rssi) per ogni punto misurato.
+    on_sweep:      callback(frequenze, rssi) al termine di ogni scansione (rssi è una copia).
+    on_stop:       callback(motivo, frequenza) alla fine ("end", "stop", "signal").
+
+    Le risposte COMMAND_GET_RSSI vanno passate a rssi_received(). Durante la scansione
+    nessun altro deve interrogare l'RSSI, altrimenti le risposte non sono più associabili.
+    """
+
+    def __init__(self, write, dwell=0.01, window=16, reply_timeout=0.5, threshold=None,
+                 on_point=None, on_sweep=None, on_stop=None):
+        self.write = write
+        self.dwell = dwell
+        self.window = window
+        self.reply_timeout = reply_timeout
+        self.threshold = threshold
+        self.on_point = on_point
+        self.on_sweep = on_sweep
+        self.on_stop = on_stop
+
+        self.buffer = None
+        self.modes = None               # Modo di ogni punto (scansione delle memorie) oppure None
+        self.sweeps = 0
+        self.points = 0                 # Punti misurati dall'avvio
+        self.lost = 0                   # Risposte RSSI mai arrivate
+        self.ignored = 0                # Risposte RSSI arrivate senza una misura in attesa
+        self.points_per_second = 0.0
+        self.signal = None              # (frequenza, rssi) che ha fermato la scansione
+        self.signal_index = None        # Indice del punto con il segnale
+
+        self._outstanding = collections.deque()
+        self._cond = threading.Condition()
+        self._resume = threading.Event()
+        self._resume.set()
+        self._stop = False
+        self._stop_on_signal = False
+        self._thread = None
+        self._t_start = 0.0
+        self._mode = None
+
+    # -----------------------------------------------------------------------------
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def paused(self):
+        return not self._resume.is_set()
+
+    # -----------------------------------------------------------------------------
+    def start(self, start_hz, stop_hz, step_hz, repeat=False, stop_on_signal=False):
+        if step_hz <= 0 or stop_hz < start_hz:
+            raise ValueError("Intervallo di scansione non valido")
+        return self._start(SweepBuffer.from_range(start_hz, stop_hz, step_hz), None, repeat, stop_on_signal)
+
+    # -----------------------------------------------------------------------------
+    def start_list(self, frequencies, modes=None, repeat=False, stop_on_signal=False):
+        """
+        Scansione di un elenco di frequenze (es. canali di memoria filtrati).
+        modes: codice COMMAND_SET_MODE per ogni frequenza (None = modo invariato).
+        """
+        if not frequencies:
+            raise ValueError("Nessuna frequenza da scandire")
+        if modes is not None and len(modes) != len(frequencies):
+            raise ValueError("Numero di modi diverso dal numero di frequenze")
+        return self._start(SweepBuffer(frequencies), modes, repeat, stop_on_signal)
+
+    # -----------------------------------------------------------------------------
+    def _start(self, buffer, modes, repeat, stop_on_signal):
+        if self.running:
+            self.stop()
+            self._thread.join()
+
+        self.buffer = buffer
+        self.modes = modes
+        self.sweeps = 0
+        self.points = 0
+        self.lost = 0
+        self.signal = None
+        self._outstanding.clear()
+        self._stop = False
+        self._stop_on_signal = stop_on_signal
+        self._resume.set()
+        self._thread = threading.Thread(target=self._run, args=(repeat,), daemon=True)
+        self._thread.start()
+        return self._thread
+
+    # -----------------------------------------------------------------------------
+    def stop(self):
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        self._resume.set()
+
+    # -----------------------------------------------------------------------------
+    def pause(self):
+        self._resume.clear()
+
+    # -----------------------------------------------------------------------------
+    def resume(self):
+        self._resume.set()
+
+    # -----------------------------------------------------------------------------
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    # -----------------------------------------------------------------------------
+    def rssi_received(self, raw):
+        """
+        Associa una risposta RSSI alla misura più vecchia in attesa.
+        """
+        with self._cond:
+            if not self._outstanding:
+                self.ignored += 1
+                return
+            index = self._outstanding.popleft()
+            buffer = self.buffer
+            buffer.rssi[index] = raw
+            buffer.valid[index] = 1
+            self.points += 1
+            elapsed = time.perf_counter() - self._t_start
+            if elapsed > 0:
+                self.points_per_second = self.points / elapsed
+
+            threshold = self.threshold() if (self._stop_on_signal and self.threshold) else None
+            # Con soglia 0 ogni punto supererebbe la soglia: nessuno stop su segnale
+            if threshold and raw >= threshold and self.signal is None:
+                self.signal = (buffer.frequencies[index], raw)
+                self.signal_index = index
+                self._stop = True
+            self._cond.notify_all()
+
+        if self.on_point is not None:
+            self.on_point(index, buffer.frequencies[index], raw)
+
+    # -----------------------------------------------------------------------------
+    def stats(self):
+        return {
+            "sweeps": self.sweeps,
+            "points": self.points,
+            "points_per_second": round(self.points_per_second, 1),
+            "lost": self.lost,
+            "ignored": self.ignored,
+        }
+
+    # -----------------------------------------------------------------------------
+    def _wait_slot(self, limit):
+        """
+        Attende che le misure in attesa scendano sotto `limit`; le risposte scadute sono perse.
+        """
+        with self._cond:
+            while len(self._outstanding) > limit and not (self._stop and limit > 0):
+                if not self._cond.wait(self.reply_timeout) and self._outstanding:
+                    self._outstanding.popleft()
+                    self.lost += 1
+
+    # -----------------------------------------------------------------------------
+    def _tune(self, index):
+        """
+        Comandi di sintonia di un punto: frequenza e, se cambia, modo.
+        """
+        commands = [(COMMAND_SET_FREQUENCY, encode_frequency(self.buffer.frequencies[index]))]
+        if self.modes is not None:
+            mode = self.modes[index]
+            if mode is not None and mode != self._mode:
+                commands.append((COMMAND_SET_MODE, [mode]))
+                self._mode = mode
+        return commands
+
+    # -----------------------------------------------------------------------------
+    def _run(self, repeat):
+        buffer = self.buffer
+        frequencies = buffer.frequencies
+        count = len(frequencies)
+        self._t_start = time.perf_counter()
+        self._mode = None               # Ultimo modo inviato alla radio
+
+        # Sintonia del primo punto
+        self.write(self._tune(0))
+        last_tune = time.perf_counter()
+
+        reason = "end"
+        while True:
+            buffer.clear()
+            index = 0
+            while index < count and not self._stop:
+                if not self._resume.is_set():
+                    # Pausa: attende le risposte in volo, poi riprende risintonizzando il punto corrente
+                    self._wait_slot(0)
+                    self._resume.wait()
+                    if self._stop:
+                        break
+                    self.write(self._tune(index))
+                    last_tune = time.perf_counter()
+
+                self._wait_slot(self.window - 1)
+                if self._stop:
+                    break
+
+                # Attende il dwell dall'ultima sintonia
+                remaining = self.dwell - (time.perf_counter() - last_tune)
+                if remaining > 0:
+                    time.sleep(remaining)
+
+                # Misura del punto corrente e, nella stessa scrittura, sintonia del successivo
+                commands = [(COMMAND_GET_RSSI, ())]
+                following = index + 1
+                if following < count:
+                    commands.extend(self._tune(following))
+                elif repeat:
+                    commands.extend(self._tune(0))
+
+                with self._cond:
+                    self._outstanding.append(index)
+                self.write(commands)
+                last_tune = time.perf_counter()
+                index += 1
+
+            # Attende le ultime risposte della scansione
+            self._wait_slot(0)
+
+            if self._stop:
+                reason = "signal" if self.signal is not None else "stop"
+                break
+
+            self.sweeps += 1
+            if self.on_sweep is not None:
+                self.on_sweep(frequencies, array.array('H', buffer.rssi))
+            if not repeat:
+                break
+
+        # Con lo stop su segnale la radio viene riportata sulla frequenza del segnale
+        frequency = None
+        if self.signal is not None:
+            frequency = self.signal[0]
+            self.write(self._tune(self.signal_index))
+
+        if self.on_stop is not None:
+            self.on_stop(reason, frequency)
+
+
+# -----------------------------------------------------------------------------
+def _main(argv):
+    import serial
+    from civ_receiver import SerialReceiver
+    from civ_transmitter import CommandTransmitter
+
+    if len(argv) < 5:
+        print("Uso: python civ_sweep.py <porta> <inizio Hz> <fine Hz> <step Hz> [dwell s]")
+        return 1
+
+    port, start_hz, stop_hz, step_hz = argv[1], int(argv[2]), int(argv[3]), int(argv[4])
+    dwell = float(argv[5]) if len(argv) > 5 else 0.01
+
+    ser = serial.Serial(port=port, baudrate=115200, timeout=0.1)
+    transmitter = CommandTransmitter(lambda: ser)
+    engine = SweepEngine(transmitter.send_now, dwell=dwell)
+
+    def on_frame(frame, t_rx):
+        if frame[4] == COMMAND_GET_RSSI and len(frame) >= 8:
+            engine.rssi_received(frame[5] + frame[6] * 256)
+
+    receiver = SerialReceiver(lambda: ser, on_frame=on_frame)
+    receiver.start()
+
+    engine.start(start_hz, stop_hz, step_hz)
+    engine.join()
+    receiver.stop()
+    receiver.join(ser.timeout + 0.5)
+    ser.close()
+
+    for frequency, rssi, valid in zip(engine.buffer.frequencies, engine.buffer.rssi, engine.buffer.valid):
+        print(f"{frequency}\t{rssi if valid else ''}")
+    print(f"# {engine.stats()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main(sys.argv))
@@ -0,0 +1,187 @@
+# *
+# * Project Name: Radio User Interface
+# * File: civ_transmitter.py
+# *
+# * Copyright (C) 2024 Fabrizio Palumbo (IU0IJV)
+# *
+# * This program is distributed under the terms of the MIT license.
+# * You can obtain a copy of the license at:
+# * https://opensource.org/licenses/MIT
+# *
+# * DESCRIPTION:
+# * Coda di trasmissione CI-V con coalescenza dei comandi SET.
+# *
+# * NOTES:
+# * - Per ogni opcode "coalescibile" resta in coda solo l'ultimo valore non ancora inviato:
+# *   un trascinamento di uno slider produce pochi frame invece di decine.
+# * - I frame pronti vengono inviati con un'unica ser.write da un thread dedicato,
+# *   quindi il thread Tk non si blocca mai sulla seriale.
+
+import itertools
+import threading
+import time
+import serial
+
+from civ_codec import encode_frame
+from civ_capture import DIRECTION_TX
+
+
+#-------------------------------------------------------------------------------------------------------------------------
+# Trasmettitore
+#-------------------------------------------------------------------------------------------------------------------------
+#
+class CommandTransmitter:
+    """
+    Coda di uscita dei comandi verso la radio.
+
+    port_getter:  funzione che restituisce l'oggetto serial.Serial corrente oppure None.
+    coalesce:     insieme degli opcode SET per cui conta solo l'ultimo valore in attesa.
+    min_interval: pausa minima (s) tra due scritture; i comandi che arrivano nel frattempo
+                  vengono accorpati nella scrittura successiva.
+    capture:      CaptureWriter opzionale su cui registrare i byte scritti sulla porta.
+    on_error:     callback opzionale(eccezione) per gli errori di scrittura.
+    """
+
+    def __init__(self, port_getter, coalesce=(), min_interval=0.02, capture=None, on_error=None):
+        self.port_getter = port_getter
+        self.coalesce = frozenset(coalesce)
+        self.min_interval = min_interval
+
+        self.frames_submitted = 0
+        self.frames_coalesced = 0       # Frame sostituiti da un valore più recente prima dell'invio
+        self.frames_sent = 0
+        self.frames_dropped = 0         # Frame scartati perché la porta non era aperta
+        self.batches = 0
+        self.bytes_sent = 0
+        self.sent_by_command = {}       # opcode -> frame inviati
+
+        self.capture = capture
+        self.on_error = on_error
+
+        self._pending = {}              # chiave -> frame, in ordine di inserimento
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()  # Serializza le scritture sulla porta
+        self._writing = False           # Una scrittura prelevata dalla coda è in corso
+        self._stop = False
+        self._thread = None
+
+    # -----------------------------------------------------------------------------
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop = False
+            self._thread = threading.Thread(target=self.run, daemon=True)
+            self._thread.start()
+        return self._thread
+
+    # -----------------------------------------------------------------------------
+    def stop(self):
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+
+    # -----------------------------------------------------------------------------
+    def submit(self, command, data=()):
+        """
+        Accoda un comando. Non blocca: la scrittura avviene nel thread di trasmissione.
+        """
+        frame = encode_frame(command, data)
+        with self._cond:
+            self.frames_submitted += 1
+            if command in self.coalesce:
+                if command in self._pending:
+                    self.frames_coalesced += 1
+                # Il valore più recente prende il posto di quello in attesa
+                self._pending[command] = frame
+            else:
+                self._pending[("seq", next(self._sequence))] = frame
+            self._cond.notify()
+
+    # -----------------------------------------------------------------------------
+    def send_now(self, commands):
+        """
+        Scrive subito, nel thread chiamante, una sequenza di comandi [(command, data), ...]
+        in un'unica ser.write, senza passare dalla coda né dalla coalescenza.
+        Serve a chi deve controllare con precisione ordine e tempi (es. la scansione).
+        Non chiamare dal thread Tk: la scrittura è bloccante.
+        """
+        frames = [encode_frame(command, data) for command, data in commands]
+        with self._cond:
+            self.frames_submitted += len(frames)
+        self._write(frames)
+
+    # -----------------------------------------------------------------------------
+    def flush(self, timeout=1.0):
+        """
+        Attende che tutti i comandi accodati siano stati scritti. Restituisce False allo scadere del timeout.
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending and not self._writing, timeout)
+
+    # -----------------------------------------------------------------------------
+    def pending(self):
+        with self._cond:
+            return len(self._pending)
+
+    # -----------------------------------------------------------------------------
+    def stats(self):
+        return {
+            "submitted": self.frames_submitted,
+            "coalesced": self.frames_coalesced,
+            "sent": self.frames_sent,
+            "dropped": self.frames_dropped,
+            "batches": self.batches,
+            "bytes": self.bytes_sent,
+        }
+
+    # -----------------------------------------------------------------------------
+    def run(self):
+        """
+        Ciclo del thread di trasmissione: preleva tutti i frame pronti e li scrive insieme.
+        """
+        while True:
+            with self._cond:
+                while not self._pending and not self._stop:
+                    self._cond.wait()
+                if self._stop:
+                    return
+                frames = list(self._pending.values())
+                self._pending.clear()
+                self._writing = True
+
+            self._write(frames)
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+
+            if self.min_interval:
+                time.sleep(self.min_interval)   # Finestra di coalescenza per i comandi successivi
+
+    # -----------------------------------------------------------------------------
+    def _write(self, frames):
+        port = self.port_getter()
+        if not (port and port.is_open):
+            self.frames_dropped += len(frames)
+            print("Porta seriale non aperta. Impossibile inviare il comando.")
+            return
+
+        batch = b"".join(frames)
+        with self._write_lock:
+            try:
+                port.write(batch)
+            except serial.SerialException as e:
+                self.frames_dropped += len(frames)
+                if self.on_error is not None:
+                    self.on_error(e)
+                else:
+                    print(f"Errore scrittura seriale: {e}")
+                return
+
+            self.frames_sent += len(frames)
+            self.batches += 1
+            self.bytes_sent += len(batch)
+            counts = self.sent_by_command
+            for frame in frames:
+                counts[frame[4]] = counts.get(frame[4], 0) + 1
+            if self.capture is not None:
+                self.capture.write(DIRECTION_TX, batch)
@@ -0,0 +1,268 @@
+# *
+# * Project Name: Radio User Interface
+# * File: connection_manager.py
+# *
+# * Copyright (C) 2024 Fabrizio Palumbo (IU0IJV)
+# *
+# * This program is distributed under the terms of the MIT license.
+# * You can obtain a copy of the license at:
+# * https://opensource.org/licenses/MIT
+# *
+# * DESCRIPTION:
+# * Gestione della connessione seriale in background: collegamento a caldo e riconnessione.
+# *
+# * NOTES:
+# * - Apertura, chiusura e verifica delle porte avvengono in un thread dedicato: chi chiede
+# *   una connessione (ad esempio il thread Tk) non attende mai la seriale.
+# * - L'elenco delle porte viene riletto periodicamente: arrivi e rimozioni dei dispositivi
+# *   sono segnalati con on_ports(elenco).
+# * - Una porta è considerata della radio solo se risponde a COMMAND_GET_STATUS.
+# * - Se la porta scompare o dà errori viene chiusa subito e riaperta appena possibile, con
+# *   attese crescenti tra i tentativi. Alla riconnessione lo stato in memoria del nucleo
+# *   viene conservato e lo schedulatore rilegge subito tutti i parametri.
+# * - Senza una porta indicata (connect(None)) vengono provate tutte le porte disponibili.
+
+import os
+import threading
+import time
+
+from civ_codec import COMMAND_GET_STATUS
+
+
+DISCONNECTED = "disconnected"
+CONNECTING = "connecting"
+CONNECTED = "connected"
+LOST = "lost"
+
+
+#-------------------------------------------------------------------------------------------------------------------------
+# Gestore della connessione
+#-------------------------------------------------------------------------------------------------------------------------
+#
+class ConnectionManager:
+    """
+    Mantiene aperta la porta della radio di un RadioCore.
+
+    poller:         PollScheduler opzionale da far ripartire dopo ogni connessione.
+    scan_interval:  intervallo (s) tra due letture dell'elenco delle porte.
+    backoff:        (attesa iniziale, attesa massima) in secondi tra due tentativi falliti.
+    probe_timeout:  attesa massima (s) della risposta a COMMAND_GET_STATUS.
+    on_state:       callback(stato, porta) a ogni cambio di stato (dal thread del gestore).
+    on_ports:       callback(elenco delle porte) quando cambia l'elenco dei dispositivi.
+    """
+
+    def __init__(self, radio, poller=None, scan_interval=1.0, backoff=(0.5, 8.0), probe_timeout=0.3,
+                 on_state=None, on_ports=None):
+        self.radio = radio
+        self.poller = poller
+        self.scan_interval = scan_interval
+        self.backoff_min, self.backoff_max = backoff
+        self.probe_timeout = probe_timeout
+        self.on_state = on_state
+        self.on_ports = on_ports
+
+        self.state = DISCONNECTED
+        self.port = None                # Porta attualmente aperta o da riaprire
+        self.ports = []                 # Ultimo elenco delle porte disponibili
+        self.connects = 0
+        self.reconnects = 0
+        self.failures = 0
+        self.losses = 0
+
+        self._target = None             # Porta richiesta (None = ricerca automatica)
+        self._wanted = False            # Una connessione è stata richiesta
+        self._delay = self.backoff_min
+        self._next_attempt = 0.0
+        self._error = None              # Errore di lettura o scrittura segnalato dal nucleo
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread = None
+
+        # Solo il gestore apre la porta: un comando inviato durante una disconnessione non blocca
+        radio.auto_connect = False
+
+        # Gli errori della porta arrivano dai thread di lettura e scrittura del nucleo
+        radio.receiver.on_error = self.port_error
+        radio.transmitter.on_error = self.port_error
+
+    # -----------------------------------------------------------------------------
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop = False
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self._thread
+
+    # -----------------------------------------------------------------------------
+    def stop(self):
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(self.probe_timeout + 1.0)
+
+    # -----------------------------------------------------------------------------
+    def connect(self, port=None):
+        """
+        Richiede la connessione a una porta (None = prima porta che risponde). Non blocca.
+        """
+        with self._cond:
+            self._target = port
+            self._wanted = True
+            self._delay = self.backoff_min
+            self._next_attempt = 0.0
+            self._cond.notify()
+
+    # -----------------------------------------------------------------------------
+    def disconnect(self):
+        with self._cond:
+            self._wanted = False
+            self._cond.notify()
+
+    # -----------------------------------------------------------------------------
+    def port_error(self, error):
+        """
+        Segnalazione di un errore sulla porta aperta (dai thread del nucleo).
+        """
+        with self._cond:
+            if self.state == CONNECTED and self._error is None:
+                self._error = error
+                self._cond.notify()
+
+    # -----------------------------------------------------------------------------
+    def stats(self):
+        return {
+            "state": self.state,
+            "port": self.port,
+            "connects": self.connects,
+            "reconnects": self.reconnects,
+            "failures": self.failures,
+            "losses": self.losses,
+        }
+
+    # -----------------------------------------------------------------------------
+    def _set_state(self, state):
+        if state == self.state:
+            return
+        self.state = state
+        if self.on_state is not None:
+            try:
+                self.on_state(state, self.port)
+            except Exception as e:
+                print(f"Errore nella notifica dello stato della connessione: {e}")
+
+    # -----------------------------------------------------------------------------
+    def _scan_ports(self):
+        import serial.tools.list_ports
+
+        ports = sorted(port.device for port in serial.tools.list_ports.comports())
+        if ports != self.ports:
+            self.ports = ports
+            if self.on_ports is not None:
+                try:
+                    self.on_ports(list(ports))
+                except Exception as e:
+                    print(f"Errore nella notifica delle porte: {e}")
+        return ports
+
+    # -----------------------------------------------------------------------------
+    def _present(self, port, ports):
+        # Le porte virtuali (pty) non compaiono tra quelle rilevate: basta che il file esista
+        return port in ports or os.path.exists(port)
+
+    # -----------------------------------------------------------------------------
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._stop:
+                    break
+                error, self._error = self._error, None
+                wanted, target = self._wanted, self._target
+
+            ports = self._scan_ports()
+            radio = self.radio
+
+            if self.state == CONNECTED:
+                if not wanted:
+                    radio.close()
+                    self.port = None
+                    self._set_state(DISCONNECTED)
+                elif target is not None and target != self.port:
+                    # Richiesta un'altra porta: si chiude quella attuale e si prova subito la nuova
+                    radio.close()
+                    self._next_attempt = 0.0
+                    self._set_state(CONNECTING)
+                elif error is not None or not radio.is_open or not self._present(self.port, ports):
+                    # Dispositivo rimosso o errore di I/O: la porta viene chiusa e riaperta più tardi
+                    self.losses += 1
+                    print(f"Connessione persa su {self.port}: {error or 'dispositivo rimosso'}")
+                    radio.close()
+                    self._next_attempt = time.monotonic() + self._delay
+                    self._set_state(LOST)
+            elif wanted:
+                if self.state == DISCONNECTED:
+                    self._set_state(CONNECTING)
+                if time.monotonic() >= self._next_attempt:
+                    self._attempt(target, ports)
+            elif self.state != DISCONNECTED:
+                radio.close()
+                self._set_state(DISCONNECTED)
+
+            with self._cond:
+                if self._stop:
+                    break
+                if self._error is None and self._wanted == wanted and self._target == target:
+                    wait = self.scan_interval
+                    if wanted and self.state != CONNECTED:
+                        wait = max(0.05, min(wait, self._next_attempt - time.monotonic()))
+                    self._cond.wait(wait)
+
+    # -----------------------------------------------------------------------------
+    def _attempt(self, target, ports):
+        """
+        Prova la porta richiesta oppure, in ricerca automatica, tutte quelle disponibili.
+        """
+        if target is not None:
+            candidates = [target]
+        else:
+            # Ricerca automatica: prima la porta usata l'ultima volta
+            candidates = ([self.port] if self.port in ports else []) + [p for p in ports if p != self.port]
+        for port in candidates:
+            if not self._present(port, ports):
+                continue
+            reconnect = port == self.port
+            if self._open(port, keep_state=reconnect):
+                with self._cond:
+                    self._error = None          # Errori della porta precedente, ormai chiusa
+                if reconnect:
+                    self.reconnects += 1
+                self.connects += 1
+                self.port = port
+                self._delay = self.backoff_min
+                self._set_state(CONNECTED)
+                if self.poller is not None:
+                    # Rilettura immediata di tutti i parametri: lo stato in memoria viene confermato
+                    for name in list(self.poller.tasks):
+                        self.poller.request_now(name)
+                return True
+
+        self.failures += 1
+        self._next_attempt = time.monotonic() + self._delay
+        self._delay = min(self._delay * 2, self.backoff_max)
+        return False
+
+    # -----------------------------------------------------------------------------
+    def _open(self, port, keep_state):
+        """
+        Apre la porta e verifica che risponda una radio (COMMAND_GET_STATUS).
+        """
+        radio = self.radio
+        if not radio.connect(port, keep_state=keep_state):
+            return False
+        seen = radio.reply_count(COMMAND_GET_STATUS)
+        radio.transmitter.send_now([(COMMAND_GET_STATUS, ())])
+        if radio.wait_replies(COMMAND_GET_STATUS, seen + 1, self.probe_timeout):
+            return True
+        print(f"Nessuna risposta della radio su {port}")
+        radio.close()
+        return False
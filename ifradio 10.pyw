@@ -20,18 +20,36 @@
 # * - This implementation includes functions for initializing and controlling the BK4819 module by PC
 # * - Verify correct COM Port configuration before use.
 
-import sys
 import tkinter.ttk as ttk
 from tkinter.constants import *
 import tkinter as tk
-from tkinter import messagebox
 from tkinter import ttk
+import os
 import threading
-import serial
-import serial.tools.list_ports
 import time
-import queue
 import math
+import collections
+import argparse
+import sqlite3
+
+from civ_codec import decode_bcd
+from radio_session import SessionManager
+from connection_manager import ConnectionManager, CONNECTED, LOST
+from ui_dispatcher import UiDispatcher
+from rssi_calibration import RssiCalibration
+from civ_sweep import SweepEngine
+from civ_dualwatch import DualWatch
+from telemetry_recorder import TelemetryRecorder
+from civ_capture import CaptureWriter, CaptureReplayer
+from channel_db import ChannelStore, DEFAULT_PATH as CHANNELS_FILE
+from activity_log import ActivityDetector, ActivityStore
+from auto_squelch import AutoSquelch
+from civ_server import ControlServer, DEFAULT_PORT as SERVER_PORT
+from metrics import MetricsRegistry, MetricsServer, register_link_metrics, DEFAULT_PORT as METRICS_PORT
+from panel_spec import PanelBuilder, widget, IDLE, ON_USE
+
+
+STARTUP_TIME = time.perf_counter()     # Riferimento per la misura del tempo al primo disegno
 
 
 COLOR_BACKGROUND = "#959595"
@@ -53,35 +71,14 @@ COLOR_DISPLAY_FG = "#efefef"
 COLOR_DISPLAY_BG = "#404040"
 COLOR_SLIDE_BG = "#898989"
 COLOR_LED_GREEN = "#00DD00"
+COLOR_LED_RED = "#DD0000"
 
 
-# Definizione degli indirizzi del protocollo CI-V
-CIV_START_BYTE = 0xFE
-CIV_END_BYTE = 0xFD
-CIV_ADDRESS_RADIO = 0xE0        # Indirizzo radio di destinazione
-CIV_ADDRESS_COMPUTER = 0x00     # Indirizzo del computer
-
-COMMAND_SET_FREQUENCY = 0x05    # Comando per impostare la frequenza
-COMMAND_GET_FREQUENCY = 0x03    # Comando per leggere la frequenza
-COMMAND_SET_MODE = 0x06         # Comando per impostare la modalità operativa
-COMMAND_SET_SQUELCH = 0x14      # Comando per impostare lo squelch
-COMMAND_GET_SQUELCH = 0x15      # Comando per leggere il livello dello squelch
-COMMAND_SET_AGC = 0x16          # Comando per impostare il tipo di AGC
-
-COMMAND_GET_RSSI = 0x19         # Comando per ottenere il valore dello S-meter
-COMMAND_SET_MONITOR = 0x1A      # comando per attivare o disattivare la funzioen monitor
-COMMAND_SET_RFGAIN = 0x1C       # comando per settare il valore di RFGain
-COMMAND_GET_RFGAIN = 0x1D       # comando per settare il valore di RFGain
-COMMAND_SET_BANDWIDTH = 0x1E
-COMMAND_GET_BANDWIDTH = 0x1F
-COMMAND_SET_TX_POWER  = 0x20
-COMMAND_GET_TX_POWER  = 0x21
-COMMAND_GET_STATUS = 0x22       # Comando per ottenere lo stato della radio
-
-COMMAND_SET_STEP = 0x23
-COMMAND_GET_STEP = 0x24
-          
-COMMAND_SET_SCAN = 0
+# Protocollo CI-V: codici dei comandi usati dal pannello (definiti in civ_codec)
+from civ_codec import (
+    COMMAND_GET_FREQUENCY, COMMAND_GET_SQUELCH, COMMAND_GET_RSSI, COMMAND_SET_MONITOR,
+    COMMAND_GET_RFGAIN, COMMAND_GET_BANDWIDTH, COMMAND_GET_STATUS,
+)
 
 AGC_AUTO = 0
 AGC_MAN = 1
@@ -116,29 +113,64 @@ fontSTS = 10
 monstat = 0
 vfoattivo = 0
 
+current_frequency = 0           # Ultima frequenza impostata o letta (Hz)
+current_step = 12500            # Step corrente (Hz)
+current_squelch = 0             # Livello di squelch, soglia per lo stop su segnale della scansione
+current_mode = 0                # Modo corrente (indice in modulazione)
+
+SCAN_HALF_SPAN = 50             # Punti di scansione sopra e sotto la frequenza corrente
+SCAN_DWELL = 0.02               # Tempo di permanenza su ogni punto (s)
+WATERFALL_HISTORY = 96          # Righe (scansioni) conservate nel waterfall
+WATERFALL_LABELS = 12           # Altezza (px) della riga con le frequenze sotto il waterfall
+DUAL_WATCH_DWELL = 0.03         # Permanenza su ogni VFO durante il doppio ascolto (s)
+vfo_b_frequency = 0             # Frequenza del VFO B (copiata con FCOPY o da --vfo-b)
+memory_scan_tag = None          # Etichetta dei canali per la scansione delle memorie (None = tutti)
+
 Led_activity_timeout = 0        # Timeout di 5 secondi di inattività della seriale
 
 
-# Configurazione della porta seriale
-try:
-    ser = serial.Serial(
-        port=None,            # Modifica con la porta corretta
-        baudrate=115200,
-        bytesize=serial.EIGHTBITS,
-        parity=serial.PARITY_NONE,
-        stopbits=serial.STOPBITS_ONE,
-        timeout=0.1
-    )
-except serial.SerialException as e:
-    root = tk.Tk()
-    root.withdraw()             # Nasconde la finestra principale
-    messagebox.showerror("Errore Porta Seriale", f"Impossibile aprire la porta seriale: {e}")
-    sys.exit(1)                 # Esci con errore
+# Parametri interrogati dal pannello: (nome, frequenza obiettivo Hz, frequenza minima Hz)
+PANEL_POLLING = (
+    ("rssi", 10, 1),
+    ("status", 10, 1),
+    ("squelch", 1, None),
+    ("rfgain", 1, None),
+    ("bandwidth", 1, None),
+    ("frequency", 0.2, None),
+)
+
+# Sessioni radio: la principale è controllata dal pannello completo, le altre (--extra-port)
+# da viste compatte. Ogni sessione ha nucleo (porta, parser, stato) e schedulatore propri.
+sessions = SessionManager()
+session = sessions.add(name="A", polling=PANEL_POLLING)
+
+# Nucleo della radio principale (protocollo, trasporto e stato): la porta viene aperta solo
+# quando l'utente la seleziona. Il pannello è uno dei consumatori dei frame ricevuti.
+radio = session.radio
 
 #-------------------------------------------------------------------------------------------------------------------------
 # Funzioni Threading
 #-------------------------------------------------------------------------------------------------------------------------
-data_queue = queue.Queue()
+
+# Aggiornamenti grafici: l'ultimo valore per widget, applicato al massimo UI_MAX_FPS volte al secondo
+UI_MAX_FPS = 30
+ui = UiDispatcher(fps=UI_MAX_FPS)
+
+# Registrazione di RSSI, frequenza, squelch e stato (buffer in memoria, scaricato su file ogni 5 s)
+recorder = TelemetryRecorder()
+
+# Canali di memoria (SQLite, aperto al primo utilizzo). Il file predefinito è accanto al
+# programma e non viene creato dal pannello: senza archivio non si cercano nomi di canale.
+channels = ChannelStore(os.path.join(os.path.dirname(os.path.abspath(__file__)), CHANNELS_FILE))
+
+# Registro dell'attività: aperture dello squelch sul canale corrente -> eventi su SQLite.
+# Sospeso durante le scansioni e con il monitor attivo (squelch forzato aperto).
+activity = ActivityStore()
+detector = ActivityDetector(on_event=activity.record)
+
+# Squelch automatico: soglia = rumore di fondo stimato per banda + margine. Si attiva con un
+# clic sul titolo SQUELCH (o con --auto-squelch) e si disattiva muovendo lo slider.
+auto_squelch = AutoSquelch(lambda level: apply_auto_squelch(level))
 
 # -----------------------------------------------------------------------------
 # Thread per la gestione dei timeout
@@ -148,56 +180,30 @@ def led_timeout_manager():
     while True:
         if Led_activity_timeout > 0:
             Led_activity_timeout -= 1
-            root.after(5, lambda: radio_panel.update_led(COLOR_LED_GREEN))
+            ui.post("led", radio_panel.update_led, COLOR_LED_GREEN)
+        elif connection.state == LOST:
+            # Porta persa: il gestore della connessione sta ritentando
+            ui.post("led", radio_panel.update_led, COLOR_LED_RED)
         else:
             # Spegni il LED se il timeout è scaduto
-            root.after(5, lambda: radio_panel.update_led(COLOR_ENTRY_BG))
+            ui.post("led", radio_panel.update_led, COLOR_ENTRY_BG)
 
         time.sleep(1)  # Attendi 1 secondo
 
 # -----------------------------------------------------------------------------
-# Thread per la lettura dalla porta seriale
+# Lettura dalla porta seriale: il ricevitore del nucleo legge a blocchi e il suo thread
+# di smistamento chiama on_civ_frame per ogni frame completo
 
-def read_from_port():
-    buffer = bytearray()
-    global ser
-    while True:
-        try:
-            if ser and ser.is_open:
-                while ser.in_waiting > 0:
-                    data = ser.read(1)  # Legge un byte alla volta
-                    buffer.append(data[0])
-                    if data[0] == 0xFD:  # Terminatore del messaggio
-                        # print(f"Pacchetto ricevuto: {buffer}")
-                        data_queue.put(buffer.copy())  # Aggiunge il pacchetto alla coda
-                        buffer.clear()  # Svuota il buffer per il prossimo pacchetto
-        except serial.SerialException as e:
-            print(f"Errore lettura seriale: {e}")
-        except Exception as e:
-            print(f"Errore generico in read_from_port: {e}")
-        time.sleep(0.1)
+receiver = radio.receiver
 
-        
 # -----------------------------------------------------------------------------
-# Thread per elaborare i dati dalla coda
-
-def process_data():
+def on_civ_frame(message):
     global Led_activity_timeout
-    while True:
-        if not data_queue.empty():
-            try:
-                # Ottieni il messaggio dalla coda senza bloccare
-                message = data_queue.get_nowait()
-                # Elabora il messaggio CI-V
-                process_civ_message(message)
-                # print(f"Pacchetto elaborato: {message}")
-                Led_activity_timeout = 5
-                
-            except queue.Empty:
-                # In questo caso, l'eccezione non dovrebbe mai verificarsi, ma è bene gestirla
-                print ("errore di ricezione dalla coda")
-                pass
-        time.sleep(0.05)
+    # Elabora il messaggio CI-V
+    process_civ_message(message)
+    Led_activity_timeout = 5
+
+radio.frame_listeners.append(on_civ_frame)
 
 # -----------------------------------------------------------------------------
 # Funzione per elaborare i messaggi CI-V ricevuti
@@ -213,38 +219,66 @@ def process_civ_message(message):
         # -----------------------------------------------------------------------------
         if command == COMMAND_GET_FREQUENCY and len(data) > 0:
             
-            # Decodifica la frequenza dai dati BCD ricevuti (da LSB a MSB)
-            frequency = 0
-            for i in range(len(data)):
-                high_nibble = (data[i] >> 4) & 0x0F
-                low_nibble = data[i] & 0x0F
-                frequency = (frequency * 100) + (high_nibble * 10) + low_nibble
+            # Decodifica la frequenza dai dati BCD ricevuti (tabella precalcolata)
+            frequency = decode_bcd(data)
 
-            root.after(10, radio_panel.update_frequency_display, frequency)
+            global current_frequency
+            if not sweep.running:
+                current_frequency = frequency
+                if not monstat:
+                    detector.tune(frequency)
+                auto_squelch.tune(frequency)
+            ui.post("frequency", radio_panel.update_frequency_display, frequency)
 
         # Aggiorna il livello dello squelch quando si riceve il comando GET_SQUELCH
         # -----------------------------------------------------------------------------
         elif command == COMMAND_GET_SQUELCH and len(data) > 0:
             squelch_level = data[0]
-            root.after(20, radio_panel.update_squelch_display, squelch_level)
-            root.after(20, SMeter.instance.update_squelch_threshold, squelch_level)
+            global current_squelch
+            current_squelch = squelch_level
+            ui.post("squelch", radio_panel.update_squelch_display, squelch_level)
+            ui.post("squelch_arc", radio_panel.update_squelch_arc, squelch_level)
 
         # Aggiorna lo smeter con il segnale ricevuto
         # -----------------------------------------------------------------------------
         elif command == COMMAND_GET_RSSI and len(data) > 0:
             smeter_level = data[0] + data[1]*256
-            root.after(20, SMeter.instance.update_smeter, smeter_level)
+            # Durante la scansione le risposte RSSI appartengono ai punti dello sweep
+            sweep.rssi_received(smeter_level)
+            if dual_watch.running:
+                # Le risposte appartengono alternativamente ai due VFO (S-meter aggiornato da watch_sample)
+                dual_watch.rssi_received(smeter_level)
+                return
+            if not sweep.running:
+                recorder.update(frequency=current_frequency, squelch=current_squelch)
+                recorder.record(smeter_level)
+                detector.rssi(smeter_level)
+                auto_squelch.sample(smeter_level)
+            # Sempre applicato: ogni campione alimenta il filtro della lancetta
+            ui.post("smeter", radio_panel.update_smeter, smeter_level, force=True)
 
         # Aggiorna controllo rfgain
         # -----------------------------------------------------------------------------
         elif command == COMMAND_GET_RFGAIN and len(data) > 0:
-            root.after(20, radio_panel.update_rfgain, data[0])
+            ui.post("rfgain", radio_panel.update_rfgain, data[0])
+
+        # Aggiorna controllo larghezza di banda
+        # -----------------------------------------------------------------------------
+        elif command == COMMAND_GET_BANDWIDTH and len(data) > 0:
+            ui.post("bandwidth", radio_panel.update_bandwidth_display, data[0])
          
         # aggiorna stato della radio    
         # -----------------------------------------------------------------------------
         elif command == COMMAND_GET_STATUS and len(data) > 0:
             status = data[0]+ data[1]*256
-            root.after(20, radio_panel.update_radio_status, status)
+            if dual_watch.running:
+                dual_watch.status_received(status)
+                return
+            recorder.update(status=status)
+            if not sweep.running:
+                detector.status(status)
+                auto_squelch.status(status)
+            ui.post("status", radio_panel.update_radio_status, status)
 
     except Exception as e:
         print(f"Errore durante l'elaborazione del messaggio CI-V: {e}")
@@ -254,15 +288,47 @@ def process_civ_message(message):
 # Funzioni per l'invio dei comandi alla radio
 #-------------------------------------------------------------------------------------------------------------------------
 # 
+# Coda di trasmissione del nucleo: per i comandi SET conta solo l'ultimo valore non ancora inviato
+transmitter = radio.transmitter
+
 def send_command(command, data=[]):
-    global ser
+    # Accoda senza bloccare il thread Tk: l'invio avviene nel thread di trasmissione
+    radio.send(command, data)
 
-    if ser and ser.is_open:
-        message = [CIV_START_BYTE, CIV_START_BYTE, CIV_ADDRESS_RADIO, CIV_ADDRESS_COMPUTER, command] + data + [CIV_END_BYTE]
-        ser.write(bytearray(message))
-        ser.flushOutput()
-    else:
-        print("Porta seriale non aperta. Impossibile inviare il comando.")
+# Schedulatore delle interrogazioni della sessione: frequenze obiettivo per parametro, ridotte
+# automaticamente in caso di timeout o di coda di trasmissione troppo lunga. Riceve ogni
+# risposta prima di process_civ_message.
+poller = session.poller
+
+# -----------------------------------------------------------------------------
+# Connessione: apertura, verifica (COMMAND_GET_STATUS) e riconnessione in un thread dedicato
+
+def connection_changed(state, port):
+    print(f"Connessione {port}: {state}")
+    if state == CONNECTED:
+        ui.post("port", radio_panel.port_combobox.set, port)
+
+def ports_changed(ports):
+    ui.post("ports", radio_panel.update_ports, ports)
+
+connection = ConnectionManager(radio, poller, on_state=connection_changed, on_ports=ports_changed)
+
+# Metriche del collegamento e dell'interfaccia: lette solo quando il pannello diagnostico
+# è aperto o quando l'endpoint HTTP (--metrics-port) viene interrogato
+metrics = MetricsRegistry()
+register_link_metrics(metrics, radio, poller, ui)
+metrics.counter("connection_losses_total", "Connessioni perse (errore o dispositivo rimosso)",
+                lambda: connection.losses)
+metrics.counter("activity_events_total", "Aperture dello squelch registrate come attività",
+                lambda: detector.events)
+metrics.counter("auto_squelch_commands_total", "Soglie inviate dallo squelch automatico",
+                lambda: auto_squelch.commands)
+metrics.gauge("auto_squelch_level", "Soglia dello squelch automatico (-1 se non attivo)",
+              lambda: auto_squelch.level if auto_squelch.enabled and auto_squelch.level is not None else -1)
+metrics.gauge("dual_watch_cycles_per_second", "Cicli A/B al secondo del doppio ascolto",
+              lambda: round(dual_watch.cycle_rate, 2) if dual_watch.running else 0)
+metrics.counter("connection_reconnects_total", "Riconnessioni riuscite alla stessa porta",
+                lambda: connection.reconnects)
 
 # -----------------------------------------------------------------------------
 def set_frequency(frequency):
@@ -270,22 +336,20 @@ def set_frequency(frequency):
     Funzione per impostare la frequenza sulla radio secondo il protocollo CI-V.
     La frequenza deve essere passata in Hz.
     """
-    # Convertire la frequenza in una stringa di 10 cifre per garantire il formato BCD
-    frequency_str = f"{frequency:010d}"  # Assicura 10 cifre (es. 7410000 diventa 0007410000)
-    data = [0x00] * 6  # Inizializza i 6 byte per i dati
+    global current_frequency
+    current_frequency = frequency
+    ui.invalidate("frequency")              # Il display può essere stato scritto direttamente (es. Entry)
 
-    # Riempire i byte BCD secondo l'ordine specifico
-    data[0] = (int(frequency_str[9]) << 4) | int(frequency_str[8])  # Byte 1: 10 Hz e 1 Hz
-    data[1] = (int(frequency_str[7]) << 4) | int(frequency_str[6])  # Byte 2: 100 Hz e 1 kHz
-    data[2] = (int(frequency_str[5]) << 4) | int(frequency_str[4])  # Byte 3: 10 kHz e 100 kHz
-    data[3] = (int(frequency_str[3]) << 4) | int(frequency_str[2])  # Byte 4: 1 MHz e 10 MHz
-    data[4] = (int(frequency_str[1]) << 4) | int(frequency_str[0])  # Byte 5: 100 MHz e 1 GHz
-    data[5] = 0x00                                                  # Byte 6: opzionale, può essere utilizzato per altri scopi se necessario
+    if dual_watch.running:
+        # Durante il doppio ascolto la sintonia spetta al motore: cambia solo la frequenza del VFO A
+        dual_watch.frequencies[0] = frequency
+        ui.post("frequency", Toplevel1.instance.update_frequency_display, frequency)
+        return
 
-
-    # Invia il comando alla radio
-    send_command(COMMAND_SET_FREQUENCY, data)
-    root.after(5, Toplevel1.instance.update_frequency_display, frequency)
+    # Il nucleo invia il comando (6 byte BCD) solo se la frequenza cambia
+    ui.post("frequency", Toplevel1.instance.update_frequency_display, frequency)
+    if radio.set_frequency(frequency):
+        poller.request_now("frequency")     # Rilegge la frequenza per conferma
 
     # Debug per verificare il valore inviato
     # print(f"Frequenza impostata (Hz): {frequency}")
@@ -297,35 +361,26 @@ def set_step(step):
     Funzione per impostare la frequenza sulla radio secondo il protocollo CI-V.
     La frequenza deve essere passata in Hz.
     """
-    # Convertire la frequenza in una stringa di 10 cifre per garantire il formato BCD
-    frequency_str = f"{step:010d}"  # Assicura 10 cifre (es. 7410000 diventa 0007410000)
-    data = [0x00] * 6  # Inizializza i 6 byte per i dati
-
-    # Riempire i byte BCD secondo l'ordine specifico
-    data[0] = (int(frequency_str[9]) << 4) | int(frequency_str[8])  # Byte 1: 10 Hz e 1 Hz
-    data[1] = (int(frequency_str[7]) << 4) | int(frequency_str[6])  # Byte 2: 100 Hz e 1 kHz
-    data[2] = (int(frequency_str[5]) << 4) | int(frequency_str[4])  # Byte 3: 10 kHz e 100 kHz
-    data[3] = (int(frequency_str[3]) << 4) | int(frequency_str[2])  # Byte 4: 1 MHz e 10 MHz
-    data[4] = (int(frequency_str[1]) << 4) | int(frequency_str[0])  # Byte 5: 100 MHz e 1 GHz
-    data[5] = 0x00                                                  # Byte 6: opzionale, può essere utilizzato per altri scopi se necessario
-
-    # Invia il comando alla radio
-    send_command(COMMAND_SET_STEP, data)
+    global current_step
+    current_step = step
+
+    # Il nucleo invia il comando (6 byte BCD, stesso formato della frequenza) solo se lo step cambia
+    radio.set_step(step)
     root.after(5, lambda: radio_panel.update_vfo_status(0, step=format_frequency(step)))
     
 # -----------------------------------------------------------------------------
-def set_mode(mode):
-    send_command(COMMAND_SET_MODE, [mode])
-    root.after(5, lambda: radio_panel.update_vfo_status(0, mode=modulazione[mode]))
-    
-    # Spegni tutti i pulsanti tranne quello indicato
-    for key in modulazione:
-        if key == modulazione[mode]:
-            radio_panel.cambia_stato(radio_panel.pulsanti[key], 1)  # Accendi il pulsante corrispondente
-        else:
-            radio_panel.cambia_stato(radio_panel.pulsanti[key], 0)  # Spegni gli altri pulsanti
-            
-    if mode==0:
+def set_mode(mode, step=None):
+    """
+    Imposta il modo e lo step: quello indicato oppure quello predefinito del modo.
+    """
+    global current_mode
+    current_mode = mode
+    radio.set_mode(mode)
+    show_mode(mode)
+
+    if step is not None:
+        set_step(step)
+    elif mode==0:
         set_step(12500)
     elif mode==1:
         set_step(1000)
@@ -334,9 +389,21 @@ def set_mode(mode):
     elif mode==3:
         set_step(10)        
         
+# -----------------------------------------------------------------------------
+def show_mode(mode):
+    root.after(5, lambda: radio_panel.update_vfo_status(0, mode=modulazione[mode]))
+    
+    # Spegni tutti i pulsanti tranne quello indicato
+    for key in modulazione:
+        if key == modulazione[mode]:
+            radio_panel.cambia_stato(radio_panel.pulsanti[key], 1)  # Accendi il pulsante corrispondente
+        else:
+            radio_panel.cambia_stato(radio_panel.pulsanti[key], 0)  # Spegni gli altri pulsanti
+
 # -----------------------------------------------------------------------------
 def set_rfgain(val):
-    send_command(COMMAND_SET_RFGAIN, [val])
+    ui.invalidate("rfgain")                 # Lo slider mostra il valore dell'utente: la prossima lettura va applicata
+    radio.set_rfgain(val)
 
 # -----------------------------------------------------------------------------
 def set_monitor():
@@ -349,30 +416,201 @@ def set_monitor():
     else:
         monstat=0
         
+    detector.tune(None if monstat else current_frequency)
     radio_panel.cambia_stato(radio_panel.pulsanti["MON"], monstat) 
     root.after(5, lambda: radio_panel.update_vfo_status(vfoattivo, mon=monitor[monstat]))
     # radio_panel.Vfo[vfoattivo].config(text=statoRX[monstat])
 
+# ----------------------------------------------------------------------------- 
+def apply_auto_squelch(squelch_level):
+    # Soglia calcolata dallo squelch automatico (dal thread di smistamento dei frame)
+    global current_squelch
+    current_squelch = squelch_level
+    radio.set_squelch(squelch_level)
+    ui.post("squelch", radio_panel.update_squelch_display, squelch_level)
+    ui.post("squelch_arc", radio_panel.update_squelch_arc, squelch_level)
+
 # ----------------------------------------------------------------------------- 
 def set_squelch(squelch_level):
-    send_command(COMMAND_SET_SQUELCH, [squelch_level])
-    root.after(5, lambda: SMeter.instance.update_squelch_threshold(squelch_level))
+    global current_squelch
+    current_squelch = squelch_level
+    ui.invalidate("squelch")                # Lo slider mostra il valore dell'utente: la prossima lettura va applicata
+    radio.set_squelch(squelch_level)        # Non inviato se lo slider riporta il valore letto dalla radio
+    ui.post("squelch_arc", radio_panel.update_squelch_arc, squelch_level)
     #time.sleep(0.05)
 
 # -----------------------------------------------------------------------------
 def set_band(band, frequency, step, mode):
-
+    # Un solo STEP (quello della banda) e nessun comando per i valori già impostati
+    auto_squelch.tune(frequency)            # Soglia automatica già nota per la banda
     set_frequency(frequency)
-    set_mode(modulazione.index(mode))
-    set_step(step)
+    set_mode(modulazione.index(mode), step)
 
 # -----------------------------------------------------------------------------
 def set_agc():
-    send_command(COMMAND_SET_AGC, 1)
+    radio.set_agc(AGC_MAN)
 
 # -----------------------------------------------------------------------------    
 def set_scan():
-    send_command(COMMAND_SET_SCAN, 1)
+    """
+    Avvia o ferma la scansione attorno alla frequenza corrente.
+    La scansione si ripete finché non compare un segnale oltre lo squelch o si preme di nuovo SCAN.
+    Con lo squelch a 0 (tutto aperto) non c'è stop su segnale: la scansione continua fino a SCAN.
+    """
+    if sweep.running:
+        sweep.stop()
+        return
+    if dual_watch.running:
+        print("Doppio ascolto attivo. Impossibile avviare la scansione.")
+        return
+    if not radio.is_open:
+        print("Porta seriale non aperta. Impossibile avviare la scansione.")
+        return
+
+    step = current_step
+    start = max(step, current_frequency - SCAN_HALF_SPAN * step)
+    stop = current_frequency + SCAN_HALF_SPAN * step
+
+    # Le interrogazioni periodiche si fermano: le risposte RSSI servono ai punti della scansione
+    poller.pause()
+    radio.invalidate("frequency")       # La scansione sintonizza scrivendo direttamente sulla porta
+    detector.tune(None)
+    radio_panel.builder.ensure("waterfall")     # Creato alla prima scansione
+    radio_panel.cambia_stato(radio_panel.pulsanti["SCAN"], 1)
+    sweep.start(start, stop, step, repeat=True, stop_on_signal=True)
+
+# -----------------------------------------------------------------------------
+def set_memory_scan():
+    """
+    Avvia o ferma la scansione dei canali di memoria (tutti o quelli con l'etichetta memory_scan_tag),
+    alla massima velocità consentita dal collegamento, con stop sul primo segnale oltre lo squelch
+    (nessuno stop con lo squelch a 0).
+    """
+    if sweep.running:
+        sweep.stop()
+        return
+    if dual_watch.running:
+        print("Doppio ascolto attivo. Impossibile avviare la scansione.")
+        return
+    if not radio.is_open:
+        print("Porta seriale non aperta. Impossibile avviare la scansione.")
+        return
+
+    selected = channels.select(tag=memory_scan_tag) if channels.available else []
+    if not selected:
+        print(f"Nessun canale in memoria da scandire (etichetta: {memory_scan_tag or 'tutte'}).")
+        return
+    modes = [modulazione.index(channel.mode) if channel.mode in modulazione else None for channel in selected]
+
+    poller.pause()
+    radio.invalidate("frequency", "mode")
+    detector.tune(None)
+    radio_panel.builder.ensure("waterfall")
+    radio_panel.cambia_stato(radio_panel.pulsanti["MSCAN"], 1)
+    sweep.start_list([channel.frequency for channel in selected], modes, repeat=True, stop_on_signal=True)
+
+# -----------------------------------------------------------------------------
+def scan_point(index, frequency, rssi):
+    # Punto di scansione: nessuna ricerca del nome del canale
+    ui.post("frequency", radio_panel.update_frequency_display, frequency, False)
+
+# -----------------------------------------------------------------------------
+def scan_stopped(reason, frequency):
+    global current_frequency, current_mode
+    memory_scan = sweep.modes is not None
+    if frequency is not None:
+        current_frequency = frequency
+        ui.post("frequency", radio_panel.update_frequency_display, frequency)
+        mode = sweep.modes[sweep.signal_index] if memory_scan else None
+        if mode is not None:
+            current_mode = mode
+            ui.post("mode", show_mode, mode)
+    else:
+        # Scansione interrotta: la radio torna sulla frequenza (e sul modo) di partenza
+        set_frequency(current_frequency)
+        if memory_scan:
+            radio.set_mode(current_mode)
+    # force: il pulsante è stato acceso direttamente, l'ultimo valore noto al dispatcher è lo spegnimento precedente
+    ui.post("scan", radio_panel.cambia_stato, radio_panel.pulsanti["MSCAN" if memory_scan else "SCAN"], 0,
+            force=True)
+    poller.resume()
+    print(f"Scansione terminata ({reason}) - {sweep.stats()}")
+
+# Motore di scansione: scrive direttamente sulla porta per mantenere ordine e tempi dei comandi
+sweep = SweepEngine(
+    transmitter.send_now,
+    dwell=SCAN_DWELL,
+    threshold=lambda: current_squelch,
+    on_point=scan_point,
+    on_sweep=lambda frequencies, rssi: Waterfall.instance.push_sweep(frequencies, rssi),
+    on_stop=scan_stopped
+)
+
+
+# -----------------------------------------------------------------------------
+def set_dual_watch():
+    """
+    Avvia o ferma il doppio ascolto: il ricevitore alterna VFO A e VFO B e si ferma sul
+    canale in cui si apre lo squelch, finché non torna silenzioso.
+    """
+    if dual_watch.running:
+        dual_watch.stop()
+        return
+    if sweep.running:
+        print("Scansione in corso. Impossibile avviare il doppio ascolto.")
+        return
+    if not radio.is_open:
+        print("Porta seriale non aperta. Impossibile avviare il doppio ascolto.")
+        return
+    if not vfo_b_frequency or vfo_b_frequency == current_frequency:
+        print("VFO B senza una frequenza diversa dal VFO A: usare FCOPY e cambiare frequenza.")
+        return
+
+    # Come per la scansione: niente interrogazioni periodiche, RSSI e stato servono al motore
+    poller.pause()
+    radio.invalidate("frequency")
+    detector.tune(None)
+    radio_panel.cambia_stato(radio_panel.pulsanti["DUALW"], 1)
+    # La fine del doppio ascolto precedente ha ripristinato la visualizzazione: i valori
+    # ricordati dal dispatcher per i VFO non corrispondono più a quanto mostrato
+    for key in ("watch0", "watch1", "watch_hold"):
+        ui.invalidate(key)
+    dual_watch.start([current_frequency, vfo_b_frequency])
+
+# -----------------------------------------------------------------------------
+def set_fcopy():
+    # Copia la frequenza del VFO A nel VFO B
+    global vfo_b_frequency
+    vfo_b_frequency = current_frequency
+    radio_panel.update_vfo_b_display(vfo_b_frequency)
+
+# -----------------------------------------------------------------------------
+def watch_sample(index, rssi, squelch_open):
+    ui.post(f"watch{index}", radio_panel.show_watch, index, squelch_open)
+    # Lo S-meter segue il canale su cui il ricevitore è fermo, altrimenti il VFO A
+    holding = dual_watch.holding
+    if index == (holding if holding is not None else 0):
+        ui.post("smeter", radio_panel.update_smeter, rssi, force=True)
+
+# -----------------------------------------------------------------------------
+def watch_stopped(holding):
+    # Il ricevitore torna sul VFO A e riprendono le interrogazioni periodiche
+    radio.set_frequency(current_frequency, force=True)
+    poller.request_now("frequency")
+    poller.resume()
+    # force: gli stessi argomenti della fine precedente verrebbero scartati dal dispatcher
+    ui.post("dualw", radio_panel.cambia_stato, radio_panel.pulsanti["DUALW"], 0, force=True)
+    ui.post("watch_end", radio_panel.show_watch, None, False, force=True)
+    print(f"Doppio ascolto terminato - {dual_watch.stats()}")
+
+# Doppio ascolto: sintonia e misure in pipeline direttamente sulla porta, come la scansione
+dual_watch = DualWatch(
+    transmitter.send_now,
+    dwell=DUAL_WATCH_DWELL,
+    on_sample=watch_sample,
+    on_hold=lambda index: ui.post("watch_hold", radio_panel.show_watch, index, True),
+    on_stop=watch_stopped
+)
 
 
 # -----------------------------------------------------------------------------
@@ -389,18 +627,19 @@ def get_rfgain():
 
 # -----------------------------------------------------------------------------
 def set_bw(val):
-    send_command(COMMAND_SET_BANDWIDTH, [val])
+    ui.invalidate("bandwidth")
+    radio.set_bandwidth(val)
 
 # -----------------------------------------------------------------------------
 def set_txpower(val):
-    send_command(COMMAND_SET_TX_POWER, [val])
+    radio.set_tx_power(val)
 
 # -----------------------------------------------------------------------------
 def periodic_update():
-    if ser and ser.is_open:
-        get_rfgain()
-        get_squelch()
-        get_frequency()
+    if radio.is_open:
+        # Lettura immediata di tutti i parametri, poi prosegue lo schedulatore
+        for name in poller.tasks:
+            poller.request_now(name)
     else:
         print("Porta seriale non aperta. Saltando aggiornamento periodico.")
         
@@ -435,6 +674,246 @@ def _style_code():
     _style_code_ran = 1
 
 
+#-------------------------------------------------------------------------------------------------------------------------
+# Descrizione del pannello
+#-------------------------------------------------------------------------------------------------------------------------
+#
+# Font condivisi: ogni combinazione famiglia/dimensione/stile viene creata una sola volta
+PANEL_FONTS = {
+    "vfo": ("Consolas", fontVFO, "bold"),
+    "vfo_label": ("Consolas", fontLBL, "bold"),
+    "status": ("Consolas", fontSTS),
+    "group": ("Consolas", 8, "bold"),
+    "button": ("Consolas", 11, "bold"),
+    "caption": ("Segoe UI", 7, "bold"),
+    "scale": ("Segoe UI", 8, "bold"),
+}
+
+# Stili condivisi: opzioni comuni unite a quelle del singolo widget prima della creazione
+PANEL_STYLES = {
+    "panel": {"background": COLOR_BACKGROUND, "relief": "flat"},
+    "group": {
+        "background": COLOR_BACKGROUND,
+        "relief": "solid",
+        "borderwidth": 1,
+        "highlightbackground": COLOR_FRAME_FOREGROUND,  # Colore bordo
+        "highlightcolor": COLOR_LABEL_FOREGROUND,
+        "highlightthickness": 1,
+    },
+    "group_label": {"font": "group", "background": COLOR_BACKGROUND, "foreground": COLOR_LABEL_FOREGROUND},
+    "caption": {"font": "caption", "background": COLOR_BACKGROUND, "foreground": COLOR_LABEL_FOREGROUND},
+    "display": {
+        "background": COLOR_DISPLAY_BG,
+        "foreground": COLOR_DISPLAY_FG,
+        "activebackground": "#d9d9d9",
+        "activeforeground": "black",
+        "compound": "left",
+        "disabledforeground": "#68665a",
+        "highlightbackground": "cornsilk4",
+        "highlightcolor": "black",
+    },
+    "slider": {
+        "resolution": 1.0,
+        "activebackground": "#d9d9d9",
+        "background": COLOR_BACKGROUND,
+        "font": "scale",
+        "foreground": COLOR_LABEL_FOREGROUND,
+        "highlightbackground": COLOR_BACKGROUND,
+        "highlightcolor": "black",
+        "length": 245,
+        "troughcolor": COLOR_SLIDE_BG,
+    },
+    "button": {
+        "background": COLOR_BUTTON_BG,
+        "foreground": COLOR_BUTTON_FG,
+        "activebackground": "#696969",
+        "activeforeground": "black",
+        "disabledforeground": "#68665a",
+        "font": "button",
+        "highlightbackground": "cornsilk4",
+        "highlightcolor": "black",
+        "padx": "6",
+    },
+}
+
+# Pulsanti del bandplan: (nome, frequenza Hz, step Hz, modo)
+BAND_PLAN = (
+    ("21", 21200000, 9000, "SSB"),
+    ("27", 27205000, 10000, "FM"),
+    ("28", 28600000, 10000, "SSB"),
+    ("50", 50150000, 10000, "SSB"),
+    ("70", 74025000, 12500, "FM"),
+    ("AIR", 129575000, 25000, "AM"),
+    ("144", 145500000, 25000, "FM"),
+    ("SAT", 261000000, 25000, "FM"),
+    ("430", 433500000, 25000, "FM"),
+    ("LPD", 433075000, 25000, "FM"),
+    ("PMR", 446006250, 25000, "FM"),
+    ("SHF", 1296200000, 25000, "FM"),
+)
+
+
+# -----------------------------------------------------------------------------
+def button_group(name, title, buttons, place, columns=4, spacing=65, defer=None):
+    """
+    Riquadro con titolo e pulsanti (testo, comando) su `columns` colonne.
+    I pulsanti vengono registrati in Toplevel1.pulsanti con il loro testo.
+    """
+    children = [widget(tk.Label, base="group_label", text=title, place={"x": 10, "y": 0})]
+    for i, (text, command) in enumerate(buttons):
+        row, col = divmod(i, columns)
+        children.append(widget(
+            tk.Button, base="button", text=text, command=command, into=("pulsanti", text),
+            place={"x": col * spacing + 5, "y": row * 35 + 25, "width": 62, "height": 26}
+        ))
+    return widget(tk.Frame, name=name, base="group", place=place, children=children, defer=defer)
+
+
+# -----------------------------------------------------------------------------
+def display_label(name, font, text, anchor, place, **options):
+    return widget(tk.Label, name=name, base="display", font=font, text=text, anchor=anchor, place=place, **options)
+
+
+# -----------------------------------------------------------------------------
+def slider(name, caption, caption_place, place, caption_bind=None, **options):
+    return [
+        widget(tk.Label, name=f"{name}_label", base="caption", text=caption, place=caption_place, bind=caption_bind),
+        widget(tk.Scale, name=name, base="slider", place=place, **options),
+    ]
+
+
+# -----------------------------------------------------------------------------
+def panel_spec():
+    """
+    Descrizione completa del pannello principale. Le sezioni con defer=IDLE vengono create
+    dopo il primo disegno, il waterfall (ON_USE) alla prima scansione.
+    """
+    vfo_rows = []
+    for row, (suffix, vfo_index) in enumerate((("A", 0), ("B", 1))):
+        y = altezzavfo * 2 * row + 5
+        vfo_rows += [
+            display_label(f"Vfo{suffix}_1", "vfo_label", "", "e", {"x": 1, "y": y, "height": altezzavfo, "width": 52},
+                          padx="15", into=("Vfo", vfo_index)),
+            display_label(f"Vfo{suffix}", "vfo", "0", "e", {"x": 52, "y": y, "height": altezzavfo, "width": 246},
+                          padx="5", bind={"<Button-1>": "show_frequency_entry"} if suffix == "A" else None),
+            display_label(f"Vfo{suffix}_2", "vfo_label", "Hz", "e", {"x": 295, "y": y, "height": altezzavfo, "width": 52},
+                          padx="15"),
+            # Riga di stato del VFO (flag e funzioni attive)
+            display_label(f"Status{suffix}", "status", "", "sw",
+                          {"x": 1, "y": y + altezzavfo, "height": int(altezzavfo / 2), "width": 346}, padx="10"),
+        ]
+    # Riga centrale per separare i VFO
+    vfo_rows.append(display_label(
+        "Separator", "status", "", "center",
+        {"x": 1, "y": altezzavfo + int(altezzavfo / 2) + 5, "height": int(altezzavfo / 2) + 2, "width": 346}
+    ))
+
+    return [
+        #--------------------------------------------------------------------------------------------- S-meter
+        widget(tk.Frame, name="Frame_smeter", base="panel", borderwidth=2, highlightbackground="cornsilk4",
+               highlightcolor="black", place={"x": 20, "y": 26, "width": 220, "height": 120}, children=[
+            widget(SMeter, name="smeter", scale_factor=0.5, ballistics=True,
+                   pack={"fill": "both", "expand": True}, defer=IDLE),
+        ]),
+
+        #--------------------------------------------------------------------------------------------- Waterfall
+        # Una riga per ogni sweep, la più recente in alto. Altezza: immagine, riga delle frequenze,
+        # bordi del frame (2 + 2) e del waterfall (2 + 2)
+        widget(tk.Frame, name="Frame_waterfall", base="panel", borderwidth=2, highlightbackground="cornsilk4",
+               highlightcolor="black",
+               place={"x": 20, "y": 445, "width": 860, "height": WATERFALL_HISTORY + WATERFALL_LABELS + 8},
+               children=[
+            widget(Waterfall, name="waterfall", width=840, history=WATERFALL_HISTORY,
+                   pack={"fill": "both", "expand": True}, defer=ON_USE),
+        ]),
+
+        #--------------------------------------------------------------------------------------------- Display
+        widget(tk.Frame, name="Frame_display", base="panel", borderwidth=1,
+               place={"x": 240, "y": 10, "width": 348, "height": altezzavfo * 4 + 40}, children=[
+            widget(tk.LabelFrame, name="Labelframe1", relief="flat", font=("Segoe UI", 9), foreground="black",
+                   background=COLOR_BACKGROUND, highlightbackground="cornsilk4", highlightcolor="black",
+                   place={"x": 1, "y": 10, "width": 360, "height": 175}, children=vfo_rows),
+        ]),
+
+        #--------------------------------------------------------------------------------------------- Display piccolo
+        widget(tk.Frame, name="Frame_info", base="panel", borderwidth=1,
+               place={"x": 610, "y": 22, "width": 290, "height": altezzavfo + 40}, children=[
+            display_label("info", "vfo_label", "", "e", {"x": 1, "y": 5, "height": altezzavfo, "width": 270}, padx="5"),
+        ]),
+
+        #--------------------------------------------------------------------------------------------- Cursori
+        widget(tk.Frame, name="Frame_cursori", base="panel", borderwidth=2,
+               place={"x": 605, "y": 85, "width": 300, "height": 250}, children=[
+            *slider("RfGain", "RF GAIN", {"x": 7, "y": 0, "width": 64, "height": 11},
+                    {"x": 11, "y": 13, "width": 64, "height": 235},
+                    from_=31.0, to=0.0, command=lambda val: set_rfgain(int(val))),
+            *slider("Squelch", "SQUELCH", {"x": 71, "y": 0, "width": 67, "height": 11},
+                    {"x": 71, "y": 13, "width": 67, "height": 235},
+                    from_=255.0, to=0.0, command=lambda val: set_squelch(int(val)),
+                    caption_bind={"<Button-1>": "toggle_auto_squelch"},
+                    bind={"<ButtonPress-1>": "squelch_manual", "<ButtonRelease-1>": "schedule_squelch_update",
+                          "<Motion>": "schedule_squelch_update"}),
+            *slider("bw", "SET BW", {"x": 146, "y": 0, "width": 64, "height": 11},
+                    {"x": 166, "y": 13, "width": 64, "height": 235},
+                    from_=9.0, to=0.0, command="update_bandwidth_label", showvalue=False),
+            # Valore selezionato accanto al cursore della banda
+            widget(tk.Label, name="bandwidth_value_label", base="caption", font="scale", text="U06K",
+                   place={"x": 132, "y": 230, "anchor": "w"}),
+            *slider("txp", "TX POWER", {"x": 211, "y": 0, "width": 64, "height": 11},
+                    {"x": 213, "y": 13, "width": 64, "height": 235},
+                    from_=15.0, to=0.0, command=lambda val: set_txpower(int(val))),
+        ]),
+
+        #--------------------------------------------------------------------------------------------- Pulsanti
+        widget(tk.Frame, name="Frame_pulsanti", base="panel", borderwidth=2,
+               place={"x": 10, "y": 192, "width": 580, "height": 250}, children=[
+            button_group("Frame_bande", "BANDPLAN",
+                         [(band[0], lambda band=band: set_band(*band)) for band in BAND_PLAN],
+                         {"x": 15, "y": 10, "width": 270, "height": 130}),
+            button_group("Frame_modalita", "MODE", [
+                ("FM", lambda: set_mode(MODE_FM)),
+                ("AM", lambda: set_mode(MODE_AM)),
+                ("SSB", lambda: set_mode(MODE_SSB)),
+                ("CW", lambda: set_mode(MODE_CW)),
+            ], {"x": 305, "y": 10, "width": 270, "height": 60}),
+            button_group("Frame_funzioni1", "FUNCTIONS", [
+                ("SCAN", lambda: set_scan()),
+                ("AGC", lambda: set_agc()),
+                ("STEP", lambda: set_step()),
+                ("MON", lambda: set_monitor()),
+            ], {"x": 305, "y": 80, "width": 270, "height": 60}),
+            button_group("Frame_funzioni2", "RECEIVER", [
+                ("DUALW", lambda: set_dual_watch()),
+                ("SPLIT", lambda: set_notch()),
+                ("PRE", lambda: set_pre()),
+                ("ATT", lambda: set_att()),
+                ("RIT", lambda: set_rit()),
+                ("XIT", lambda: set_xit()),
+                ("ANT", lambda: set_ant()),
+                ("TUNE", lambda: set_tune()),
+            ], {"x": 15, "y": 150, "width": 560, "height": 60}, columns=8, spacing=69, defer=IDLE),
+        ]),
+        button_group("Frame_funzioni3", "CONTROL", [
+            ("MSCAN", lambda: set_memory_scan()),
+            ("FCOPY", lambda: set_fcopy()),
+            ("PTT", lambda: set_ptt()),
+            ("POWER", lambda: set_power()),
+        ], {"x": 610, "y": 345, "width": 270, "height": 60}, defer=IDLE),
+
+        #--------------------------------------------------------------------------------------------- Porta seriale
+        widget(tk.Frame, name="Frame_serial", bg=COLOR_BACKGROUND, width=200, height=25,
+               place={"x": 25, "y": 165}, children=[
+            widget(tk.Label, text="COM PORT :", bg=COLOR_BACKGROUND, fg=COLOR_LABEL_FOREGROUND, font="scale",
+                   place={"x": 0, "y": 2}),
+            widget(ttk.Combobox, name="port_combobox", state="readonly", width=10, style="CustomCombobox.TCombobox",
+                   place={"x": 75, "y": 2}, bind={"<<ComboboxSelected>>": "on_port_selected"}),
+            # LED indicatore di connessione (clic: pannello diagnostico)
+            widget(tk.Label, name="connection_led", bg=COLOR_ENTRY_BG, width=5, height=1, relief="solid", bd=1,
+                   place={"x": 170, "y": 2}, bind={"<Button-1>": "open_diagnostics"}),
+        ]),
+    ]
+
+
 #-------------------------------------------------------------------------------------------------------------------------
 # Definizione classe dei controlli grafici
 #-------------------------------------------------------------------------------------------------------------------------
@@ -444,17 +923,13 @@ class Toplevel1:
     instance = None  # Variabile di classe per mantenere l'unica istanza
 
     def __init__(self, top=None):
-        
-        self.ser = None         # Attributo per mantenere la connessione seriale
 
         if Toplevel1.instance is None:
             Toplevel1.instance = self  # Imposta l'istanza di classe solo se non è già stata creata
 
-        top.geometry("900x420")
+        top.geometry("900x566")
         top.title("IJV Radio Panel")
-        top.configure(background=COLOR_BACKGROUND)
-        top.configure(highlightbackground="cornsilk4")
-        top.configure(highlightcolor="black")
+        top.configure(background=COLOR_BACKGROUND, highlightbackground="cornsilk4", highlightcolor="black")
         top.resizable(False, False)  # Impedisce il ridimensionamento sia in larghezza che in altezza
 
         self.top = top
@@ -467,678 +942,52 @@ class Toplevel1:
 
         # Matrice per memorizzare i dati dei VFO (parametrico, ad esempio per VFO A e VFO B)
         self.vfo_status = [
-            { "mode": "FM", "agc": "MAN", "bw": "U 6K", "step": "12.5K", "mon": "" },
-            { "mode": "FM", "agc": "MAN", "bw": "U 6K", "step": "12.5K", "mon": "" }]
-
-        # ---------------------------------------------------------------------------------------------Frame per lo S-meter
-        # self.Frame_smeter = tk.Frame(self.top, background=COLOR_BACKGROUND, relief="flat", borderwidth=2, highlightbackground="cornsilk4", highlightcolor="black")
-        # self.Frame_smeter.place(x=11, y=5, width=90, height=297) 
-
-        # ----------------------------------------------------------- Label per indicare la funzione SIGNAL
-        # self.Signal_label = tk.Label(
-            # self.Frame_smeter,
-            # text="SIGNAL",
-            # font=("Segoe UI", 7, "bold"),
-            # background=COLOR_BACKGROUND,
-            # foreground=COLOR_LABEL_FOREGROUND,
-            # anchor='w'
-        # )
-        # self.Signal_label.place(x=2, y=2, width=70, height=20)
-
-        # ----------------------------------------------------------- Progressbar per S-meter
-        # _style_code()  
-        # self.smeter = ttk.Progressbar(
-            # self.Frame_smeter,
-            # orient="vertical",
-            # length=19,
-            # maximum=255,
-            # value=10
-        # )
-        # self.smeter.place(x=11, y=22, width=18, height=259)
-
-        #self.menubar = tk.Menu(top, font="TkMenuFont", bg='cornsilk4',fg=_fgcolor)
-        #top.configure(menu = self.menubar)
-        
-        #---------------------------------------------------------------------------------------------
-        #--------------------------------------------------------------------------------------------- Frame Smeter
-        #---------------------------------------------------------------------------------------------
-        
-        # Definizione del frame principale per lo S-meter
-        self.Frame_smeter = tk.Frame(self.top, background=COLOR_BACKGROUND, relief="flat", borderwidth=2, highlightbackground="cornsilk4", highlightcolor="black")
-        self.Frame_smeter.place(x=20, y=26, width=220, height=120)  # Modifica le coordinate per assicurarti che sia visibile
-
-        # Creazione di un'istanza di SMeter all'interno di Toplevel1
-        self.smeter = SMeter(parent=self.Frame_smeter, scale_factor=0.5)
-        self.smeter.pack(fill='both', expand=True)  # Riempie tutto lo spazio disponibile all'interno di Frame_smeter
-        
-        # Forza un aggiornamento dell'interfaccia
-        #self.top.update()
-
-        #---------------------------------------------------------------------------------------------
-        #--------------------------------------------------------------------------------------------- Frame Display
-        #---------------------------------------------------------------------------------------------
-        
-        # Creazione del frame per il display
-        self.Frame_display = tk.Frame(self.top, background=COLOR_BACKGROUND, relief="flat", borderwidth=1)
-        self.Frame_display.place(x=240, y=10, width=348, height=altezzavfo*4+40)
-        #----------------------------------------------------------- Creazione del LabelFrame all'interno del frame di visualizzazione
-        self.Labelframe1 = tk.LabelFrame(
-            self.Frame_display,
-            relief='flat',
-            font=("Segoe UI", 9),
-            foreground="black",
-            background=COLOR_BACKGROUND,
-            highlightbackground="cornsilk4",
-            highlightcolor="black"
-        )
-        self.Labelframe1.place(x=1, y=10, width=360, height=175)
-        
-        #----------------------------------------------------------- VFO A riga superiore
-        # VFO A riga superiore
-        self.VfoA_1 = tk.Label(
-            self.Labelframe1,
-            text='',
-            font=("Consolas", fontLBL, "bold"),
-            background=COLOR_DISPLAY_BG,
-            foreground=COLOR_DISPLAY_FG,
-            anchor='e',
-            activebackground="#d9d9d9",
-            activeforeground="black",
-            compound='left',
-            disabledforeground="#68665a",
-            highlightbackground="cornsilk4",
-            highlightcolor="black",
-            padx="15"
-        )
-        self.VfoA_1.place(x=1, y=5, height=altezzavfo, width=52)
-        self.Vfo[0] = self.VfoA_1
-        
-        self.VfoA = tk.Label(
-            self.Labelframe1,
-            text='0',
-            font=("Consolas", fontVFO, "bold"),
-            background=COLOR_DISPLAY_BG,
-            foreground=COLOR_DISPLAY_FG,
-            anchor='e',
-            activebackground="#d9d9d9",
-            activeforeground="black",
-            compound='left',
-            disabledforeground="#68665a",
-            highlightbackground="cornsilk4",
-            highlightcolor="black",
-            padx="5"
-        )
-        self.VfoA.bind("<Button-1>", self.show_frequency_entry)
-        self.VfoA.place(x=52, y=5, height=altezzavfo, width=246)
-
-        self.VfoA_2 = tk.Label(
-            self.Labelframe1,
-            text='Hz',
-            font=("Consolas", fontLBL, "bold"),
-            background=COLOR_DISPLAY_BG,
-            foreground=COLOR_DISPLAY_FG,
-            anchor='e',
-            activebackground="#d9d9d9",
-            activeforeground="black",
-            compound='left',
-            disabledforeground="#68665a",
-            highlightbackground="cornsilk4",
-            highlightcolor="black",
-            padx="15"
-        )
-        self.VfoA_2.place(x=295, y=5, height=altezzavfo, width=52)        
-
-        #----------------------------------------------------------- Riga di stato del VFO A
-        self.StatusA = tk.Label(
-            self.Labelframe1,
-            text="",                      # Può essere aggiornato dinamicamente per mostrare lo stato
-            font=("Consolas", fontSTS),          # Font più piccolo per i flag e le funzioni attive
-            background=COLOR_DISPLAY_BG,
-            foreground=COLOR_DISPLAY_FG,
-            anchor='sw',
-            activebackground="#d9d9d9",
-            activeforeground="black",
-            compound='left',
-            disabledforeground="#68665a",
-            highlightbackground="cornsilk4",
-            highlightcolor="black",
-            padx="10"
-        )
-        self.StatusA.place(x=1, y=altezzavfo + 5, height=int(altezzavfo / 2), width=346)
-
-        #----------------------------------------------------------- Riga centrale per separare i VFO
-        self.Separator = tk.Label(
-            self.Labelframe1,
-            text="",  # Può essere anche un testo più descrittivo se necessario
-            font=("Consolas", fontSTS),
-            background=COLOR_DISPLAY_BG,
-            foreground=COLOR_DISPLAY_FG,
-            anchor='center',
-            activebackground="#d9d9d9",
-            activeforeground="black",
-            compound='left',
-            disabledforeground="#68665a",
-            highlightbackground="cornsilk4",
-            highlightcolor="black"
-        )
-        self.Separator.place(x=1, y=altezzavfo + int(altezzavfo / 2) + 5 , height=int(altezzavfo / 2)+2, width=346)
-
-        #----------------------------------------------------------- VFO B riga inferiore
-        self.VfoB_1 = tk.Label(
-            self.Labelframe1,
-            text='',
-            font=("Consolas", fontLBL, "bold"),
-            background=COLOR_DISPLAY_BG,
-            foreground=COLOR_DISPLAY_FG,
-            anchor='e',
-            activebackground="#d9d9d9",
-            activeforeground="black",
-            compound='left',
-            disabledforeground="#68665a",
-            highlightbackground="cornsilk4",
-            highlightcolor="black",
-            padx="15"
-        )
-        self.VfoB_1.place(x=1, y=altezzavfo*2 + 5,  height=altezzavfo, width=52)
-        self.Vfo[1] = self.VfoB_1
-        
-        self.VfoB = tk.Label(
-            self.Labelframe1,
-            text='0',
-            font=("Consolas", fontVFO, "bold"),
-            background=COLOR_DISPLAY_BG,
-            foreground=COLOR_DISPLAY_FG,
-            anchor='e',
-            activebackground="#d9d9d9",
-            activeforeground="black",
-            compound='left',
-            disabledforeground="#68665a",
-            highlightbackground="cornsilk4",
-            highlightcolor="black",
-            padx="5"
-        )
-        self.VfoB.place(x=52, y=altezzavfo*2 + 5, height=altezzavfo, width=246)
-
-        self.VfoB_2 = tk.Label(
-            self.Labelframe1,
-            text='Hz',
-            font=("Consolas", fontLBL, "bold"),
-            background=COLOR_DISPLAY_BG,
-            foreground=COLOR_DISPLAY_FG,
-            anchor='e',
-            activebackground="#d9d9d9",
-            activeforeground="black",
-            compound='left',
-            disabledforeground="#68665a",
-            highlightbackground="cornsilk4",
-            highlightcolor="black",
-            padx="15"
-        )
-        self.VfoB_2.place(x=295, y=altezzavfo*2 + 5,  height=altezzavfo, width=52)
-
-        #----------------------------------------------------------- Riga di stato del VFO B
-        self.StatusB = tk.Label(
-            self.Labelframe1,
-            text="",                                    # Può essere aggiornato dinamicamente per mostrare lo stato
-            font=("Consolas", fontSTS),                 # Font più piccolo per i flag e le funzioni attive
-            background=COLOR_DISPLAY_BG,
-            foreground=COLOR_DISPLAY_FG,
-            anchor='sw',
-            activebackground="#d9d9d9",
-            activeforeground="black",
-            compound='left',
-            disabledforeground="#68665a",
-            highlightbackground="cornsilk4",
-            highlightcolor="black",
-            padx="10"
-        )
-        self.StatusB.place(x=1, y=altezzavfo*3 + 5, height=int(altezzavfo / 2), width=346)
+            { "mode": "FM", "agc": "MAN", "bw": "U 6K", "step": "12.5K", "mon": "", "name": "" },
+            { "mode": "FM", "agc": "MAN", "bw": "U 6K", "step": "12.5K", "mon": "", "name": "" }]
+        self.channel_frequency = None   # Ultima frequenza cercata tra i canali di memoria
 
-
-        #---------------------------------------------------------------------------------------------
-        #--------------------------------------------------------------------------------------------- Frame Display piccolo
-        #---------------------------------------------------------------------------------------------
-        
-        self.Frame_info = tk.Frame(self.top, background=COLOR_BACKGROUND, relief="flat", borderwidth=1)
-        self.Frame_info.place(x=610, y=22, width=290, height=altezzavfo+40)
-        
-        # display informazioni
-        self.info = tk.Label(
-            self.Frame_info,
-            text='',
-            font=("Consolas", fontLBL, "bold"),
-            background=COLOR_DISPLAY_BG,
-            foreground=COLOR_DISPLAY_FG,
-            anchor='e',
-            activebackground="#d9d9d9",
-            activeforeground="black",
-            compound='left',
-            disabledforeground="#68665a",
-            highlightbackground="cornsilk4",
-            highlightcolor="black",
-            padx="5"
-        )
-        #self.info.bind("<Button-1>", self.show_frequency_entry)
-        self.info.place(x=1, y=5, height=altezzavfo, width=270)
-
-        
-        #---------------------------------------------------------------------------------------------
-        #--------------------------------------------------------------------------------------------- Frame Cursori
-        #---------------------------------------------------------------------------------------------
-        
-        self.Frame_cursori = tk.Frame(self.top, background=COLOR_BACKGROUND, relief="flat", borderwidth=2) #
-        self.Frame_cursori.place(x=605, y=85, width=300, height=250)
-
-        #------------------------------------------------------------------ RFGAIN
-        # Label per indicare la funzione RF GAIN
-        self.RfGain_label = tk.Label(
-            self.Frame_cursori,
-            text="RF GAIN",
-            font=("Segoe UI", 7, "bold"),
-            background=COLOR_BACKGROUND,
-            foreground=COLOR_LABEL_FOREGROUND
-        )
-        self.RfGain_label.place(x=7, y=0, width=64, height=11)
-
-        #----------------------------------------------------------- Scale per RF GAIN
-        self.RfGain = tk.Scale(
-            self.Frame_cursori,
-            from_=31.0,
-            to=0.0,
-            resolution=1.0,
-            command=lambda val: set_rfgain(int(val)),
-            activebackground="#d9d9d9",
-            background=COLOR_BACKGROUND,
-            font=("Segoe UI", 8, "bold"),
-            foreground=COLOR_LABEL_FOREGROUND,
-            highlightbackground=COLOR_BACKGROUND,
-            highlightcolor="black",
-            length=245,
-            troughcolor=COLOR_SLIDE_BG
-        )
-        self.RfGain.place(x=11, y=13, width=64, height=235)
-
-
-        #------------------------------------------------------------------ SQUELCH
-        # Label per indicare la funzione SQUELCH
-        self.Squelch_label = tk.Label(
-            self.Frame_cursori,
-            text="SQUELCH",
-            font=("Segoe UI", 7, "bold"),
-            background=COLOR_BACKGROUND,
-            foreground=COLOR_LABEL_FOREGROUND
-        )
-        self.Squelch_label.place(x=71, y=0, width=67, height=11)
-
-        #----------------------------------------------------------- Scale per SQUELCH
-        self.Squelch = tk.Scale(
-            self.Frame_cursori,
-            from_=255.0,
-            to=0.0,
-            resolution=1.0,
-            command=lambda val: set_squelch(int(val)),
-            activebackground="#d9d9d9",
-            background=COLOR_BACKGROUND,
-            font=("Segoe UI", 8, "bold"),
-            foreground=COLOR_LABEL_FOREGROUND,
-            highlightbackground=COLOR_BACKGROUND,
-            highlightcolor="black",
-            length=245,
-            troughcolor=COLOR_SLIDE_BG
-        )
-        self.Squelch.place(x=71, y=13, width=67, height=235)
-
-        # Timer per debouncing
+        # Timer per debouncing dello squelch
         self.squelch_timer = None
-        self.Squelch.bind("<ButtonRelease-1>", self.schedule_squelch_update)
-        self.Squelch.bind("<Motion>", self.schedule_squelch_update)
-
-
-        #------------------------------------------------------------------ BANDWITH
-        # Label per indicare la funzione SET BW
-        self.bw_label = tk.Label(
-            self.Frame_cursori,
-            text="SET BW",
-            font=("Segoe UI", 7, "bold"),
-            background=COLOR_BACKGROUND,
-            foreground=COLOR_LABEL_FOREGROUND
-        )
-        self.bw_label.place(x=146, y=0, width=64, height=11)
-
-        #----------------------------------------------------------- Label per mostrare il valore selezionato accanto al cursore
-        self.bandwidth_value_label = tk.Label(
-            self.Frame_cursori,
-            text="U06K",
-            font=("Segoe UI", 8, "bold"),
-            background=COLOR_BACKGROUND,
-            foreground=COLOR_LABEL_FOREGROUND
-        )
-        self.bandwidth_value_label.place(x=132, y=230, anchor='w')
-
-        #----------------------------------------------------------- Scale per SET BW
-        self.bw = tk.Scale(
-            self.Frame_cursori,
-            from_=9.0,
-            to=0.0,
-            resolution=1.0,
-            command=self.update_bandwidth_label,
-            showvalue=False,
-            activebackground="#d9d9d9",
-            background=COLOR_BACKGROUND,
-            font=("Segoe UI", 8, "bold"),
-            foreground=COLOR_LABEL_FOREGROUND,
-            highlightbackground=COLOR_BACKGROUND,
-            highlightcolor="black",
-            length=245,
-            troughcolor=COLOR_SLIDE_BG
-        )
-        self.bw.place(x=166, y=13, width=64, height=235)
-
-        #------------------------------------------------------------------ TX POWER Control
-        self.txp_label = tk.Label(
-            self.Frame_cursori, 
-            text="TX POWER", 
-            font=("Segoe UI", 7, "bold"),
-            background=COLOR_BACKGROUND,
-            foreground=COLOR_LABEL_FOREGROUND
-        )
-        self.txp_label.place(x=211, y=0, width=64, height=11)
-        
-        #-----------------------------------------------------------
-        self.txp = tk.Scale(
-            self.Frame_cursori, 
-            from_=15.0, 
-            to=0.0, 
-            resolution=1.0, 
-            command=lambda val: set_txpower(int(val)),
-            activebackground="#d9d9d9",
-            background=COLOR_BACKGROUND,
-            font=("Segoe UI", 8, "bold"),
-            foreground=COLOR_LABEL_FOREGROUND,
-            highlightbackground=COLOR_BACKGROUND,
-            highlightcolor="black",
-            length=245,
-            troughcolor=COLOR_SLIDE_BG
-        )
-        self.txp.place(x=213, y=13, width=64, height=235)
-
+        self.diagnostics = None
+        self.manual_ports = []          # Porte indicate a mano (es. pty), non rilevabili
+        self.first_paint = None         # Secondi dall'avvio al primo disegno della finestra
 
-
-
-
-        #---------------------------------------------------------------------------------------------
-        #--------------------------------------------------------------------------------------------- Frame Generale Pulsanti
-        #---------------------------------------------------------------------------------------------
-        
-        self.Frame_pulsanti = tk.Frame(self.top, background=COLOR_BACKGROUND, relief="flat", borderwidth=2) #
-        self.Frame_pulsanti.place(x=10, y=192, width=580, height=250)
-
-        #-----------------------------------------------------------
-        # Parametri comuni per i pulsanti
-        button_params = {
-            "background": COLOR_BUTTON_BG,
-            "foreground": COLOR_BUTTON_FG,
-            "activebackground": "#696969",
-            "activeforeground": "black",
-            "disabledforeground": "#68665a",
-            "font": ("Consolas", 11, "bold"),
-            "highlightbackground": "cornsilk4",
-            "highlightcolor": "black",
-            "padx": "6",
-            "height": 26,
-            "width": 62
-        }
-
-        #-----------------------------------------------------------
-        #-----------------------------------------------------------
-        # Sotto-frame Bande
-        self.Frame_bande = tk.Frame(
-            self.Frame_pulsanti,
-            background=COLOR_BACKGROUND,
-            relief="solid",
-            borderwidth=1,
-            highlightbackground=COLOR_FRAME_FOREGROUND,  # Colore bordo
-            highlightcolor=COLOR_LABEL_FOREGROUND,
-            highlightthickness=1,
-        )
-        self.Frame_bande.place(x=15, y=10, width=270, height=130)
-
-        # Etichette per le categorie
-        modalita_label = tk.Label(
-            self.Frame_bande,
-            text="BANDPLAN",
-            background=COLOR_BACKGROUND,
-            foreground=COLOR_LABEL_FOREGROUND,  # Colore etichetta
-            font=("Consolas", 8, "bold")
-        )
-        modalita_label.place(x=10, y=0)        
-        
-        # Pulsanti bandplan
-        self.band_buttons = [
-            {"text": "21", "command": lambda: set_band("21",21200000,9000,"SSB")},
-            {"text": "27", "command": lambda: set_band("27",27205000,10000,"FM")},
-            {"text": "28", "command": lambda: set_band("28",28600000,10000,"SSB")},
-            {"text": "50", "command": lambda: set_band("50",50150000,10000,"SSB")},
-            {"text": "70", "command": lambda: set_band("70",74025000,12500,"FM")},
-            {"text": "AIR", "command": lambda: set_band("AIR",129575000,25000,"AM")},
-            {"text": "144", "command": lambda: set_band("144",145500000,25000,"FM")},
-            {"text": "SAT", "command": lambda: set_band("SAT",261000000,25000,"FM")},
-            {"text": "430", "command": lambda: set_band("430",433500000,25000,"FM")},
-            {"text": "LPD", "command": lambda: set_band("LPD",433075000,25000,"FM")},
-            {"text": "PMR", "command": lambda: set_band("PMR",446006250,25000,"FM")},
-            {"text": "SHF", "command": lambda: set_band("SHF",1296200000,25000,"FM")},
-        ]
-
-        for i, btn in enumerate(self.band_buttons):
-            # Calcola riga e colonna per 4 colonne
-            num_cols = 4
-            row = i // num_cols  # Divisione intera per determinare la riga
-            col = i % num_cols   # Resto della divisione per determinare la colonna
-
-            # Posiziona il pulsante in base alla riga e colonna
-            button = tk.Button(self.Frame_bande, text=btn["text"], command=btn["command"])
-            button.place(
-                x=col * 65 + 5,  # Spaziatura orizzontale tra le colonne
-                y=row * 35 + 25,  # Spaziatura verticale tra le righe
-                width=button_params["width"], 
-                height=button_params["height"]
-            )
-            button.configure(**button_params)
-            self.pulsanti[btn["text"]] = button
-       
-        #-----------------------------------------------------------
-        #-----------------------------------------------------------
-        # Sotto-frame Modalità
-        self.Frame_modalita = tk.Frame(
-            self.Frame_pulsanti,
-            background=COLOR_BACKGROUND,
-            relief="solid",
-            borderwidth=1,
-            highlightbackground=COLOR_FRAME_FOREGROUND,  # Colore bordo
-            highlightcolor=COLOR_LABEL_FOREGROUND,
-            highlightthickness=1,
-        )
-        self.Frame_modalita.place(x=305, y=10, width=270, height=60)
-        
-        # Etichette per le categorie
-        modalita_label = tk.Label(
-            self.Frame_modalita,
-            text="MODE",
-            background=COLOR_BACKGROUND,
-            foreground=COLOR_LABEL_FOREGROUND,  # Colore etichetta
-            font=("Consolas", 8, "bold")
-        )
-        modalita_label.place(x=10, y=0)
-                
-        # Pulsanti Modalità
-        modalita_buttons = [
-            {"text": "FM", "command": lambda: set_mode(MODE_FM)},
-            {"text": "AM", "command": lambda: set_mode(MODE_AM)},
-            {"text": "SSB", "command": lambda: set_mode(MODE_SSB)},
-            {"text": "CW", "command": lambda: set_mode(MODE_CW)},
-        ]
-
-        for i, btn in enumerate(modalita_buttons):
-            button = tk.Button(self.Frame_modalita, text=btn["text"], command=btn["command"])
-            button.place(x=i * 65 + 5, y=25, width=button_params["width"], height=button_params["height"])  # Pulsanti distanziati
-            button.configure(**button_params)
-            # Memorizza il pulsante nel dizionario con la chiave uguale al testo
-            self.pulsanti[btn["text"]] = button
-
-        #-----------------------------------------------------------
-        #-----------------------------------------------------------
-        # Sotto-frame Funzioni 1
-        self.Frame_funzioni1 = tk.Frame(
-            self.Frame_pulsanti,
-            background=COLOR_BACKGROUND,
-            relief="solid",
-            borderwidth=1,
-            highlightbackground=COLOR_FRAME_FOREGROUND,  # Colore bordo
-            highlightcolor=COLOR_LABEL_FOREGROUND,
-            highlightthickness=1,
-        )
-        self.Frame_funzioni1.place(x=305, y=80, width=270, height=60)
-        
-        # Etichette per le categorie
-        funzioni1_label = tk.Label(
-            self.Frame_funzioni1,
-            text="FUNCTIONS",
-            background=COLOR_BACKGROUND,
-            foreground=COLOR_LABEL_FOREGROUND,  # Colore etichetta
-            font=("Consolas", 8, "bold")
-        )
-        funzioni1_label.place(x=10, y=0)
-        
-        # Pulsanti Funzioni 1
-        funzioni1_buttons = [
-            {"text": "SCAN", "command": lambda: set_scan()},
-            {"text": "AGC", "command": lambda: set_agc()},
-            {"text": "STEP", "command": lambda: set_step()},
-            {"text": "MON", "command": lambda: set_monitor()},
-        ]
-
-        for i, btn in enumerate(funzioni1_buttons):
-            button = tk.Button(self.Frame_funzioni1, text=btn["text"], command=btn["command"])
-            button.place(x=i * 65 + 5, y=25, width=button_params["width"], height=button_params["height"])  # Pulsanti distanziati
-            button.configure(**button_params)
-            self.pulsanti[btn["text"]] = button
-        
-        #-----------------------------------------------------------
-        #-----------------------------------------------------------
-        # Sotto-frame Funzioni 2
-        self.Frame_funzioni2 = tk.Frame(
-            self.Frame_pulsanti,
-            background=COLOR_BACKGROUND,
-            relief="solid",
-            borderwidth=1,
-            highlightbackground=COLOR_FRAME_FOREGROUND,  # Colore bordo
-            highlightcolor=COLOR_LABEL_FOREGROUND,
-            highlightthickness=1,
-        )
-        self.Frame_funzioni2.place(x=15, y=150, width=560, height=60)
-        
-        # Etichette per le categorie
-        funzioni2_label = tk.Label(
-            self.Frame_funzioni2,
-            text="RECEIVER",
-            background=COLOR_BACKGROUND,
-            foreground=COLOR_LABEL_FOREGROUND,  # Colore etichetta
-            font=("Consolas", 8, "bold")
-        )
-        funzioni2_label.place(x=10, y=0)
-        
-        # Pulsanti Funzioni 2
-        funzioni2_buttons = [
-            {"text": "DUALW", "command": lambda: set_nb()},
-            {"text": "SPLIT", "command": lambda: set_notch()},
-            {"text": "PRE", "command": lambda: set_pre()},
-            {"text": "ATT", "command": lambda: set_att()},
-            {"text": "RIT", "command": lambda: set_rit()},
-            {"text": "XIT", "command": lambda: set_xit()},
-            {"text": "ANT", "command": lambda: set_ant()},
-            {"text": "TUNE", "command": lambda: set_tune()},
-        ]
-
-        for i, btn in enumerate(funzioni2_buttons):
-            button = tk.Button(self.Frame_funzioni2, text=btn["text"], command=btn["command"])
-            button.place(x=i * 69 + 5, y=25, width=button_params["width"], height=button_params["height"])  # Pulsanti distanziati
-            button.configure(**button_params)
-            self.pulsanti[btn["text"]] = button
-        
-        #----------------------------------------------------------- 
-        #-----------------------------------------------------------        
-        # Sotto-frame Funzioni 3
-        self.Frame_funzioni3 = tk.Frame(
-            self.top,
-            background=COLOR_BACKGROUND,
-            relief="solid",
-            borderwidth=1,
-            highlightbackground=COLOR_FRAME_FOREGROUND,  # Colore bordo
-            highlightcolor=COLOR_LABEL_FOREGROUND,
-            highlightthickness=1,
-        )
-        self.Frame_funzioni3.place(x=610, y=345, width=270, height=60)
-        
-        # Etichette per le categorie
-        funzioni3_label = tk.Label(
-            self.Frame_funzioni3,
-            text="CONTROL",
-            background=COLOR_BACKGROUND,
-            foreground=COLOR_LABEL_FOREGROUND,  # Colore etichetta
-            font=("Consolas", 8, "bold")
-        )
-        funzioni3_label.place(x=10, y=0) 
-                
-        # Pulsanti Funzioni 3
-        funzioni1_buttons = [
-            {"text": "TSCAN", "command": lambda: set_tscan()},
-            {"text": "FCOPY", "command": lambda: set_fcopy()},
-            {"text": "PTT", "command": lambda: set_ptt()},
-            {"text": "POWER", "command": lambda: set_power()},
-        ]
-
-        for i, btn in enumerate(funzioni1_buttons):
-            button = tk.Button(self.Frame_funzioni3, text=btn["text"], command=btn["command"])
-            button.place(x=i * 65 + 5, y=25, width=button_params["width"], height=button_params["height"])  # Pulsanti distanziati
-            button.configure(**button_params)
-            self.pulsanti[btn["text"]] = button  
-            
-        #-----------------------------------------------------------
-       
-
-        #----------------------------------------------------------- Frame per la selezione della porta seriale
-        serial_frame = tk.Frame(root, bg=COLOR_BACKGROUND, width=200, height=25)
-        serial_frame.place(x=25, y=165)  # Posiziona il frame con coordinate assolute
-
-        # Label per la selezione della porta seriale
-        port_label = tk.Label(serial_frame, text="COM PORT :", bg=COLOR_BACKGROUND, fg=COLOR_LABEL_FOREGROUND, font=("Segoe UI", 8, "bold"))
-        port_label.place(x=0, y=2)
-
-        #----------------------------------------------------------- Combobox per la selezione della porta
+        # Stile della Combobox della porta (prima della creazione dei widget)
         style = ttk.Style()
         style.theme_use("clam")
         style.configure("CustomCombobox.TCombobox", fieldbackground=COLOR_BACKGROUND, background=COLOR_BACKGROUND, foreground=COLOR_LABEL_FOREGROUND)
 
-        self.port_combobox = ttk.Combobox(serial_frame, state="readonly", width=10, style="CustomCombobox.TCombobox")
-        self.port_combobox.place(x=75, y=2)
-
-        # Carica le porte disponibili all'avvio
-        ports = [port.device for port in serial.tools.list_ports.comports()]
-        self.port_combobox['values'] = ports  # Aggiorna la lista di opzioni della Combobox
-
-        #----------------------------------------------------------- LED indicatore di connessione
-        self.connection_led = tk.Label(serial_frame, bg=COLOR_ENTRY_BG, width=5, height=1, relief="solid", bd=1)
-        self.connection_led.place(x=170, y=2)  # Posiziona il LED accanto alla Combobox
+        # Widget dalla descrizione dichiarativa: S-meter e riquadri RECEIVER/CONTROL dopo il
+        # primo disegno, waterfall alla prima scansione. L'elenco delle porte arriva dal
+        # gestore della connessione (nessuna enumerazione dei dispositivi prima della finestra).
+        self.builder = PanelBuilder(self, top, PANEL_FONTS, PANEL_STYLES)
+        self.builder.build(top, panel_spec())
 
-        # Associa la selezione della porta alla funzione on_port_selected
-        self.port_combobox.bind("<<ComboboxSelected>>", self.on_port_selected)
-
-        #-----------------------------------------------------------
+        self.top.bind("<F12>", self.open_diagnostics)
+        self.top.bind("<Expose>", self.on_first_paint)
 
         self.update_vfo_status(0, bw="U06K")
         self.update_vfo_status(1, bw="U06K")
         self.update_clock()
-        #root.after(500, periodic_update)
+
+    # -----------------------------------------------------------------------------
+    def __getattr__(self, name):
+        # Widget di una sezione non ancora costruita: la sezione viene creata al primo accesso
+        builder = self.__dict__.get("builder")
+        if builder is None or builder.is_built(name):
+            raise AttributeError(name)
+        return builder.ensure(name)
+
+    # -----------------------------------------------------------------------------
+    def on_first_paint(self, event):
+        if event.widget is not self.top or self.first_paint is not None:
+            return
+        self.top.unbind("<Expose>")
+        self.top.update_idletasks()         # Completa il disegno dei widget già creati
+        self.first_paint = time.perf_counter() - STARTUP_TIME
+        print(f"Primo disegno della finestra dopo {self.first_paint * 1000:.0f} ms - {self.builder.stats()}")
+        self.top.after_idle(self.builder.build_deferred)
+
 
     #-------------------------------------------------------------------------------------------------------------------------
     # Definizione funzioni della classe
@@ -1165,38 +1014,51 @@ class Toplevel1:
     # Funzione per aprire la connessione seriale in modo sicuro
     # -----------------------------------------------------------------------------
     def open_serial_connection(self, selected_port='COM11'):
-        global ser  # Usa `ser` come variabile globale
-        try:
-            # Chiude la connessione seriale se già aperta
-            if self.ser and self.ser.is_open:
-                self.ser.close()
-                #print("Connessione seriale precedente chiusa.")
-                time.sleep(0.5)  # Pausa per assicurare che la porta sia rilasciata
-
-            # Apre la nuova connessione seriale
-            self.ser = serial.Serial(
-                port=selected_port,
-                baudrate=115200,
-                bytesize=serial.EIGHTBITS,
-                parity=serial.PARITY_NONE,
-                stopbits=serial.STOPBITS_ONE,
-                timeout=0.1
-            )
-            ser = self.ser
-            #print(f"Connessione aperta su {selected_port}, ser globale è {ser}")
-
-            # Avvia periodic_update dopo aver aperto la connessione
-            self.top.after(1000, periodic_update)
-
-        except serial.SerialException as e:
-            print(f"Errore nella connessione: {e}")
+        # Richiesta al gestore della connessione: chiusura della porta precedente, apertura,
+        # verifica e rilettura dei parametri avvengono nel suo thread, il Tk non attende
+        connection.connect(selected_port)
+
+    # -----------------------------------------------------------------------------
+    def update_ports(self, ports):
+        # Dispositivi collegati o rimossi: le porte indicate a mano restano nell'elenco
+        self.port_combobox['values'] = list(ports) + [p for p in self.manual_ports if p not in ports]
       
+    # -----------------------------------------------------------------------------
+    def open_diagnostics(self, event=None):
+        # Una sola finestra: se è già aperta viene portata in primo piano
+        if self.diagnostics is not None and self.diagnostics.winfo_exists():
+            self.diagnostics.lift()
+            return
+        self.diagnostics = DiagnosticsWindow(self.top, metrics)
+
     # Funzione per chiudere la connessione seriale all'uscita dell'app
     # -----------------------------------------------------------------------------
     def on_close(self):
-        if self.ser and self.ser.is_open:
-            self.ser.close()
-            #print("Connessione seriale chiusa all'uscita.")
+        sweep.stop()
+        dual_watch.stop()
+        dual_watch.join(1.0)
+        connection.stop()
+        sessions.close_all()
+        print(f"Ricezione CI-V - {receiver.latency.summary()}")
+        print(f"Trasmissione CI-V - {transmitter.stats()}")
+        print(f"Interrogazioni - {poller.summary()}")
+        print(f"Connessione - {connection.stats()}")
+        print(f"Scansione - {sweep.stats()}")
+        if self.builder.is_built("waterfall"):
+            print(f"Waterfall - {self.waterfall.stats()}")
+        recorder.stop()
+        print(f"Telemetria - {recorder.stats()}")
+        detector.flush()
+        activity.stop()
+        print(f"Attività - {detector.stats()} {activity.stats()}")
+        print(f"Squelch automatico - {auto_squelch.stats()} rumore per banda (MHz): {auto_squelch.floors()}")
+        if receiver.capture is not None:
+            receiver.capture.close()
+            print(f"Cattura - {receiver.capture.records} blocchi, {receiver.capture.bytes} byte in {receiver.capture.path}")
+        for extra in sessions:
+            if extra is not session:
+                print(f"Radio {extra.name} - {extra.stats()}")
+        print(f"Aggiornamenti grafici - {ui.stats()}")
         self.top.destroy()  # Chiudi la finestra principale
 
     # -----------------------------------------------------------------------------
@@ -1285,17 +1147,62 @@ class Toplevel1:
         self.squelch_timer = self.top.after(200, lambda: set_squelch(self.Squelch.get()))
 
     # -----------------------------------------------------------------------------
-    def update_frequency_display(self, frequency):
-        # Aggiorna la visualizzazione della frequenza
+    def update_frequency_display(self, frequency, lookup=True):
+        # Aggiorna la visualizzazione della frequenza (lookup=False: senza cercare il nome del canale)
         frequency_str = f"{frequency:08d}"
         formatted_frequency = f"{int(frequency_str):,}".replace(",", ".")
         self.VfoA.config(text=formatted_frequency)
 
+        # La calibrazione dello S-meter dipende dalla banda
+        self.smeter.select_calibration(frequency)
+
+        # Nome del canale di memoria corrispondente (ricerca sull'indice, solo se la frequenza cambia).
+        # Nessuna ricerca per i punti di scansione (uno per frame) né senza archivio dei canali.
+        if lookup and frequency != self.channel_frequency and channels.available:
+            self.channel_frequency = frequency
+            try:
+                channel = channels.nearest(frequency, tolerance=current_step // 2)
+            except sqlite3.Error as e:
+                print(f"Errore nella lettura dei canali: {e}")
+                channel = None
+            self.update_vfo_status(0, name=channel.name if channel else "")
+
+    # -----------------------------------------------------------------------------
+    def update_vfo_b_display(self, frequency):
+        self.VfoB.config(text=f"{frequency:,}".replace(",", "."))
+
+    # -----------------------------------------------------------------------------
+    def show_watch(self, index, squelch_open):
+        """
+        Stato del doppio ascolto: RX sul VFO con lo squelch aperto, VFO attivo in verde e
+        durata del ciclo nella riga tra i due VFO. index=None ripristina la visualizzazione.
+        """
+        if index is None:
+            for label in (self.VfoA, self.VfoB):
+                label.config(fg=COLOR_DISPLAY_FG)
+            self.Vfo[1].config(text="")
+            self.Separator.config(text="")
+            return
+        self.Vfo[index].config(text="RX" if squelch_open else "  ")
+        holding = dual_watch.holding
+        self.VfoA.config(fg=COLOR_LED_GREEN if holding == 0 else COLOR_DISPLAY_FG)
+        self.VfoB.config(fg=COLOR_LED_GREEN if holding == 1 else COLOR_DISPLAY_FG)
+        if holding is not None:
+            self.Separator.config(text=f"DUAL WATCH  HOLD {'AB'[holding]}")
+        else:
+            self.Separator.config(text=f"DUAL WATCH  {dual_watch.cycle_time * 1000:.0f} ms  "
+                                       f"{dual_watch.cycle_rate:.1f} cicli/s")
+
     # -----------------------------------------------------------------------------
     def update_rfgain(self, gain_level):
         # Aggiorna la visualizzazione dell'RF Gain
         self.RfGain.set(gain_level)
 
+    # -----------------------------------------------------------------------------
+    def update_bandwidth_display(self, bw_index):
+        # Aggiorna la posizione dello slider della larghezza di banda
+        self.bw.set(bw_index)
+
     # -----------------------------------------------------------------------------
     def update_squelch_display(self, squelch_level):
         # Aggiorna la visualizzazione dello squelch
@@ -1303,8 +1210,31 @@ class Toplevel1:
 
     # -----------------------------------------------------------------------------
     def update_smeter(self, smeter_level):
-        # Aggiorna la visualizzazione dello S-meter
-        self.smeter["value"] = smeter_level
+        # Aggiorna la visualizzazione dello S-meter (creato qui se non ancora costruito)
+        self.smeter.update_smeter(smeter_level)
+
+    # -----------------------------------------------------------------------------
+    def update_squelch_arc(self, squelch_level):
+        self.smeter.update_squelch_threshold(squelch_level)
+
+    # -----------------------------------------------------------------------------
+    def toggle_auto_squelch(self, event=None):
+        auto_squelch.enable(not auto_squelch.enabled)
+        self.show_auto_squelch()
+
+    # -----------------------------------------------------------------------------
+    def squelch_manual(self, event=None):
+        # Lo slider mosso a mano ha la precedenza sulla soglia automatica
+        if auto_squelch.enabled:
+            auto_squelch.enable(False)
+            self.show_auto_squelch()
+
+    # -----------------------------------------------------------------------------
+    def show_auto_squelch(self):
+        if auto_squelch.enabled:
+            self.Squelch_label.config(text="SQL AUTO", fg=COLOR_LED_GREEN)
+        else:
+            self.Squelch_label.config(text="SQUELCH", fg=COLOR_LABEL_FOREGROUND)
     
     # -----------------------------------------------------------------------------
     def update_bandwidth_label(self, value):
@@ -1340,6 +1270,7 @@ class Toplevel1:
             f"{self.vfo_status[vfo_index]['bw']:<4} "
             f"{self.vfo_status[vfo_index]['step']:<5} "
             f"{self.vfo_status[vfo_index]['mon']:<3} "
+            f"{self.vfo_status[vfo_index]['name'][:16]}"
         )
 
         # Aggiorna la visualizzazione di stato per il VFO A o B
@@ -1389,16 +1320,38 @@ class Toplevel1:
 class SMeter(tk.Frame):
     instance = None  # Definizione di una variabile di classe per tenere traccia dell'istanza
 
-    def __init__(self, parent, scale_factor=1.0, x=0, y=0):
+    NEEDLE_STEPS = 256                      # Valori possibili della lancetta (0-255)
+
+    def __init__(self, parent, scale_factor=1.0, x=0, y=0, ballistics=False, attack=0.6, decay=0.25, fps=30,
+                 calibration=None):
         super().__init__(parent, bd=5, relief="sunken", bg="#a0a0a0")
         self.parent = parent
         self.scale_factor = scale_factor    # Usa il valore passato come argomento
         self.squelch_threshold = 0          # Valore iniziale della soglia dello squelch
         self.current_value = 0              # Valore iniziale della lancetta
+        self.target_value = 0               # Valore verso cui si muove la lancetta (balistica)
         self.needle = None                  # Inizializza la lancetta come None
         self.needle_id = None               # Inizializza l'ID della lancetta qui
+        self.needle_pos = None              # Coordinate in pixel attualmente disegnate
+        self.squelch_arc_id = None          # ID dell'arco verde dello squelch
+        self.squelch_extent = None          # Estensione attualmente disegnata dell'arco
         self.rssi_value = 0                 # Valore iniziale RSSI
         self.s_meter_value = "S0"           # Valore iniziale scala S
+        self.rssi_text = None               # Testi attualmente visualizzati nelle etichette
+        self.s_meter_text = None
+        self.redraws = 0                    # Spostamenti effettivi della lancetta
+        self.skipped_redraws = 0            # Aggiornamenti senza variazione in pixel
+
+        # Balistica opzionale della lancetta (salita/discesa) a frame rate fisso
+        self.ballistics = ballistics
+        self.attack = attack
+        self.decay = decay
+        self.frame_ms = max(1, int(1000 / fps))
+        self.animation_id = None
+
+        # Conversione RSSI grezzo -> dBm -> unità S con profili per banda (file opzionale)
+        self.calibration = calibration if calibration is not None else RssiCalibration.load()
+        threading.Thread(target=self.calibration.build_all, daemon=True).start()
 
         # Assegna l'istanza corrente alla variabile di classe
         SMeter.instance = self
@@ -1432,6 +1385,22 @@ class SMeter(tk.Frame):
 
         # Disegno del quadrante
         self.draw_meter_scale()
+
+        # Tabella precalcolata delle coordinate della lancetta per ogni valore
+        self.needle_table = [
+            tuple(round(c) for c in self.calculate_needle_coordinates(self.calculate_angle(value)))
+            for value in range(self.NEEDLE_STEPS)
+        ]
+        self.needle_pos = None
+        self.rssi_text = None
+        self.s_meter_text = None
+
+        # Lancetta creata una sola volta, poi spostata con canvas.coords
+        self.needle_id = self.canvas.create_line(
+            *self.needle_table[0],
+            width=3,
+            fill="red"
+        )
         
         # Aggiungi il valore RSSI in basso a sinistra
         self.rssi_label = self.canvas.create_text(
@@ -1504,17 +1473,15 @@ class SMeter(tk.Frame):
         )
         
         #----------------------------------------------------------- Disegna l'arco verde per la soglia dello squelch
-        squelch_angle = 150 - ((self.squelch_threshold) / 255) * 120  # Calcola l'angolo per la soglia dello squelch
-
-        # Limita l'angolo minimo dell'arco per non superare +60 dB (30 gradi)
-        squelch_angle = max(min(round(squelch_angle), 150), 30)
+        self.squelch_extent = self.calculate_squelch_extent(self.squelch_threshold)
         
-        self.canvas.create_arc(
+        self.squelch_arc_id = self.canvas.create_arc(
             self.center_x - (self.radius - int(30 * self.scale_factor)),
             self.center_y - (self.radius - int(30 * self.scale_factor)),
             self.center_x + (self.radius - int(30 * self.scale_factor)),
             self.center_y + (self.radius - int(30 * self.scale_factor)),
-            start=150, extent=-(150 - squelch_angle), outline="green", width=max(2, int(6 * self.scale_factor)), style="arc"
+            start=150, extent=self.squelch_extent, outline="green", width=max(2, int(6 * self.scale_factor)), style="arc",
+            tags="squelch_arc"
         )
 
         # Aggiungi la scritta "SIGNAL" al centro
@@ -1529,34 +1496,56 @@ class SMeter(tk.Frame):
         self.draw_needle(self.current_value)
 
     # -----------------------------------------------------------------------------
-    def update_squelch_threshold(self, squelch_threshold):
+    def calculate_squelch_extent(self, squelch_threshold):
         """
-        Aggiorna la soglia dello squelch e ridisegna l'arco verde sul canvas.
+        Calcola l'estensione dell'arco verde per la soglia dello squelch.
         """
-        self.squelch_threshold = squelch_threshold
+        squelch_angle = 150 - (squelch_threshold / 255) * 120
 
-        # Calcola l'angolo corrispondente
-        squelch_angle = 150 - ((self.squelch_threshold) / 255) * 120
+        # Limita l'angolo minimo dell'arco per non superare +60 dB (30 gradi)
         squelch_angle = max(min(round(squelch_angle), 150), 30)
+        return -(150 - squelch_angle)
 
-        # Ridisegna l'arco verde per la soglia
-        self.canvas.delete("squelch_arc")
-        self.canvas.create_arc(
-            self.center_x - (self.radius - int(30 * self.scale_factor)),
-            self.center_y - (self.radius - int(30 * self.scale_factor)),
-            self.center_x + (self.radius - int(30 * self.scale_factor)),
-            self.center_y + (self.radius - int(30 * self.scale_factor)),
-            start=150, extent=-(150 - squelch_angle), outline="green",
-            width=max(2, int(6 * self.scale_factor)), style="arc", tags="squelch_arc"
-        )
+    # -----------------------------------------------------------------------------
+    def update_squelch_threshold(self, squelch_threshold):
+        """
+        Aggiorna la soglia dello squelch modificando l'arco verde già presente sul canvas.
+        """
+        self.squelch_threshold = squelch_threshold
+
+        extent = self.calculate_squelch_extent(squelch_threshold)
+        if extent != self.squelch_extent:
+            self.squelch_extent = extent
+            self.canvas.itemconfig(self.squelch_arc_id, extent=extent)
 
     # -----------------------------------------------------------------------------
     def update_needle(self, target_value):
         """
-        Aggiorna direttamente la lancetta al valore target.
+        Aggiorna la lancetta al valore target, direttamente oppure tramite la balistica.
+        """
+        self.target_value = target_value
+        if not self.ballistics:
+            self.current_value = target_value
+            self.draw_needle(self.current_value)
+        elif self.animation_id is None:
+            self.animation_id = self.after(self.frame_ms, self.animate_needle)
+
+    # -----------------------------------------------------------------------------
+    def animate_needle(self):
         """
-        self.current_value = target_value
+        Un passo della balistica: salita rapida (attack), discesa lenta (decay).
+        Il ciclo si ferma quando la lancetta ha raggiunto il valore target.
+        """
+        delta = self.target_value - self.current_value
+        if abs(delta) < 0.5:
+            self.current_value = self.target_value
+            self.draw_needle(self.current_value)
+            self.animation_id = None
+            return
+
+        self.current_value += delta * (self.attack if delta > 0 else self.decay)
         self.draw_needle(self.current_value)
+        self.animation_id = self.after(self.frame_ms, self.animate_needle)
 
     # -----------------------------------------------------------------------------
     def calculate_angle(self, value):
@@ -1569,53 +1558,46 @@ class SMeter(tk.Frame):
     # -----------------------------------------------------------------------------
     def draw_needle(self, value):
         """
-        Disegna la lancetta sul canvas in base al valore fornito.
+        Sposta la lancetta usando la tabella delle coordinate precalcolate.
+        Se la posizione in pixel non cambia il canvas non viene toccato.
         """
-        if self.needle_id is not None:
-            self.canvas.delete(self.needle_id)
-
-        # Calcola l'angolo e le coordinate della lancetta
-        angle = self.calculate_angle(value)
-        x1, y1, x2, y2 = self.calculate_needle_coordinates(angle)
+        index = min(max(int(round(value)), 0), self.NEEDLE_STEPS - 1)
+        position = self.needle_table[index]
+        if position == self.needle_pos:
+            self.skipped_redraws += 1
+            return
 
-        # Disegna la lancetta
-        self.needle_id = self.canvas.create_line(
-            x1, y1, x2, y2,
-            width=3,
-            fill="red"
-        )
+        self.needle_pos = position
+        self.canvas.coords(self.needle_id, *position)
+        self.redraws += 1
 
     # -----------------------------------------------------------------------------
     def calculate_needle_coordinates(self, angle):
         """
-        Calcola le coordinate della lancetta.
+        Calcola le coordinate della lancetta (usata per riempire la tabella precalcolata).
         """
         radius = self.radius - 10
-        end_x = self.center_x + radius * math.cos(math.radians(angle))
-        end_y = self.center_y - radius * math.sin(math.radians(angle))
-        start_x = self.center_x - (radius * 0.2) * math.cos(math.radians(angle))
-        start_y = self.center_y + (radius * 0.2) * math.sin(math.radians(angle))
+        cos_a = math.cos(math.radians(angle))
+        sin_a = math.sin(math.radians(angle))
+        end_x = self.center_x + radius * cos_a
+        end_y = self.center_y - radius * sin_a
+        start_x = self.center_x - (radius * 0.2) * cos_a
+        start_y = self.center_y + (radius * 0.2) * sin_a
         return start_x, start_y, end_x, end_y
 
     # -----------------------------------------------------------------------------
     def calculate_smeter_value(self, livello_dB):
         """
-        Converte il livello in dB in valore S-meter (0-13).
+        Converte il livello in dB in valore S-meter (0-13) secondo il profilo di calibrazione attivo.
         """
-        livelli_s = [
-            (-147, 0), (-141, 1), (-135, 2), (-129, 3), (-123, 4),
-            (-117, 5), (-111, 6), (-105, 7), (-99, 8), (-93, 9), 
-            (-83, 10), (-73, 11), (-63, 12), (-53, 13)
-        ]
-
-        for i in range(len(livelli_s) - 1):
-            dBm_min, s_min = livelli_s[i]
-            dBm_max, s_max = livelli_s[i + 1]
-            if dBm_min <= livello_dB <= dBm_max:
-                frazione = (livello_dB - dBm_min) / (dBm_max - dBm_min)
-                return s_min + frazione * (s_max - s_min)
+        return self.calibration.active.s_from_dbm(livello_dB)
 
-        return 0 if livello_dB < livelli_s[0][0] else 13
+    # -----------------------------------------------------------------------------
+    def select_calibration(self, frequency):
+        """
+        Seleziona il profilo di calibrazione RSSI per la frequenza del VFO.
+        """
+        self.calibration.select(frequency)
 
     # -----------------------------------------------------------------------------
     def update_smeter(self, valore):
@@ -1626,12 +1608,11 @@ class SMeter(tk.Frame):
         alpha = 0.5 if abs(valore - self.filtered_value) > 20 else 0.3
         self.filtered_value = self.filtered_value * (1 - alpha) + valore * alpha
 
-        # Calcola il livello in dB
-        livello_dB = (self.filtered_value / 2) - 160
+        # Livello in dB e valore S-meter dalla tabella del profilo attivo
+        livello_dB, smeter_value = self.calibration.convert(round(self.filtered_value))
         self.rssi_value = round(livello_dB, 1)
 
-        # Converte in valore S-meter e aggiorna la lancetta
-        smeter_value = self.calculate_smeter_value(livello_dB)
+        # Aggiorna la lancetta
         smeter_target_value = int((smeter_value / 13) * 255)
         self.update_needle(smeter_target_value)
 
@@ -1642,37 +1623,436 @@ class SMeter(tk.Frame):
             increment = int((smeter_value - 9) * 10)
             self.s_meter_value = f"S9+{increment}"
 
-        self.canvas.itemconfig(self.rssi_label, text=f"RSSI: {self.rssi_value} dBm")
-        self.canvas.itemconfig(self.s_meter_label, text=f"{self.s_meter_value}")
+        # Le etichette vengono riconfigurate solo se il testo cambia
+        rssi_text = f"RSSI: {self.rssi_value} dBm"
+        if rssi_text != self.rssi_text:
+            self.rssi_text = rssi_text
+            self.canvas.itemconfig(self.rssi_label, text=rssi_text)
 
+        if self.s_meter_value != self.s_meter_text:
+            self.s_meter_text = self.s_meter_value
+            self.canvas.itemconfig(self.s_meter_label, text=self.s_meter_value)
+
+
+#-------------------------------------------------------------------------------------------------------------------------
+# Waterfall
+#-------------------------------------------------------------------------------------------------------------------------
+#
+class Waterfall(tk.Frame):
+    """
+    Waterfall delle scansioni: ogni sweep diventa una riga colorata di una tk.PhotoImage.
+
+    - La PhotoImage stessa è un buffer circolare di `history` righe: ogni nuova riga
+      sovrascrive la più vecchia con un'unica put, e lo scorrimento si ottiene spostando
+      due elementi immagine del canvas (nessun ridisegno dell'intera immagine).
+    - I livelli (0-255) sono conservati in un bytearray preallocato, anch'esso circolare,
+      usato per ridisegnare tutto quando cambia la scala.
+    - La conversione RSSI -> livello -> RGB avviene nel thread che chiama push_sweep();
+      il thread Tk esegue solo la put delle righe pronte.
+    """
+    instance = None
+
+    def __init__(self, parent, width=512, history=96, raw_min=0, raw_max=255):
+        super().__init__(parent, bd=2, relief="sunken", bg=COLOR_DISPLAY_BG)
+        self.width = width
+        self.history = history
+
+        self.rows_pushed = 0                # Righe ricevute
+        self.rows_rendered = 0              # Righe scritte nell'immagine
+        self.rows_dropped = 0               # Righe scartate perché il Tk era in ritardo
+
+        self.levels = bytearray(width * history)    # Buffer circolare dei livelli
+        self.head = 0                               # Riga dell'immagine con la scansione più recente
+        self.level_table = None                     # RSSI grezzo -> livello 0-255
+        self.columns = None                         # Colonna -> indice del punto di scansione
+        self.span = None                            # (frequenza iniziale, frequenza finale, punti)
+
+        self._ready = collections.deque(maxlen=history)     # Righe RGB pronte per la put
+        self._lock = threading.Lock()
+
+        # Tavolozza precalcolata: tre tabelle per bytes.translate (R, G, B)
+        self.palette_r, self.palette_g, self.palette_b = self.build_palette()
+        self.set_range(raw_min, raw_max)
+
+        Waterfall.instance = self
+
+        # Il canvas dell'immagine è alto esattamente `history` righe: la copia avvolta
+        # (bottom_item) non può invadere la riga delle frequenze, che ha un canvas proprio
+        self.canvas = tk.Canvas(self, width=width, height=history, bg=COLOR_DISPLAY_BG, highlightthickness=0, bd=0)
+        self.canvas.pack(side='top', fill='x')
+        self.labels = tk.Canvas(self, width=width, height=WATERFALL_LABELS, bg=COLOR_DISPLAY_BG,
+                                highlightthickness=0, bd=0)
+        self.labels.pack(side='top', fill='x')
+
+        self.image = tk.PhotoImage(width=width, height=history)
+        self.image.put("black", to=(0, 0, width, history))
+        self.top_item = self.canvas.create_image(0, 0, image=self.image, anchor='nw')
+        self.bottom_item = self.canvas.create_image(0, history, image=self.image, anchor='nw')
+
+        font = ("Segoe UI", 7)
+        middle = WATERFALL_LABELS // 2
+        self.start_label = self.labels.create_text(2, middle, text="", anchor='w', font=font, fill=COLOR_DISPLAY_FG)
+        self.stop_label = self.labels.create_text(width - 2, middle, text="", anchor='e', font=font, fill=COLOR_DISPLAY_FG)
+
+    # -----------------------------------------------------------------------------
+    @staticmethod
+    def build_palette():
+        """
+        Tavolozza a 256 colori nero -> blu -> ciano -> giallo -> rosso.
+        """
+        stops = ((0, (0, 0, 0)), (64, (0, 0, 192)), (128, (0, 192, 192)), (192, (255, 255, 0)), (255, (255, 0, 0)))
+        r, g, b = bytearray(256), bytearray(256), bytearray(256)
+        for (l0, c0), (l1, c1) in zip(stops, stops[1:]):
+            for level in range(l0, l1 + 1):
+                t = (level - l0) / (l1 - l0)
+                r[level], g[level], b[level] = (round(a + (c - a) * t) for a, c in zip(c0, c1))
+        return bytes(r), bytes(g), bytes(b)
+
+    # -----------------------------------------------------------------------------
+    def set_range(self, raw_min, raw_max):
+        """
+        Imposta i valori RSSI grezzi corrispondenti al primo e all'ultimo colore.
+        """
+        scale = 255 / max(1, raw_max - raw_min)
+        table = bytes(min(255, max(0, int((raw - raw_min) * scale))) for raw in range(raw_min, raw_max + 1))
+        self.raw_min = raw_min
+        self.level_table = table
+
+    # -----------------------------------------------------------------------------
+    def row_levels(self, rssi):
+        """
+        Ricampiona una scansione sulla larghezza del widget e la converte in livelli 0-255.
+        """
+        count = len(rssi)
+        if self.columns is None:
+            self.columns = [c * count // self.width for c in range(self.width)]
+        table = self.level_table
+        top = len(table) - 1
+        raw_min = self.raw_min
+        return bytes(table[min(max(rssi[c] - raw_min, 0), top)] for c in self.columns)
+
+    # -----------------------------------------------------------------------------
+    def row_rgb(self, levels):
+        """
+        Converte una riga di livelli in dati PPM (una riga di pixel RGB).
+        """
+        rgb = bytearray(3 * len(levels))
+        rgb[0::3] = levels.translate(self.palette_r)
+        rgb[1::3] = levels.translate(self.palette_g)
+        rgb[2::3] = levels.translate(self.palette_b)
+        return b"P6\n%d 1\n255\n" % len(levels) + bytes(rgb)
+
+    # -----------------------------------------------------------------------------
+    def push_sweep(self, frequencies, rssi):
+        """
+        Aggiunge una scansione completa. Thread-safe: può essere chiamata dal thread di scansione.
+        """
+        span = (frequencies[0], frequencies[-1], len(frequencies))
+        with self._lock:
+            if span != self.span:
+                self.span = span
+                self.columns = None
+                ui.post("waterfall_span", self.update_span, span[0], span[1])
+            levels = self.row_levels(rssi)
+            if len(self._ready) == self._ready.maxlen:
+                self.rows_dropped += 1
+            self._ready.append((levels, self.row_rgb(levels)))
+            self.rows_pushed += 1
+        ui.post("waterfall", self.render_rows, force=True)
+
+    # -----------------------------------------------------------------------------
+    def render_rows(self):
+        """
+        Scrive nell'immagine le righe pronte (dal thread Tk) e fa scorrere la vista.
+        """
+        with self._lock:
+            rows = list(self._ready)
+            self._ready.clear()
+        if not rows:
+            return
+
+        width, history = self.width, self.history
+        for levels, ppm in rows:
+            self.head = (self.head - 1) % history
+            offset = self.head * width
+            self.levels[offset:offset + width] = levels
+            self.image.put(ppm, to=(0, self.head))
+        self.rows_rendered += len(rows)
+
+        # La riga più recente (head) va in cima, le più vecchie seguono con l'avvolgimento
+        self.canvas.coords(self.top_item, 0, -self.head)
+        self.canvas.coords(self.bottom_item, 0, history - self.head)
+
+    # -----------------------------------------------------------------------------
+    def redraw(self):
+        """
+        Ricolora l'intera immagine dal buffer dei livelli (es. dopo un cambio di tavolozza).
+        """
+        width, history = self.width, self.history
+        rgb = bytearray(3 * width * history)
+        rgb[0::3] = self.levels.translate(self.palette_r)
+        rgb[1::3] = self.levels.translate(self.palette_g)
+        rgb[2::3] = self.levels.translate(self.palette_b)
+        self.image.put(b"P6\n%d %d\n255\n" % (width, history) + bytes(rgb), to=(0, 0))
+
+    # -----------------------------------------------------------------------------
+    def update_span(self, start, stop):
+        self.labels.itemconfig(self.start_label, text=f"{start:,}".replace(",", "."))
+        self.labels.itemconfig(self.stop_label, text=f"{stop:,}".replace(",", "."))
+
+    # -----------------------------------------------------------------------------
+    def stats(self):
+        return {
+            "pushed": self.rows_pushed,
+            "rendered": self.rows_rendered,
+            "dropped": self.rows_dropped,
+        }
+
+
+
+
+#-------------------------------------------------------------------------------------------------------------------------
+# Pannello diagnostico
+#-------------------------------------------------------------------------------------------------------------------------
+#
+class DiagnosticsWindow(tk.Toplevel):
+    """
+    Finestra con lo stato del collegamento e dell'interfaccia (frame per opcode, errori di
+    parsing, code, latenze, ritardo del ciclo Tk). Le metriche vengono lette una volta al
+    secondo e solo finché la finestra è aperta.
+    """
+    REFRESH_MS = 1000
+
+    def __init__(self, parent, registry):
+        super().__init__(parent, bg=COLOR_BACKGROUND)
+        self.title("Diagnostica")
+        self.geometry("640x420")
+        self.registry = registry
+
+        self.text = tk.Text(self, bg=COLOR_DISPLAY_BG, fg=COLOR_DISPLAY_FG, font=("Consolas", 9),
+                            relief="flat", wrap="none")
+        self.text.pack(fill="both", expand=True, padx=4, pady=4)
+
+        self._after_id = None
+        self.protocol("WM_DELETE_WINDOW", self.close)
+        self.refresh()
+
+    # -----------------------------------------------------------------------------
+    def refresh(self):
+        content = self.registry.render_text()
+        self.text.configure(state="normal")
+        self.text.delete("1.0", "end")
+        self.text.insert("1.0", content)
+        self.text.configure(state="disabled")
+        self._after_id = self.after(self.REFRESH_MS, self.refresh)
+
+    # -----------------------------------------------------------------------------
+    def close(self):
+        if self._after_id is not None:
+            self.after_cancel(self._after_id)
+            self._after_id = None
+        self.destroy()
+
+
+#-------------------------------------------------------------------------------------------------------------------------
+# Vista compatta di una radio aggiuntiva
+#-------------------------------------------------------------------------------------------------------------------------
+#
+class RadioView(tk.Toplevel):
+    """
+    Frequenza, S-meter, squelch e stato RX/TX di una sessione (--extra-port).
+
+    La vista ascolta solo lo stato della propria sessione: le variazioni arrivano dal thread
+    di smistamento di quella radio e passano dal dispatcher grafico con chiavi distinte per
+    sessione, quindi più radio non si contendono né widget né variabili globali.
+    """
+
+    def __init__(self, parent, session, calibration=None):
+        super().__init__(parent, bg=COLOR_BACKGROUND)
+        self.session = session
+        self.calibration = calibration if calibration is not None else RssiCalibration.load()
+        self.title(f"Radio {session.name}")
+        self.geometry("380x130")
+        self.resizable(False, False)
+
+        self.status_label = tk.Label(self, text="  ", font=("Consolas", fontLBL, "bold"),
+                                     bg=COLOR_DISPLAY_BG, fg=COLOR_DISPLAY_FG)
+        self.status_label.place(x=10, y=10, width=52, height=altezzavfo)
+
+        self.frequency_label = tk.Label(self, text="0", font=("Consolas", fontVFO, "bold"), anchor="e",
+                                        bg=COLOR_DISPLAY_BG, fg=COLOR_DISPLAY_FG, padx=5)
+        self.frequency_label.place(x=62, y=10, width=308, height=altezzavfo)
+        self.frequency_label.bind("<Button-1>", self.ask_frequency)
+
+        self.smeter = ttk.Progressbar(self, orient="horizontal", mode="determinate", maximum=100)
+        self.smeter.place(x=10, y=65, width=250, height=18)
+        self.level_label = tk.Label(self, text="", font=("Consolas", fontSTS), anchor="w",
+                                    bg=COLOR_BACKGROUND, fg=COLOR_LABEL_FOREGROUND)
+        self.level_label.place(x=265, y=62, width=110, height=24)
+
+        self.squelch = tk.Scale(self, from_=0, to=255, orient="horizontal", showvalue=False,
+                                background=COLOR_BACKGROUND, troughcolor=COLOR_SCALE_TROUGH,
+                                highlightthickness=0, bd=0)
+        self.squelch.place(x=10, y=95, width=250, height=20)
+        # Invio al rilascio: gli aggiornamenti letti dalla radio non vengono rimandati indietro
+        self.squelch.bind("<ButtonRelease-1>", lambda event: self.session.radio.set_squelch(self.squelch.get()))
+        tk.Label(self, text="SQL", font=("Consolas", 8, "bold"), bg=COLOR_BACKGROUND,
+                 fg=COLOR_LABEL_FOREGROUND).place(x=265, y=95)
+
+        session.radio.add_listener(self.on_state)
+        self.protocol("WM_DELETE_WINDOW", self.close)
+
+    # -----------------------------------------------------------------------------
+    def on_state(self, name, value):
+        # Thread di smistamento della sessione: solo post verso il thread Tk
+        key = (self.session.name, name)
+        if name == "frequency":
+            ui.post(key, self.show_frequency, value)
+        elif name == "rssi":
+            ui.post(key, self.show_rssi, value)
+        elif name == "squelch":
+            ui.post(key, self.squelch.set, value)
+        elif name == "status":
+            ui.post(key, self.show_status, value)
+
+    # -----------------------------------------------------------------------------
+    def show_frequency(self, frequency):
+        self.frequency_label.config(text=f"{frequency:,}".replace(",", "."))
+        self.calibration.select(frequency)
+
+    def show_rssi(self, raw):
+        dbm, s_units = self.calibration.convert(raw)
+        self.smeter["value"] = min(max(dbm + 130, 0), 100)      # Scala -130 ... -30 dBm
+        self.level_label.config(text=f"{dbm:.0f} dBm S{s_units:.0f}")
+
+    def show_status(self, flags):
+        self.status_label.config(text="TX" if flags & 0x0004 else "RX" if flags & 0x0003 else "  ")
+
+    # -----------------------------------------------------------------------------
+    def ask_frequency(self, event=None):
+        from tkinter import simpledialog
+        value = simpledialog.askinteger(f"Radio {self.session.name}", "Frequenza (Hz):", parent=self,
+                                        initialvalue=self.session.state["frequency"] or 0, minvalue=0)
+        if value:
+            self.session.radio.set_frequency(value)
+
+    # -----------------------------------------------------------------------------
+    def close(self):
+        self.session.radio.remove_listener(self.on_state)
+        self.destroy()
+        # La chiusura della sessione attende i thread di ricezione e trasmissione (fino al
+        # timeout della porta): avviene in un thread dedicato per non bloccare il thread Tk
+        threading.Thread(target=sessions.remove, args=(self.session.name,), daemon=True).start()
 
 
-        
 #-------------------------------------------------------------------------------------------------------------------------
 # 
 #-------------------------------------------------------------------------------------------------------------------------
 # 
        
+# -----------------------------------------------------------------------------
+def replay_capture(path, speed):
+    """
+    Riproduce una cattura attraverso parser, nucleo e process_civ_message, senza porta seriale.
+    """
+    replayer = CaptureReplayer(path, radio.handle_frame, speed=speed)
+    replayer.run()
+    print(f"Riproduzione {path} - {replayer.summary()}")
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="IJV Radio Panel")
+    parser.add_argument("--port", help="porta da aprire all'avvio (es. il pty di civ_simulator.py)")
+    parser.add_argument("--auto-connect", action="store_true",
+                        help="cerca la radio su tutte le porte (risposta a COMMAND_GET_STATUS)")
+    parser.add_argument("--capture", metavar="FILE", help="registra il traffico seriale grezzo in FILE")
+    parser.add_argument("--replay", metavar="FILE", help="riproduce una cattura senza porta seriale")
+    parser.add_argument("--speed", type=float, default=1.0, help="velocità di riproduzione (0 = massima)")
+    parser.add_argument("--extra-port", action="append", default=[], metavar="PORTA",
+                        help="radio aggiuntiva con vista compatta (ripetibile)")
+    parser.add_argument("--channels", metavar="FILE",
+                        help=f"archivio dei canali di memoria (default {CHANNELS_FILE} accanto al programma)")
+    parser.add_argument("--activity", metavar="FILE", help="registro dell'attività dei canali (default activity.db)")
+    parser.add_argument("--auto-squelch", type=int, nargs="?", const=12, metavar="MARGINE",
+                        help="squelch automatico a MARGINE unità RSSI sopra il rumore (default 12)")
+    parser.add_argument("--vfo-b", type=int, metavar="HZ", help="frequenza del VFO B per il doppio ascolto (DUALW)")
+    parser.add_argument("--scan-tag", metavar="TAG", help="etichetta dei canali per la scansione delle memorie (MSCAN)")
+    parser.add_argument("--serve", nargs="?", const=f"127.0.0.1:{SERVER_PORT}", metavar="[HOST:]PORTA",
+                        help=f"condivide la radio principale con client TCP (default 127.0.0.1:{SERVER_PORT})")
+    parser.add_argument("--metrics-port", type=int, nargs="?", const=METRICS_PORT, metavar="PORTA",
+                        help=f"espone le metriche su http://127.0.0.1:PORTA/metrics (default {METRICS_PORT})")
+    args = parser.parse_args()
+
+    if args.channels:
+        channels = ChannelStore(args.channels)
+    if args.activity:
+        activity = ActivityStore(args.activity)
+        detector.on_event = activity.record
+    memory_scan_tag = args.scan_tag
+
+    if args.capture:
+        # Lo stesso file registra sia i byte ricevuti sia quelli inviati
+        receiver.capture = transmitter.capture = CaptureWriter(args.capture)
+
     root = tk.Tk()
     root.geometry("800x600")  # Assicurati che ci sia abbastanza spazio nella finestra principale
     radio_panel = Toplevel1(root)
+    metrics.gauge("ui_first_paint_seconds", "Tempo dall'avvio al primo disegno della finestra",
+                  lambda: round(radio_panel.first_paint or 0.0, 3))
+
+    # Avvio dei thread di lettura, scrittura e smistamento del nucleo e dello schedulatore
+    session.start()
+    connection.start()
+    recorder.start()
+    activity.start()
+
+    # Radio aggiuntive: una sessione indipendente e una vista compatta per ciascuna
+    for extra_port in args.extra_port:
+        extra = sessions.add(extra_port)
+        if extra.open():
+            RadioView(root, extra)
+
+    if args.serve:
+        # I client ricevono lo stato del nucleo e inviano comandi senza aprire la seriale
+        host, _, port = args.serve.rpartition(":")
+        server = ControlServer(radio, host or "127.0.0.1", int(port))
+        print(f"Radio condivisa su {server.host}:{server.start()}")
+        metrics.gauge("server_clients", "Client TCP collegati", lambda: len(server.clients))
+        metrics.counter("server_commands_total", "Comandi dei client TCP passati alla radio",
+                        lambda: server.commands_forwarded)
+
+    if args.metrics_port is not None:
+        metrics_server = MetricsServer(metrics, args.metrics_port).start()
+        print(f"Metriche su http://127.0.0.1:{metrics_server.port}/metrics")
+
+    # Ciclo unico di aggiornamento dei widget
+    ui.start(root)
 
-    # Avvio del thread di lettura seriale
-    serial_thread = threading.Thread(target=read_from_port, daemon=True)
-    serial_thread.start()
-
-    # Esegui il thread per la gestione dei dati
-    processing_thread = threading.Thread(target=process_data, daemon=True)
-    processing_thread.start()
-    
     # Esegui il thread per il timeout
     timeout_thread = threading.Thread(target=led_timeout_manager, daemon=True)
     timeout_thread.start()
 
-    ser.set_buffer_size(rx_size=4096, tx_size=4096)  # Modifica il buffer seriale
-
     root.after(1000, periodic_update)     # Ritardo più lungo per dare tempo alla seriale di stabilizzarsi
+
+    if args.replay:
+        threading.Thread(target=replay_capture, args=(args.replay, args.speed), daemon=True).start()
     radio_panel.cambia_stato(radio_panel.pulsanti["FM"], 1)
+    if args.vfo_b:
+        vfo_b_frequency = args.vfo_b
+        radio_panel.update_vfo_b_display(vfo_b_frequency)
+    if args.auto_squelch is not None:
+        auto_squelch.margin = args.auto_squelch
+        radio_panel.toggle_auto_squelch()
+
+    if args.port:
+        # Le porte virtuali (pty) non compaiono tra quelle rilevate: si aggiungono all'elenco
+        ports = list(radio_panel.port_combobox['values'])
+        if args.port not in ports:
+            radio_panel.manual_ports.append(args.port)
+            radio_panel.port_combobox['values'] = ports + [args.port]
+        radio_panel.port_combobox.set(args.port)
+        radio_panel.open_serial_connection(args.port)
+    elif args.auto_connect:
+        connection.connect(None)
     
     root.mainloop()
@@ -30,6 +30,8 @@ import threading
 import serial
 import time
 
+from civ_codec import FrameParser
+
 
 # Definizione degli indirizzi del protocollo CI-V
 CIV_START_BYTE = 0xFE
@@ -74,59 +76,38 @@ _style_code_ran = 0
 
 altezzavfo = 56
 
+ser = None                          # Aperta da open_serial_port() all'avvio, non all'import
+
 # Configurazione della porta seriale
-try:
-    ser = serial.Serial(
-        port='COM11',               # Modifica con la porta corretta
-        baudrate=115200,
-        bytesize=serial.EIGHTBITS,
-        parity=serial.PARITY_NONE,
-        stopbits=serial.STOPBITS_ONE,
-        timeout=5
-    )
-except serial.SerialException as e:
-    root = tk.Tk()
-    root.withdraw()  # Nasconde la finestra principale
-    messagebox.showerror("Errore Porta Seriale", f"Impossibile aprire la porta seriale: {e}")
-    sys.exit(1)  # Esci con errore
+def open_serial_port(port='COM11'):     # Modifica con la porta corretta
+    global ser
+    try:
+        ser = serial.Serial(
+            port=port,
+            baudrate=115200,
+            bytesize=serial.EIGHTBITS,
+            parity=serial.PARITY_NONE,
+            stopbits=serial.STOPBITS_ONE,
+            timeout=5
+        )
+    except serial.SerialException as e:
+        root = tk.Tk()
+        root.withdraw()  # Nasconde la finestra principale
+        messagebox.showerror("Errore Porta Seriale", f"Impossibile aprire la porta seriale: {e}")
+        sys.exit(1)  # Esci con errore
+    return ser
 
 #-------------------------------------------------------------------------------------------------------------------------
 # Funzioni Threading
 #-------------------------------------------------------------------------------------------------------------------------
 def read_from_port(ser):
-    response_buffer = []        # Buffer per accumulare i dati ricevuti
+    parser = FrameParser()      # Parser incrementale: preambolo, indirizzi e risincronizzazione
     while True:
-        if ser.in_waiting > 0:
-            # Leggi tutti i byte disponibili
-            data = ser.read(ser.in_waiting)
-            response_buffer.extend(data)
-            #print(data)
-
-            # Continua a cercare finché non troviamo il byte di terminazione (CI-V END BYTE)
-            while CIV_END_BYTE in response_buffer:
-                # Trova l'indice del terminatore
-                end_index = response_buffer.index(CIV_END_BYTE)
-                
-                # Estrai il messaggio completo
-                message = response_buffer[:end_index + 1]
-                
-                # Rimuovi il messaggio elaborato dal buffer
-                response_buffer = response_buffer[end_index + 1:]
-
-                # Verifica che il messaggio sia un messaggio CI-V valido
-                if len(message) >= 6 and message[0] == CIV_START_BYTE and message[1] == CIV_START_BYTE:
-                    process_civ_message(message)
-                else:
-                    non_civ_message = bytes(message).decode('utf-8', errors='ignore')
-                    #print(f"Rx (Non CI-V): {non_civ_message}")
-
-        # Visualizza i dati nel buffer dopo un timeout (messaggi non CI-V)
-        if response_buffer:
-            time.sleep(0.5)         # Timeout per aspettare ulteriori dati
-            if response_buffer:     # Se ci sono ancora dati nel buffer dopo il timeout
-                non_civ_message = bytes(response_buffer).decode('utf-8', errors='ignore')
-                #print(f"Rx (Non CI-V - timeout): {non_civ_message}")
-                response_buffer.clear()
+        # Legge tutti i byte disponibili, oppure attende il primo byte fino al timeout della porta
+        data = ser.read(ser.in_waiting or 1)
+        if data:
+            for message in parser.feed(data):
+                process_civ_message(message)
 
 # Funzione per elaborare i messaggi CI-V
 def process_civ_message(message):
@@ -678,6 +659,7 @@ class Toplevel1:
 #   
        
 if __name__ == "__main__":
+    open_serial_port()
     root = tk.Tk()
     radio_panel = Toplevel1(root)
 
@@ -0,0 +1,267 @@
+# *
+# * Project Name: Radio User Interface
+# * File: metrics.py
+# *
+# * Copyright (C) 2024 Fabrizio Palumbo (IU0IJV)
+# *
+# * This program is distributed under the terms of the MIT license.
+# * You can obtain a copy of the license at:
+# * https://opensource.org/licenses/MIT
+# *
+# * DESCRIPTION:
+# * Metriche del collegamento e dell'interfaccia, con esposizione in formato Prometheus.
+# *
+# * NOTES:
+# * - La maggior parte delle metriche non costa nulla a runtime: il registro legge i
+# *   contatori già presenti nei componenti (parser, trasmettitore, nucleo) solo quando
+# *   qualcuno li richiede (pannello diagnostico o endpoint HTTP).
+# * - Gli istogrammi hanno bucket fissi: observe() è una ricerca binaria e un incremento.
+# * - L'endpoint HTTP è opzionale e ascolta solo su localhost:
+# *     curl http://127.0.0.1:9108/metrics
+
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+DEFAULT_PORT = 9108
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+#-------------------------------------------------------------------------------------------------------------------------
+# Istogramma
+#-------------------------------------------------------------------------------------------------------------------------
+#
+class Histogram:
+    """
+    Istogramma cumulativo a bucket fissi (valori in secondi).
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)     # L'ultimo è +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    # -----------------------------------------------------------------------------
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    # -----------------------------------------------------------------------------
+    def quantile(self, q):
+        """
+        Stima del quantile q (limite superiore del bucket che lo contiene).
+        """
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        running = 0
+        for bound, n in zip(self.buckets, self.counts):
+            running += n
+            if running >= target:
+                return bound
+        return float("inf")
+
+
+#-------------------------------------------------------------------------------------------------------------------------
+# Registro
+#-------------------------------------------------------------------------------------------------------------------------
+#
+class MetricsRegistry:
+    """
+    Elenco delle metriche esposte. Ogni metrica è letta al momento della richiesta:
+
+    - gauge / counter: funzione che restituisce un valore, oppure un dizionario
+      {valore dell'etichetta: valore} se è indicato `label`.
+    - histogram: un oggetto Histogram (o una funzione che lo restituisce).
+    """
+
+    def __init__(self, prefix="ifradio_"):
+        self.prefix = prefix
+        self._metrics = []              # (nome, tipo, descrizione, sorgente, etichetta)
+        self._lock = threading.Lock()
+
+    # -----------------------------------------------------------------------------
+    def gauge(self, name, help_text, source, label=None):
+        self._add(name, "gauge", help_text, source, label)
+
+    def counter(self, name, help_text, source, label=None):
+        self._add(name, "counter", help_text, source, label)
+
+    def histogram(self, name, help_text, source):
+        self._add(name, "histogram", help_text, source, None)
+
+    def _add(self, name, kind, help_text, source, label):
+        with self._lock:
+            self._metrics.append((self.prefix + name, kind, help_text, source, label))
+
+    # -----------------------------------------------------------------------------
+    def collect(self):
+        """
+        Legge tutte le metriche: [(nome, tipo, descrizione, valore, etichetta), ...].
+        Il valore è un numero, un dizionario per etichetta oppure un Histogram.
+        """
+        with self._lock:
+            metrics = list(self._metrics)
+        collected = []
+        for name, kind, help_text, source, label in metrics:
+            try:
+                value = source() if callable(source) else source
+            except Exception as e:
+                print(f"Errore nella lettura della metrica {name}: {e}")
+                continue
+            collected.append((name, kind, help_text, value, label))
+        return collected
+
+    # -----------------------------------------------------------------------------
+    def render_prometheus(self):
+        """
+        Testo nel formato di esposizione di Prometheus (versione 0.0.4).
+        """
+        lines = []
+        for name, kind, help_text, value, label in self.collect():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "histogram":
+                running = 0
+                for bound, n in zip(value.buckets, value.counts):
+                    running += n
+                    lines.append(f'{name}_bucket{{le="{bound:g}"}} {running}')
+                lines.append(f'{name}_bucket{{le="+Inf"}} {value.count}')
+                lines.append(f"{name}_sum {value.sum:.6f}")
+                lines.append(f"{name}_count {value.count}")
+            elif label is not None:
+                for key, v in sorted(value.items()):
+                    lines.append(f'{name}{{{label}="{key}"}} {v}')
+            else:
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    # -----------------------------------------------------------------------------
+    def render_text(self):
+        """
+        Riepilogo leggibile per il pannello diagnostico.
+        """
+        lines = []
+        for name, kind, help_text, value, label in self.collect():
+            short = name[len(self.prefix):]
+            if kind == "histogram":
+                lines.append(f"{short:<34} n={value.count}  p50<={value.quantile(0.5) * 1000:g} ms  "
+                             f"p95<={value.quantile(0.95) * 1000:g} ms")
+            elif label is not None:
+                items = "  ".join(f"{k}={v}" for k, v in sorted(value.items()))
+                lines.append(f"{short:<34} {items or '-'}")
+            else:
+                lines.append(f"{short:<34} {value}")
+        return "\n".join(lines)
+
+
+#-------------------------------------------------------------------------------------------------------------------------
+# Metriche del collegamento
+#-------------------------------------------------------------------------------------------------------------------------
+#
+def _by_opcode(counts):
+    return {f"0x{command:02X}": n for command, n in counts.items()}
+
+
+# -----------------------------------------------------------------------------
+def register_link_metrics(registry, radio, poller=None, ui=None):
+    """
+    Registra le metriche standard di un RadioCore e, se indicati, dello schedulatore e del
+    dispatcher grafico. Collega a questi ultimi gli istogrammi di latenza e li restituisce.
+    """
+    receiver = radio.receiver
+    transmitter = radio.transmitter
+    parser = receiver.parser
+
+    registry.counter("frames_received_total", "Frame CI-V ricevuti per opcode",
+                     lambda: _by_opcode(radio.reply_counts()), label="opcode")
+    registry.counter("frames_sent_total", "Frame CI-V scritti sulla porta per opcode",
+                     lambda: _by_opcode(dict(transmitter.sent_by_command)), label="opcode")
+    registry.counter("frames_coalesced_total", "Comandi SET sostituiti prima dell'invio",
+                     lambda: transmitter.frames_coalesced)
+    registry.counter("commands_suppressed_total", "SET non inviati perché non cambiavano il valore",
+                     lambda: radio.suppressed)
+    registry.gauge("state_unconfirmed", "Parametri scritti e non ancora confermati dalla radio",
+                   lambda: len(radio.unconfirmed))
+    registry.counter("frames_dropped_total", "Comandi non inviati (porta chiusa o errore)",
+                     lambda: transmitter.frames_dropped)
+    registry.counter("bytes_received_total", "Byte letti dalla porta seriale", lambda: receiver.bytes_received)
+    registry.counter("bytes_sent_total", "Byte scritti sulla porta seriale", lambda: transmitter.bytes_sent)
+    registry.counter("parse_discarded_bytes_total", "Byte scartati dal parser durante la risincronizzazione",
+                     lambda: parser.discarded_bytes)
+    registry.counter("parse_malformed_total", "Frame malformati", lambda: parser.malformed)
+    registry.counter("parse_rejected_total", "Frame con indirizzi non validi", lambda: parser.rejected)
+    registry.gauge("data_queue_depth", "Frame ricevuti in attesa di elaborazione", radio.frames.qsize)
+    registry.gauge("tx_queue_depth", "Comandi in attesa di invio", transmitter.pending)
+    registry.gauge("port_open", "Porta seriale aperta (1) o chiusa (0)", lambda: int(radio.is_open))
+    registry.gauge("dispatch_latency_p95_seconds", "Latenza ricezione -> elaborazione dei frame (p95)",
+                   lambda: round(receiver.latency.snapshot()["p95_ms"] / 1000, 6))
+
+    histograms = {}
+    if poller is not None:
+        poller.latency = histograms["roundtrip"] = Histogram()
+        registry.histogram("command_roundtrip_seconds", "Tempo richiesta -> risposta dei comandi GET",
+                           poller.latency)
+        registry.counter("poll_timeouts_total", "Richieste senza risposta entro il timeout",
+                         lambda: {name: s["timeouts"] for name, s in poller.stats().items()}, label="parameter")
+    if ui is not None:
+        ui.lag = histograms["tk_lag"] = Histogram()
+        registry.histogram("tk_callback_lag_seconds", "Ritardo del ciclo Tk rispetto all'istante programmato",
+                           ui.lag)
+        registry.counter("ui_updates_rendered_total", "Aggiornamenti applicati ai widget", lambda: ui.rendered)
+    return histograms
+
+
+#-------------------------------------------------------------------------------------------------------------------------
+# Endpoint HTTP
+#-------------------------------------------------------------------------------------------------------------------------
+#
+class MetricsServer:
+    """
+    Server HTTP su localhost che espone il registro su /metrics.
+    """
+
+    def __init__(self, registry, port=DEFAULT_PORT, host="127.0.0.1"):
+        self.registry = registry
+        self.port = port
+        self.host = host
+        self.scrapes = 0
+        self._server = None
+        self._thread = None
+
+    # -----------------------------------------------------------------------------
+    def start(self):
+        metrics_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                metrics_server.scrapes += 1
+                body = metrics_server.registry.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass                    # Nessun log per ogni richiesta
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    # -----------------------------------------------------------------------------
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
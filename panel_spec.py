@@ -0,0 +1,184 @@
+# *
+# * Project Name: Radio User Interface
+# * File: panel_spec.py
+# *
+# * Copyright (C) 2024 Fabrizio Palumbo (IU0IJV)
+# *
+# * This program is distributed under the terms of the MIT license.
+# * You can obtain a copy of the license at:
+# * https://opensource.org/licenses/MIT
+# *
+# * DESCRIPTION:
+# * Costruzione dei widget del pannello da una descrizione dichiarativa.
+# *
+# * NOTES:
+# * - Ogni widget è un dizionario creato con widget(): classe, stili condivisi (base), opzioni,
+# *   posizione (place o pack), binding e figli.
+# * - Stile e opzioni vengono uniti in Python e passati tutti al costruttore: una sola
+# *   chiamata Tcl per widget invece di una configure() per opzione.
+# * - I font sono oggetti tkinter.font.Font con nome, creati una sola volta e condivisi da
+# *   tutti i widget: nelle opzioni si indica il nome del font nella tabella `fonts`.
+# * - Sezioni con defer=IDLE vengono costruite dopo il primo disegno della finestra,
+# *   quelle con defer=ON_USE solo alla prima richiesta (ensure()).
+# * - Comandi e binding indicati come stringa sono metodi del proprietario del pannello.
+
+import time
+import tkinter.font as tkfont
+
+
+IDLE = "idle"                   # Costruita subito dopo il primo disegno
+ON_USE = "use"                  # Costruita al primo accesso
+
+CALLBACK_OPTIONS = ("command",)
+
+
+# -----------------------------------------------------------------------------
+def widget(cls, name=None, base=None, place=None, pack=None, bind=None, children=(), defer=None, into=None,
+           **options):
+    """
+    Descrizione di un widget.
+
+    name:     attributo del proprietario a cui assegnare il widget.
+    base:     nome (o tupla di nomi) degli stili condivisi da applicare prima delle opzioni.
+    place:    argomenti di place(); pack: argomenti di pack().
+    bind:     {sequenza: gestore}.
+    into:     (attributo dizionario del proprietario, chiave) in cui registrare il widget.
+    defer:    None, IDLE oppure ON_USE.
+    """
+    return {
+        "cls": cls, "name": name, "base": base, "options": options, "place": place, "pack": pack,
+        "bind": bind or {}, "children": list(children), "defer": defer, "into": into,
+    }
+
+
+#-------------------------------------------------------------------------------------------------------------------------
+# Costruttore del pannello
+#-------------------------------------------------------------------------------------------------------------------------
+#
+class PanelBuilder:
+    """
+    Crea i widget descritti da widget() come attributi di `owner`.
+
+    fonts:  {nome: (famiglia, dimensione[, stile])} dei font condivisi.
+    styles: {nome: {opzione: valore}} degli stili condivisi.
+    """
+
+    def __init__(self, owner, root, fonts=None, styles=None):
+        self.owner = owner
+        self.root = root
+        self.font_specs = dict(fonts or {})
+        self.styles = dict(styles or {})
+        self.fonts = {}
+
+        self.created = 0                # Widget creati
+        self.build_time = 0.0           # Tempo totale di costruzione (s)
+        self.deferred = {}              # nome -> (genitore, descrizione, modo) delle sezioni non ancora costruite
+        self._owners = {}               # nome di un widget differito -> nome della sezione che lo contiene
+
+    # -----------------------------------------------------------------------------
+    def font(self, name):
+        font = self.fonts.get(name)
+        if font is None:
+            family, size, *style = self.font_specs[name]
+            font = self.fonts[name] = tkfont.Font(
+                root=self.root, family=family, size=size, weight="bold" if "bold" in style else "normal")
+        return font
+
+    # -----------------------------------------------------------------------------
+    def build(self, parent, specs):
+        """
+        Costruisce le descrizioni sotto `parent`; quelle differite vengono solo registrate.
+        """
+        t0 = time.perf_counter()
+        for spec in specs:
+            if spec["defer"] is not None:
+                self._register(parent, spec)
+            else:
+                self._create(parent, spec)
+        self.build_time += time.perf_counter() - t0
+
+    # -----------------------------------------------------------------------------
+    def ensure(self, name):
+        """
+        Costruisce (se necessario) la sezione che contiene `name` e restituisce il widget.
+        """
+        section = self._owners.get(name)
+        if section is not None and section in self.deferred:
+            t0 = time.perf_counter()
+            parent, spec, _ = self.deferred.pop(section)
+            self._create(parent, spec)
+            self.build_time += time.perf_counter() - t0
+        return getattr(self.owner, name)
+
+    # -----------------------------------------------------------------------------
+    def is_built(self, name):
+        section = self._owners.get(name)
+        return section is None or section not in self.deferred
+
+    # -----------------------------------------------------------------------------
+    def build_deferred(self, mode=IDLE):
+        for section in [s for s, (_, _, m) in self.deferred.items() if m == mode]:
+            self.ensure(section)
+
+    # -----------------------------------------------------------------------------
+    def stats(self):
+        return {
+            "widgets": self.created,
+            "fonts": len(self.fonts),
+            "pending": sorted(self.deferred),
+            "build_ms": round(self.build_time * 1000, 1),
+        }
+
+    # -----------------------------------------------------------------------------
+    def _register(self, parent, spec):
+        section = spec["name"]
+        self.deferred[section] = (parent, spec, spec["defer"])
+        stack = [spec]
+        while stack:
+            item = stack.pop()
+            if item["name"]:
+                self._owners[item["name"]] = section
+            stack.extend(item["children"])
+
+    # -----------------------------------------------------------------------------
+    def _options(self, spec):
+        styles = spec["base"]
+        if isinstance(styles, str):
+            styles = (styles,)
+        options = {}
+        for style in styles or ():
+            options.update(self.styles[style])
+        options.update(spec["options"])
+
+        if isinstance(options.get("font"), str) and options["font"] in self.font_specs:
+            options["font"] = self.font(options["font"])
+        for key in CALLBACK_OPTIONS:
+            if isinstance(options.get(key), str):
+                options[key] = getattr(self.owner, options[key])
+        return options
+
+    # -----------------------------------------------------------------------------
+    def _create(self, parent, spec):
+        owner = self.owner
+        w = spec["cls"](parent, **self._options(spec))
+        self.created += 1
+
+        if spec["place"] is not None:
+            w.place(**spec["place"])
+        elif spec["pack"] is not None:
+            w.pack(**spec["pack"])
+        for sequence, handler in spec["bind"].items():
+            w.bind(sequence, getattr(owner, handler) if isinstance(handler, str) else handler)
+
+        if spec["name"]:
+            setattr(owner, spec["name"], w)
+        if spec["into"] is not None:
+            attribute, key = spec["into"]
+            getattr(owner, attribute)[key] = w
+
+        for child in spec["children"]:
+            if child["defer"] is not None:
+                self._register(w, child)
+            else:
+                self._create(w, child)
+        return w
@@ -0,0 +1,472 @@
+# *
+# * Project Name: Radio User Interface
+# * File: radio_core.py
+# *
+# * Copyright (C) 2024 Fabrizio Palumbo (IU0IJV)
+# *
+# * This program is distributed under the terms of the MIT license.
+# * You can obtain a copy of the license at:
+# * https://opensource.org/licenses/MIT
+# *
+# * DESCRIPTION:
+# * Nucleo della radio senza interfaccia grafica: protocollo, trasporto e stato.
+# *
+# * NOTES:
+# * - L'import non apre porte e non carica Tk né pyserial: la porta viene aperta solo
+# *   al primo utilizzo (o con connect()).
+# * - Ogni risposta della radio aggiorna lo stato; le variazioni vengono pubblicate ai
+# *   listener registrati con add_listener(fn), chiamati come fn(nome, valore).
+# * - Lo stato fa da copia dei registri della radio: i valori letti dalle risposte sono
+# *   "confermati", quelli scritti dai setter sono applicati subito ma restano "non
+# *   confermati" finché una risposta non li conferma. Un SET che non cambia nulla non
+# *   viene inviato (force=True per reinviarlo comunque).
+# * - I frame grezzi sono disponibili per chi ne ha bisogno (schedulatore, scansione,
+# *   registratore) tramite frame_listeners.
+# * - Il pannello Tk è uno dei consumatori; da riga di comando:
+# *     python radio_core.py <porta> [--set nome=valore ...] [--get nome ...]
+# *   ad esempio:  python radio_core.py COM11 --set frequency=145500000 --get frequency rssi
+
+import sys
+import threading
+import time
+
+from civ_codec import (
+    COMMAND_SET_FREQUENCY, COMMAND_GET_FREQUENCY, COMMAND_SET_MODE,
+    COMMAND_SET_SQUELCH, COMMAND_GET_SQUELCH, COMMAND_SET_AGC, COMMAND_GET_RSSI,
+    COMMAND_SET_MONITOR, COMMAND_SET_RFGAIN, COMMAND_GET_RFGAIN,
+    COMMAND_SET_BANDWIDTH, COMMAND_GET_BANDWIDTH, COMMAND_SET_TX_POWER, COMMAND_GET_TX_POWER,
+    COMMAND_GET_STATUS, COMMAND_SET_STEP, COMMAND_GET_STEP,
+    REPLY_DECODERS, encode_frequency
+)
+
+
+BAUDRATE = 115200
+CONFIRM_TIMEOUT = 1.0           # s: dopo questo tempo una risposta diversa dal valore scritto prevale
+
+# Parametri senza comando di lettura: il valore scritto è l'unico disponibile
+WRITE_ONLY = ("mode", "agc", "monitor")
+
+# Parametri dello stato e comando GET che li legge
+STATE_COMMANDS = {
+    "frequency": COMMAND_GET_FREQUENCY,
+    "squelch": COMMAND_GET_SQUELCH,
+    "rssi": COMMAND_GET_RSSI,
+    "rfgain": COMMAND_GET_RFGAIN,
+    "bandwidth": COMMAND_GET_BANDWIDTH,
+    "tx_power": COMMAND_GET_TX_POWER,
+    "status": COMMAND_GET_STATUS,
+    "step": COMMAND_GET_STEP,
+}
+STATE_BY_COMMAND = {command: name for name, command in STATE_COMMANDS.items()}
+
+# Comandi SET per cui conta solo l'ultimo valore non ancora inviato
+DEFAULT_COALESCE = (
+    COMMAND_SET_FREQUENCY,
+    COMMAND_SET_MODE,
+    COMMAND_SET_SQUELCH,
+    COMMAND_SET_RFGAIN,
+    COMMAND_SET_BANDWIDTH,
+    COMMAND_SET_TX_POWER,
+    COMMAND_SET_STEP,
+)
+
+
+#-------------------------------------------------------------------------------------------------------------------------
+# Nucleo della radio
+#-------------------------------------------------------------------------------------------------------------------------
+#
+class RadioCore:
+    """
+    Collegamento con la radio e stato corrente dei parametri.
+
+    port:     porta seriale da aprire al primo utilizzo (può essere indicata anche in connect()).
+    coalesce: opcode SET per cui la coda di trasmissione conserva solo l'ultimo valore.
+    """
+
+    def __init__(self, port=None, baudrate=BAUDRATE, timeout=0.1, coalesce=DEFAULT_COALESCE, min_interval=0.02):
+        # Import differiti: caricare il nucleo non richiede pyserial
+        import queue
+        from civ_receiver import SerialReceiver
+        from civ_transmitter import CommandTransmitter
+
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.ser = None
+        self.auto_connect = True        # send() apre la porta al primo utilizzo (False con un gestore della connessione)
+
+        self.state = {name: None for name in STATE_COMMANDS}
+        self.state.update(mode=None, monitor=False, agc=None)
+        self.confirmed = {}             # nome -> ultimo valore letto dalla radio
+        self.unconfirmed = {}           # nome -> (valore scritto, istante) in attesa di conferma
+        self.suppressed = 0             # SET non inviati perché il valore era già quello della radio
+        self._state_lock = threading.Lock()
+        self.listeners = []             # fn(nome, valore) alla variazione di un parametro
+        self.frame_listeners = []       # fn(frame) per ogni frame ricevuto
+
+        self.frames = queue.Queue()
+        self.receiver = SerialReceiver(lambda: self.ser, self.frames)
+        self.transmitter = CommandTransmitter(lambda: self.ser, coalesce=coalesce, min_interval=min_interval)
+
+        self._replies = {}              # opcode -> numero di risposte ricevute
+        self._reply_cond = threading.Condition()
+        self._dispatcher = None
+
+    # -----------------------------------------------------------------------------
+    @property
+    def is_open(self):
+        return bool(self.ser and self.ser.is_open)
+
+    # -----------------------------------------------------------------------------
+    def start(self):
+        """
+        Avvia i thread di ricezione, trasmissione e smistamento (anche senza porta aperta).
+        """
+        self.receiver.start()
+        self.transmitter.start()
+        if self._dispatcher is None or not self._dispatcher.is_alive():
+            self._dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+            self._dispatcher.start()
+
+    # -----------------------------------------------------------------------------
+    def connect(self, port=None, keep_state=False):
+        """
+        Apre (o riapre su un'altra porta) la connessione seriale. Restituisce True se riuscita.
+        keep_state=True conserva lo stato in memoria (riconnessione alla stessa radio).
+        """
+        import serial
+
+        if port is not None:
+            self.port = port
+        if self.port is None:
+            print("Nessuna porta seriale selezionata.")
+            return False
+
+        if self.is_open:
+            if self.ser.port == self.port:
+                return True
+            self.ser.close()
+
+        try:
+            self.ser = serial.Serial(
+                port=self.port,
+                baudrate=self.baudrate,
+                bytesize=serial.EIGHTBITS,
+                parity=serial.PARITY_NONE,
+                stopbits=serial.STOPBITS_ONE,
+                timeout=self.timeout
+            )
+        except serial.SerialException as e:
+            print(f"Errore nella connessione: {e}")
+            self.ser = None
+            return False
+
+        if not keep_state:
+            self.invalidate()               # Radio diversa o riaccesa: lo stato precedente non vale più
+        if hasattr(self.ser, "set_buffer_size"):
+            self.ser.set_buffer_size(rx_size=4096, tx_size=4096)   # Solo Windows
+        self.start()
+        self.receiver.wake()
+        return True
+
+    # -----------------------------------------------------------------------------
+    def close(self):
+        if self.is_open:
+            self.ser.close()
+
+    # -----------------------------------------------------------------------------
+    def shutdown(self):
+        """
+        Ferma i thread e chiude la porta.
+        """
+        self.receiver.stop()
+        self.transmitter.stop()
+        self.frames.put(None)
+        self.receiver.join(self.timeout + 0.5)    # La lettura in corso termina entro il timeout della porta
+        self.close()
+
+    # -----------------------------------------------------------------------------
+    def add_listener(self, fn):
+        self.listeners.append(fn)
+
+    def remove_listener(self, fn):
+        if fn in self.listeners:
+            self.listeners.remove(fn)
+
+    # -----------------------------------------------------------------------------
+    def _publish(self, name, value):
+        with self._state_lock:
+            if self.state.get(name) == value:
+                return
+            self.state[name] = value
+        for fn in self.listeners:
+            try:
+                fn(name, value)
+            except Exception as e:
+                print(f"Errore nel listener di '{name}': {e}")
+
+    # -----------------------------------------------------------------------------
+    def _dispatch(self):
+        while True:
+            item = self.frames.get()
+            if item is None:
+                break
+            frame, t_rx = item
+            self.receiver.latency.record(t_rx)
+            self.handle_frame(frame)
+
+    # -----------------------------------------------------------------------------
+    def handle_frame(self, frame):
+        """
+        Elabora un frame ricevuto: listener dei frame, aggiornamento dello stato, risposte attese.
+        """
+        for fn in self.frame_listeners:
+            try:
+                fn(frame)
+            except Exception as e:
+                print(f"Errore durante l'elaborazione del messaggio CI-V: {e}")
+
+        command = frame[4]
+        name = STATE_BY_COMMAND.get(command)
+        if name is not None:
+            try:
+                value = REPLY_DECODERS[command](frame[5:-1])
+            except IndexError:
+                value = None            # Payload troncato
+            if value is not None:
+                self._confirm(name, value)
+
+        with self._reply_cond:
+            self._replies[command] = self._replies.get(command, 0) + 1
+            self._reply_cond.notify_all()
+
+    # -----------------------------------------------------------------------------
+    def _confirm(self, name, value):
+        """
+        Valore letto dalla radio. Una risposta diversa da un valore appena scritto viene
+        ignorata (la richiesta era partita prima della scrittura) fino a CONFIRM_TIMEOUT.
+        """
+        now = time.monotonic()
+        with self._state_lock:
+            self.confirmed[name] = value
+            written = self.unconfirmed.get(name)
+            if written is not None:
+                if written[0] != value and now - written[1] < CONFIRM_TIMEOUT:
+                    return
+                del self.unconfirmed[name]
+        self._publish(name, value)
+
+    # -----------------------------------------------------------------------------
+    def _set(self, name, command, data, value, force=False):
+        """
+        Invia un SET solo se cambia il valore del registro. Restituisce True se il comando è partito.
+        """
+        with self._state_lock:
+            if not force and value is not None and self.state.get(name) == value:
+                self.suppressed += 1
+                return False
+            if name not in WRITE_ONLY:
+                self.unconfirmed[name] = (value, time.monotonic())
+        if not self.send(command, data):
+            with self._state_lock:
+                self.unconfirmed.pop(name, None)
+            return False
+        self._publish(name, value)
+        return True
+
+    # -----------------------------------------------------------------------------
+    def snapshot(self):
+        """
+        Copia coerente dello stato corrente (confermato o scritto), senza traffico seriale.
+        """
+        with self._state_lock:
+            return dict(self.state)
+
+    # -----------------------------------------------------------------------------
+    def dirty(self):
+        """
+        Parametri scritti e non ancora confermati dalla radio: {nome: valore scritto}.
+        """
+        with self._state_lock:
+            return {name: value for name, (value, _) in self.unconfirmed.items()}
+
+    # -----------------------------------------------------------------------------
+    def invalidate(self, *names):
+        """
+        Dimentica il valore dei parametri indicati (tutti se nessuno), ad esempio quando
+        qualcun altro scrive direttamente sulla porta: il SET successivo viene sempre inviato.
+        """
+        with self._state_lock:
+            for name in names or list(self.state):
+                self.state[name] = False if name == "monitor" else None
+                self.confirmed.pop(name, None)
+                self.unconfirmed.pop(name, None)
+
+    # -----------------------------------------------------------------------------
+    def send(self, command, data=()):
+        """
+        Accoda un comando; al primo utilizzo apre la porta indicata nel costruttore.
+        """
+        if not self.is_open and not (self.auto_connect and self.port and self.connect()):
+            print("Porta seriale non aperta. Impossibile inviare il comando.")
+            return False
+        self.transmitter.submit(command, data)
+        return True
+
+    # -----------------------------------------------------------------------------
+    def reply_count(self, command):
+        """
+        Numero di risposte ricevute finora per un opcode.
+        """
+        with self._reply_cond:
+            return self._replies.get(command, 0)
+
+    def reply_counts(self):
+        """
+        Copia dei contatori delle risposte ricevute per opcode.
+        """
+        with self._reply_cond:
+            return dict(self._replies)
+
+    # -----------------------------------------------------------------------------
+    def wait_replies(self, command, count, timeout):
+        """
+        Attende che le risposte ricevute per un opcode raggiungano `count`. Restituisce False al timeout.
+        """
+        with self._reply_cond:
+            return self._reply_cond.wait_for(lambda: self._replies.get(command, 0) >= count, timeout)
+
+    # -----------------------------------------------------------------------------
+    def read(self, name, timeout=0.5, retries=2):
+        """
+        Interroga un parametro e attende la risposta (chiamata bloccante, non dal thread Tk).
+        Restituisce il valore oppure solleva TimeoutError.
+        """
+        command = STATE_COMMANDS[name]
+        self.start()
+        for _ in range(retries + 1):
+            seen = self.reply_count(command)
+            if not self.send(command):
+                break
+            if self.wait_replies(command, seen + 1, timeout):
+                # Una risposta con il payload troncato non ha un valore: si ripete la richiesta
+                with self._state_lock:
+                    value = self.confirmed.get(name)
+                if value is not None:
+                    return value
+        raise TimeoutError(f"Nessuna risposta per '{name}'")
+
+    # -----------------------------------------------------------------------------
+    def set_frequency(self, frequency, force=False):
+        return self._set("frequency", COMMAND_SET_FREQUENCY, encode_frequency(frequency), frequency, force)
+
+    def set_step(self, step, force=False):
+        return self._set("step", COMMAND_SET_STEP, encode_frequency(step), step, force)
+
+    def set_mode(self, mode, force=False):
+        return self._set("mode", COMMAND_SET_MODE, [mode], mode, force)
+
+    def set_squelch(self, level, force=False):
+        return self._set("squelch", COMMAND_SET_SQUELCH, [level], level, force)
+
+    def set_rfgain(self, gain, force=False):
+        return self._set("rfgain", COMMAND_SET_RFGAIN, [gain], gain, force)
+
+    def set_bandwidth(self, index, force=False):
+        return self._set("bandwidth", COMMAND_SET_BANDWIDTH, [index], index, force)
+
+    def set_tx_power(self, power, force=False):
+        return self._set("tx_power", COMMAND_SET_TX_POWER, [power], power, force)
+
+    def set_agc(self, agc, force=False):
+        return self._set("agc", COMMAND_SET_AGC, [agc], agc, force)
+
+    def toggle_monitor(self):
+        # Commutazione: non è mai un comando ridondante
+        if not self.send(COMMAND_SET_MONITOR, [0x00, 0x01]):
+            return False
+        self._publish("monitor", not self.state["monitor"])
+        return True
+
+    # -----------------------------------------------------------------------------
+    def flush(self, timeout=1.0):
+        """
+        Attende che la coda di trasmissione sia vuota (utile prima di chiudere da riga di comando).
+        """
+        return self.transmitter.flush(timeout)
+
+
+# -----------------------------------------------------------------------------
+SETTERS = {
+    "frequency": RadioCore.set_frequency,
+    "step": RadioCore.set_step,
+    "mode": RadioCore.set_mode,
+    "squelch": RadioCore.set_squelch,
+    "rfgain": RadioCore.set_rfgain,
+    "bandwidth": RadioCore.set_bandwidth,
+    "tx_power": RadioCore.set_tx_power,
+    "agc": RadioCore.set_agc,
+}
+
+# Valori ammessi (estremi inclusi) per i parametri di SETTERS: fuori da questi limiti il
+# frame non è codificabile (byte 0-255, frequenza in 10 cifre BCD)
+SETTER_RANGES = {
+    "frequency": (0, 9_999_999_999),
+    "step": (0, 9_999_999_999),
+    "mode": (0, 255),
+    "squelch": (0, 255),
+    "rfgain": (0, 255),
+    "bandwidth": (0, 255),
+    "tx_power": (0, 255),
+    "agc": (0, 255),
+}
+
+
+# -----------------------------------------------------------------------------
+def _main(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Imposta e legge i parametri della radio")
+    parser.add_argument("port", help="porta seriale (es. COM11 o /dev/ttyUSB0)")
+    parser.add_argument("--set", nargs="+", default=[], metavar="NOME=VALORE",
+                        help=f"parametri da impostare: {', '.join(SETTERS)}")
+    parser.add_argument("--get", nargs="+", default=[], metavar="NOME",
+                        help=f"parametri da leggere: {', '.join(STATE_COMMANDS)}")
+    parser.add_argument("--timeout", type=float, default=0.5, help="attesa massima per risposta (s)")
+    args = parser.parse_args(argv[1:])
+
+    radio = RadioCore(args.port, min_interval=0)
+    if not radio.connect():
+        return 1
+
+    status = 0
+    try:
+        for item in args.set:
+            name, _, value = item.partition("=")
+            low, high = SETTER_RANGES.get(name, (0, -1))
+            try:
+                value = int(value, 0)
+            except ValueError:
+                value = None
+            if name not in SETTERS or value is None or not low <= value <= high:
+                print(f"Parametro non valido: {item}")
+                return 2
+            SETTERS[name](radio, value)
+
+        for name in args.get:
+            if name not in STATE_COMMANDS:
+                print(f"Parametro non valido: {name}")
+                return 2
+            try:
+                print(f"{name}={radio.read(name, timeout=args.timeout)}")
+            except TimeoutError as e:
+                print(e)
+                status = 3
+        radio.flush()
+    finally:
+        radio.shutdown()
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(_main(sys.argv))
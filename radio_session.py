@@ -0,0 +1,217 @@
+# *
+# * Project Name: Radio User Interface
+# * File: radio_session.py
+# *
+# * Copyright (C) 2024 Fabrizio Palumbo (IU0IJV)
+# *
+# * This program is distributed under the terms of the MIT license.
+# * You can obtain a copy of the license at:
+# * https://opensource.org/licenses/MIT
+# *
+# * DESCRIPTION:
+# * Sessioni radio indipendenti: più radio controllate contemporaneamente dallo stesso processo.
+# *
+# * NOTES:
+# * - Una sessione = un RadioCore (porta, thread di lettura, parser, coda di trasmissione,
+# *   stato) più il proprio schedulatore delle interrogazioni. Nessuno stato è condiviso
+# *   tra le sessioni, quindi il traffico di una radio non attende quello delle altre.
+# * - SessionManager raccoglie le sessioni per nome e ne somma le statistiche.
+# * - Uso senza interfaccia (misura del throughput complessivo):
+# *     python radio_session.py <porta> [<porta> ...] [--seconds 10]
+
+import sys
+import threading
+import time
+
+from civ_poller import PollScheduler
+from radio_core import RadioCore, STATE_COMMANDS
+
+
+# Parametri interrogati: (nome, frequenza Hz, frequenza minima Hz o None)
+DEFAULT_POLLING = (
+    ("rssi", 10, 1),
+    ("status", 10, 1),
+    ("squelch", 1, None),
+    ("frequency", 0.2, None),
+)
+
+
+#-------------------------------------------------------------------------------------------------------------------------
+# Sessione
+#-------------------------------------------------------------------------------------------------------------------------
+#
+class RadioSession:
+    """
+    Una radio con il proprio trasporto, parser, stato e schedulatore.
+
+    port:    porta seriale (può essere indicata anche più tardi con open(port)).
+    name:    nome della sessione (default: la porta).
+    polling: parametri da interrogare, come DEFAULT_POLLING.
+    Gli altri argomenti vengono passati a RadioCore.
+    """
+
+    def __init__(self, port=None, name=None, polling=DEFAULT_POLLING, **core_options):
+        self.name = name or port
+        self.radio = RadioCore(port, **core_options)
+
+        transmitter = self.radio.transmitter
+        self.poller = PollScheduler(
+            self.radio.send,
+            is_active=lambda: self.radio.is_open,
+            saturated=lambda: transmitter.pending() > 8
+        )
+        for parameter, rate_hz, min_rate_hz in polling:
+            self.poller.add(parameter, STATE_COMMANDS[parameter], rate_hz, min_rate_hz=min_rate_hz)
+
+        # Primo listener: lo schedulatore vede ogni risposta prima degli altri consumatori
+        self.radio.frame_listeners.append(lambda frame: self.poller.reply_received(frame[4]))
+
+    # -----------------------------------------------------------------------------
+    @property
+    def state(self):
+        return self.radio.state
+
+    @property
+    def is_open(self):
+        return self.radio.is_open
+
+    # -----------------------------------------------------------------------------
+    def start(self):
+        """
+        Avvia i thread della sessione senza aprire la porta.
+        """
+        self.radio.start()
+        self.poller.start()
+
+    # -----------------------------------------------------------------------------
+    def open(self, port=None):
+        """
+        Apre la porta e avvia i thread. Restituisce True se la connessione è riuscita.
+        """
+        if not self.radio.connect(port):
+            return False
+        if self.name is None:
+            self.name = self.radio.port
+        self.start()
+        return True
+
+    # -----------------------------------------------------------------------------
+    def close(self):
+        self.poller.stop()
+        self.radio.shutdown()
+
+    # -----------------------------------------------------------------------------
+    def stats(self):
+        receiver = self.radio.receiver
+        transmitter = self.radio.transmitter
+        return {
+            "port": self.radio.port,
+            "open": self.radio.is_open,
+            "frames_received": receiver.latency.count,
+            "bytes_received": receiver.bytes_received,
+            "frames_sent": transmitter.frames_sent,
+            "bytes_sent": transmitter.bytes_sent,
+            "polling": self.poller.summary(),
+        }
+
+
+#-------------------------------------------------------------------------------------------------------------------------
+# Gestione delle sessioni
+#-------------------------------------------------------------------------------------------------------------------------
+#
+class SessionManager:
+    """
+    Insieme delle sessioni attive, indicizzate per nome.
+    """
+
+    def __init__(self):
+        self.sessions = {}
+        self._lock = threading.Lock()
+
+    # -----------------------------------------------------------------------------
+    def add(self, port=None, name=None, **options):
+        session = RadioSession(port, name, **options)
+        key = session.name if session.name is not None else f"radio{len(self.sessions) + 1}"
+        session.name = key
+        with self._lock:
+            if key in self.sessions:
+                raise ValueError(f"Sessione già presente: {key}")
+            self.sessions[key] = session
+        return session
+
+    # -----------------------------------------------------------------------------
+    def remove(self, name):
+        with self._lock:
+            session = self.sessions.pop(name, None)
+        if session is not None:
+            session.close()
+
+    # -----------------------------------------------------------------------------
+    def __getitem__(self, name):
+        return self.sessions[name]
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self.sessions.values()))
+
+    def __len__(self):
+        return len(self.sessions)
+
+    # -----------------------------------------------------------------------------
+    def open_all(self):
+        """
+        Apre tutte le sessioni con una porta assegnata; restituisce i nomi di quelle non riuscite.
+        """
+        return [session.name for session in self if session.radio.port and not session.open()]
+
+    # -----------------------------------------------------------------------------
+    def close_all(self):
+        # Prima si fermano tutti gli schedulatori, poi si chiudono le porte
+        sessions = list(self)
+        for session in sessions:
+            session.poller.stop()
+        for session in sessions:
+            session.radio.shutdown()
+
+    # -----------------------------------------------------------------------------
+    def stats(self):
+        per_session = {session.name: session.stats() for session in self}
+        return {
+            "sessions": per_session,
+            "frames_received": sum(s["frames_received"] for s in per_session.values()),
+            "frames_sent": sum(s["frames_sent"] for s in per_session.values()),
+        }
+
+
+# -----------------------------------------------------------------------------
+def _main(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Interroga più radio contemporaneamente")
+    parser.add_argument("ports", nargs="+", help="porte seriali (es. COM11 COM12 o i pty di civ_simulator.py)")
+    parser.add_argument("--seconds", type=float, default=10.0, help="durata della misura (s)")
+    args = parser.parse_args(argv[1:])
+
+    manager = SessionManager()
+    for port in args.ports:
+        manager.add(port, min_interval=0)
+    failed = manager.open_all()
+    if failed:
+        print(f"Porte non aperte: {', '.join(failed)}")
+
+    try:
+        time.sleep(args.seconds)
+    except KeyboardInterrupt:
+        pass
+    manager.close_all()
+
+    stats = manager.stats()
+    for name, s in stats["sessions"].items():
+        print(f"{name}: {s['frames_received']} frame ricevuti, {s['frames_sent']} inviati  {s['polling']}")
+    print(f"Totale: {stats['frames_received']} frame ricevuti "
+          f"({stats['frames_received'] / args.seconds:.1f} frame/s) su {len(manager)} radio")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main(sys.argv))
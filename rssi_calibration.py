@@ -0,0 +1,193 @@
+# *
+# * Project Name: Radio User Interface
+# * File: rssi_calibration.py
+# *
+# * Copyright (C) 2024 Fabrizio Palumbo (IU0IJV)
+# *
+# * This program is distributed under the terms of the MIT license.
+# * You can obtain a copy of the license at:
+# * https://opensource.org/licenses/MIT
+# *
+# * DESCRIPTION:
+# * Conversione calibrata RSSI grezzo -> dBm -> unità S, con profili per banda.
+# *
+# * NOTES:
+# * - Per ogni profilo vengono precalcolate (al primo uso) due tabelle indicizzate dal valore
+# *   RSSI grezzo a 16 bit: una lettura convertita costa una sola ricerca in array.
+# * - Il profilo viene scelto in base alla frequenza del VFO.
+# * - I profili possono essere caricati da un file JSON, ad esempio:
+# *
+# *   {
+# *     "profiles": [
+# *       {"name": "VHF", "min_hz": 136000000, "max_hz": 174000000, "slope": 0.5, "offset_dbm": -158.0},
+# *       {"name": "UHF", "min_hz": 400000000, "max_hz": 470000000, "slope": 0.5, "offset_dbm": -156.5,
+# *        "s_points": [[-147, 0], [-141, 1], ... , [-53, 13]]}
+# *     ]
+# *   }
+# *
+# *   dBm = raw * slope + offset_dbm; s_points sono le coppie (dBm, unità S) interpolate linearmente.
+# *   Le frequenze non coperte da nessun profilo usano il profilo predefinito.
+
+import array
+import bisect
+import json
+import os
+
+
+RAW_TABLE_SIZE = 65536          # RSSI grezzo a 16 bit: data[0] + data[1]*256
+
+DEFAULT_SLOPE = 0.5             # dBm per unità grezza
+DEFAULT_OFFSET_DBM = -160.0     # dBm corrispondenti al valore grezzo 0
+
+# Livelli in dBm delle unità S (S0 ... S9+60)
+DEFAULT_S_POINTS = (
+    (-147, 0), (-141, 1), (-135, 2), (-129, 3), (-123, 4),
+    (-117, 5), (-111, 6), (-105, 7), (-99, 8), (-93, 9),
+    (-83, 10), (-73, 11), (-63, 12), (-53, 13)
+)
+
+DEFAULT_CALIBRATION_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rssi_calibration.json")
+
+
+#-------------------------------------------------------------------------------------------------------------------------
+# Profilo di calibrazione
+#-------------------------------------------------------------------------------------------------------------------------
+#
+class CalibrationProfile:
+    """
+    Calibrazione di una banda: retta raw -> dBm e punti dBm -> unità S.
+    """
+
+    def __init__(self, name, min_hz=0, max_hz=None, slope=DEFAULT_SLOPE, offset_dbm=DEFAULT_OFFSET_DBM,
+                 s_points=DEFAULT_S_POINTS):
+        self.name = name
+        self.min_hz = min_hz
+        self.max_hz = max_hz
+        self.slope = slope
+        self.offset_dbm = offset_dbm
+        self.s_points = tuple(sorted((float(dbm), float(s)) for dbm, s in s_points))
+        self._dbm_points = [p[0] for p in self.s_points]
+
+        self.dbm_table = None           # Tabelle create al primo utilizzo
+        self.s_table = None
+
+    # -----------------------------------------------------------------------------
+    @classmethod
+    def from_dict(cls, spec):
+        return cls(
+            spec.get("name", "profile"),
+            min_hz=spec.get("min_hz", 0),
+            max_hz=spec.get("max_hz"),
+            slope=spec.get("slope", DEFAULT_SLOPE),
+            offset_dbm=spec.get("offset_dbm", DEFAULT_OFFSET_DBM),
+            s_points=spec.get("s_points", DEFAULT_S_POINTS),
+        )
+
+    # -----------------------------------------------------------------------------
+    def covers(self, frequency):
+        return self.min_hz <= frequency and (self.max_hz is None or frequency < self.max_hz)
+
+    # -----------------------------------------------------------------------------
+    def dbm_from_raw(self, raw):
+        return raw * self.slope + self.offset_dbm
+
+    # -----------------------------------------------------------------------------
+    def s_from_dbm(self, dbm):
+        """
+        Converte un livello in dBm in unità S (interpolazione lineare tra i punti del profilo).
+        """
+        points = self.s_points
+        if dbm <= points[0][0]:
+            return points[0][1]
+        if dbm >= points[-1][0]:
+            return points[-1][1]
+
+        i = bisect.bisect_right(self._dbm_points, dbm)
+        dbm_min, s_min = points[i - 1]
+        dbm_max, s_max = points[i]
+        return s_min + (dbm - dbm_min) / (dbm_max - dbm_min) * (s_max - s_min)
+
+    # -----------------------------------------------------------------------------
+    def build(self):
+        """
+        Precalcola le tabelle raw -> dBm e raw -> unità S.
+        """
+        dbm_table = array.array('f', (raw * self.slope + self.offset_dbm for raw in range(RAW_TABLE_SIZE)))
+        s_from_dbm = self.s_from_dbm
+        self.s_table = array.array('f', (s_from_dbm(dbm) for dbm in dbm_table))
+        self.dbm_table = dbm_table
+
+    # -----------------------------------------------------------------------------
+    def convert(self, raw):
+        """
+        Restituisce (dBm, unità S) per un valore RSSI grezzo.
+        """
+        if self.dbm_table is None:
+            self.build()
+        index = min(max(int(raw), 0), RAW_TABLE_SIZE - 1)
+        return self.dbm_table[index], self.s_table[index]
+
+
+#-------------------------------------------------------------------------------------------------------------------------
+# Insieme dei profili
+#-------------------------------------------------------------------------------------------------------------------------
+#
+class RssiCalibration:
+    """
+    Seleziona il profilo di calibrazione in base alla frequenza del VFO.
+    """
+
+    def __init__(self, profiles=(), default=None):
+        self.profiles = list(profiles)
+        self.default = default if default is not None else CalibrationProfile("default")
+        self.active = self.default
+        self.frequency = None
+
+    # -----------------------------------------------------------------------------
+    @classmethod
+    def load(cls, path=DEFAULT_CALIBRATION_FILE):
+        """
+        Carica i profili da un file JSON. Se il file non esiste usa solo il profilo predefinito.
+        """
+        if not path or not os.path.exists(path):
+            return cls()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                spec = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Errore nel file di calibrazione RSSI {path}: {e}")
+            return cls()
+
+        profiles = [CalibrationProfile.from_dict(p) for p in spec.get("profiles", [])]
+        default = CalibrationProfile.from_dict(spec["default"]) if "default" in spec else None
+        return cls(profiles, default)
+
+    # -----------------------------------------------------------------------------
+    def profile_for(self, frequency):
+        for profile in self.profiles:
+            if profile.covers(frequency):
+                return profile
+        return self.default
+
+    # -----------------------------------------------------------------------------
+    def select(self, frequency):
+        """
+        Attiva il profilo relativo alla frequenza indicata (chiamata solo al cambio di frequenza).
+        """
+        if frequency != self.frequency:
+            self.frequency = frequency
+            self.active = self.profile_for(frequency)
+        return self.active
+
+    # -----------------------------------------------------------------------------
+    def build_all(self):
+        """
+        Precalcola le tabelle di tutti i profili (ad esempio in un thread all'avvio).
+        """
+        for profile in self.profiles + [self.default]:
+            if profile.dbm_table is None:
+                profile.build()
+
+    # -----------------------------------------------------------------------------
+    def convert(self, raw):
+        return self.active.convert(raw)
@@ -0,0 +1,439 @@
+# *
+# * Project Name: Radio User Interface
+# * File: telemetry_recorder.py
+# *
+# * Copyright (C) 2024 Fabrizio Palumbo (IU0IJV)
+# *
+# * This program is distributed under the terms of the MIT license.
+# * You can obtain a copy of the license at:
+# * https://opensource.org/licenses/MIT
+# *
+# * DESCRIPTION:
+# * Registratore di lunga durata di RSSI, frequenza, squelch e stato della radio.
+# *
+# * NOTES:
+# * - I campioni vengono scritti in un buffer circolare preallocato in memoria (nessuna
+# *   allocazione per campione) e scaricati periodicamente su file da un thread dedicato.
+# * - I file sono binari a record fissi da 24 byte, preceduti da un'intestazione di 24 byte:
+# *
+# *     offset  tipo     campo
+# *     0       double   istante (time.time())
+# *     8       uint32   frequenza (Hz)
+# *     12      uint16   RSSI grezzo
+# *     14      uint16   stato della radio
+# *     16      uint16   livello di squelch
+# *     18      6 byte   riservati
+# *
+# * - Quando il file corrente supera max_bytes se ne apre uno nuovo; oltre max_files i più
+# *   vecchi vengono eliminati.
+# * - TelemetryArchive mappa i file in memoria (mmap) e legge le colonne come viste con passo
+# *   fisso sul buffer: ricerca per istante con bisect e sottocampionamento senza creare liste.
+# * - Uso da riga di comando:  python telemetry_recorder.py <cartella> [intervalli]
+
+import array
+import bisect
+import datetime
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+
+
+RECORD = struct.Struct("<dIHHH6x")      # istante, frequenza, rssi, stato, squelch
+RECORD_SIZE = RECORD.size               # 24 byte: multiplo di 8, le colonne sono viste allineate
+
+HEADER = struct.Struct("<8sIId")        # magic, dimensione record, riservato, istante di creazione
+HEADER_SIZE = HEADER.size
+MAGIC = b"IFRTLM01"
+
+FILE_PREFIX = "telemetry-"
+FILE_SUFFIX = ".bin"
+
+DEFAULT_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "telemetry")
+
+# Posizione di ogni colonna nel record: (formato della vista, indice iniziale, passo)
+COLUMNS = {
+    "time":      ('d', 0, RECORD_SIZE // 8),
+    "frequency": ('I', 8 // 4, RECORD_SIZE // 4),
+    "rssi":      ('H', 12 // 2, RECORD_SIZE // 2),
+    "status":    ('H', 14 // 2, RECORD_SIZE // 2),
+    "squelch":   ('H', 16 // 2, RECORD_SIZE // 2),
+}
+
+
+#-------------------------------------------------------------------------------------------------------------------------
+# Registratore
+#-------------------------------------------------------------------------------------------------------------------------
+#
+class TelemetryRecorder:
+    """
+    Buffer circolare dei campioni con scaricamento periodico su file a rotazione.
+
+    directory:      cartella dei file di archivio.
+    capacity:       numero di campioni conservati in memoria.
+    flush_interval: intervallo (s) tra due scritture su file.
+    max_bytes:      dimensione oltre la quale si passa a un nuovo file.
+    max_files:      numero massimo di file conservati (0 = nessun limite).
+    """
+
+    def __init__(self, directory=DEFAULT_DIRECTORY, capacity=65536, flush_interval=5.0,
+                 max_bytes=16 * 1024 * 1024, max_files=64):
+        self.directory = directory
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+
+        self.frequency = 0              # Ultimi valori noti, uniti a ogni campione RSSI
+        self.squelch = 0
+        self.status = 0
+
+        self.samples = 0                # Campioni registrati
+        self.flushed = 0                # Campioni scritti su file
+        self.overruns = 0               # Campioni sovrascritti prima di essere scritti su file
+        self.files_rotated = 0
+
+        self._buffer = bytearray(capacity * RECORD_SIZE)
+        self._head = 0                  # Prossimo record da scrivere (indice assoluto)
+        self._flushed_head = 0          # Primo record non ancora scritto su file
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._file = None
+        self._file_size = 0
+
+    # -----------------------------------------------------------------------------
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run, daemon=True)
+            self._thread.start()
+        return self._thread
+
+    # -----------------------------------------------------------------------------
+    def stop(self):
+        """
+        Ferma il thread e scrive su file i campioni rimasti.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(self.flush_interval + 1.0)
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    # -----------------------------------------------------------------------------
+    def update(self, frequency=None, squelch=None, status=None):
+        """
+        Aggiorna i valori che accompagnano i prossimi campioni RSSI.
+        """
+        if frequency is not None:
+            self.frequency = frequency
+        if squelch is not None:
+            self.squelch = squelch
+        if status is not None:
+            self.status = status
+
+    # -----------------------------------------------------------------------------
+    def record(self, rssi, timestamp=None):
+        """
+        Registra un campione RSSI con gli ultimi valori di frequenza, squelch e stato.
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        with self._lock:
+            slot = self._head % self.capacity
+            RECORD.pack_into(self._buffer, slot * RECORD_SIZE, timestamp, self.frequency & 0xFFFFFFFF,
+                             rssi & 0xFFFF, self.status & 0xFFFF, self.squelch & 0xFFFF)
+            self._head += 1
+            self.samples += 1
+            if self._head - self._flushed_head > self.capacity:
+                self._flushed_head += 1
+                self.overruns += 1
+
+    # -----------------------------------------------------------------------------
+    def recent(self, count=None):
+        """
+        Restituisce gli ultimi `count` record del buffer in memoria come bytes.
+        """
+        with self._lock:
+            available = min(self._head, self.capacity)
+            count = available if count is None else min(count, available)
+            return self._copy(self._head - count, self._head)
+
+    # -----------------------------------------------------------------------------
+    def _copy(self, first, end):
+        """
+        Copia i record [first, end) dal buffer circolare (con il lock già acquisito).
+        """
+        if end <= first:
+            return b""
+        start = (first % self.capacity) * RECORD_SIZE
+        stop = start + (end - first) * RECORD_SIZE
+        if stop <= len(self._buffer):
+            return bytes(self._buffer[start:stop])
+        return bytes(self._buffer[start:]) + bytes(self._buffer[:stop - len(self._buffer)])
+
+    # -----------------------------------------------------------------------------
+    def run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    # -----------------------------------------------------------------------------
+    def flush(self):
+        """
+        Scrive su file i campioni non ancora salvati, con un'unica write.
+        """
+        with self._flush_lock:
+            with self._lock:
+                data = self._copy(self._flushed_head, self._head)
+                self._flushed_head = self._head
+            if not data:
+                return 0
+            try:
+                self._write(data)
+            except OSError as e:
+                print(f"Errore scrittura archivio telemetria: {e}")
+                return 0
+            count = len(data) // RECORD_SIZE
+            self.flushed += count
+            return count
+
+    # -----------------------------------------------------------------------------
+    def _write(self, data):
+        if self._file is None or self._file_size + len(data) > self.max_bytes:
+            self._rotate()
+        self._file.write(data)
+        self._file.flush()
+        self._file_size += len(data)
+
+    # -----------------------------------------------------------------------------
+    def _rotate(self):
+        if self._file is not None:
+            self._file.close()
+            self.files_rotated += 1
+
+        os.makedirs(self.directory, exist_ok=True)
+        now = time.time()
+        name = FILE_PREFIX + datetime.datetime.fromtimestamp(now).strftime("%Y%m%d-%H%M%S-%f") + FILE_SUFFIX
+        self._file = open(os.path.join(self.directory, name), "wb")
+        self._file.write(HEADER.pack(MAGIC, RECORD_SIZE, 0, now))
+        self._file_size = HEADER_SIZE
+
+        if self.max_files:
+            files = archive_files(self.directory)
+            for path in files[:-self.max_files]:
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    print(f"Impossibile eliminare {path}: {e}")
+
+    # -----------------------------------------------------------------------------
+    def stats(self):
+        return {
+            "samples": self.samples,
+            "flushed": self.flushed,
+            "overruns": self.overruns,
+            "files_rotated": self.files_rotated,
+        }
+
+
+# -----------------------------------------------------------------------------
+def archive_files(directory):
+    """
+    File di archivio della cartella, dal più vecchio al più recente.
+    """
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return []
+    return [os.path.join(directory, n) for n in sorted(names) if n.startswith(FILE_PREFIX) and n.endswith(FILE_SUFFIX)]
+
+
+#-------------------------------------------------------------------------------------------------------------------------
+# Lettura dell'archivio
+#-------------------------------------------------------------------------------------------------------------------------
+#
+class ArchiveFile:
+    """
+    Un file di archivio mappato in memoria, con le colonne esposte come memoryview a passo fisso.
+    Va chiuso con close() (o usato con `with`) per rilasciare la mappatura.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self.count = max(0, (size - HEADER_SIZE) // RECORD_SIZE)
+        self._mmap = None
+        self._views = {}
+        if self.count == 0:
+            return
+
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, record_size, _, self.created = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or record_size != RECORD_SIZE:
+            self.close()
+            raise ValueError(f"{path}: formato di archivio non riconosciuto")
+
+        # Solo i record completi: il file corrente può avere un record scritto a metà
+        self._data = memoryview(self._mmap)[HEADER_SIZE:HEADER_SIZE + self.count * RECORD_SIZE]
+
+    # -----------------------------------------------------------------------------
+    def column(self, name):
+        """
+        Vista (senza copia) della colonna `name` su tutti i record del file.
+        """
+        view = self._views.get(name)
+        if view is None:
+            fmt, first, stride = COLUMNS[name]
+            view = self._data.cast(fmt)[first::stride]
+            self._views[name] = view
+        return view
+
+    # -----------------------------------------------------------------------------
+    def index_range(self, t_start, t_end):
+        """
+        Indici [i, j) dei record con istante compreso tra t_start e t_end.
+        """
+        if self.count == 0:
+            return 0, 0
+        times = self.column("time")
+        return bisect.bisect_left(times, t_start), bisect.bisect_right(times, t_end)
+
+    # -----------------------------------------------------------------------------
+    def close(self):
+        for view in self._views.values():
+            view.release()
+        self._views.clear()
+        if self._mmap is not None:
+            self._data.release()
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# -----------------------------------------------------------------------------
+class TelemetryArchive:
+    """
+    Interrogazioni sull'insieme dei file di archivio di una cartella.
+    """
+
+    def __init__(self, directory=DEFAULT_DIRECTORY):
+        self.directory = directory
+
+    # -----------------------------------------------------------------------------
+    def files(self):
+        return archive_files(self.directory)
+
+    # -----------------------------------------------------------------------------
+    def _open_all(self):
+        for path in self.files():
+            try:
+                archive = ArchiveFile(path)
+            except (OSError, ValueError) as e:
+                print(f"File di telemetria ignorato: {e}")
+                continue
+            with archive:
+                if archive.count:
+                    yield archive
+
+    # -----------------------------------------------------------------------------
+    def span(self):
+        """
+        Restituisce (primo istante, ultimo istante, numero di campioni) dell'archivio.
+        """
+        first = last = None
+        count = 0
+        for archive in self._open_all():
+            times = archive.column("time")
+            if first is None:
+                first = times[0]
+            last = times[-1]
+            count += archive.count
+        return first, last, count
+
+    # -----------------------------------------------------------------------------
+    def query(self, t_start, t_end, columns=("time", "frequency", "rssi", "status", "squelch")):
+        """
+        Campioni tra t_start e t_end, restituiti come array compatti per colonna.
+        """
+        result = {name: array.array(COLUMNS[name][0]) for name in columns}
+        for archive in self._open_all():
+            i, j = archive.index_range(t_start, t_end)
+            if i >= j:
+                continue
+            for name in columns:
+                result[name].extend(archive.column(name)[i:j])
+        return result
+
+    # -----------------------------------------------------------------------------
+    def downsample(self, t_start, t_end, buckets, column="rssi"):
+        """
+        Divide l'intervallo in `buckets` parti uguali e restituisce per ciascuna
+        (istante iniziale, minimo, media, massimo, campioni); None per le parti vuote.
+        """
+        width = (t_end - t_start) / buckets
+        lows = [None] * buckets
+        highs = [None] * buckets
+        sums = [0] * buckets
+        counts = [0] * buckets
+
+        for archive in self._open_all():
+            times = archive.column("time")
+            values = archive.column(column)
+            i, end = archive.index_range(t_start, t_end)
+            while i < end:
+                bucket = min(int((times[i] - t_start) / width), buckets - 1)
+                # Fine della parte corrente: ricerca binaria sugli istanti, poi aggregazione in blocco
+                j = min(bisect.bisect_left(times, t_start + (bucket + 1) * width, i, end), end)
+                if bucket == buckets - 1:
+                    j = end
+                j = max(j, i + 1)
+                chunk = values[i:j]
+                low, high = min(chunk), max(chunk)
+                lows[bucket] = low if lows[bucket] is None else min(lows[bucket], low)
+                highs[bucket] = high if highs[bucket] is None else max(highs[bucket], high)
+                sums[bucket] += sum(chunk)
+                counts[bucket] += j - i
+                chunk.release()
+                i = j
+
+        return [
+            (t_start + b * width, lows[b], sums[b] / counts[b], highs[b], counts[b]) if counts[b] else None
+            for b in range(buckets)
+        ]
+
+
+# -----------------------------------------------------------------------------
+def _main(argv):
+    directory = argv[1] if len(argv) > 1 else DEFAULT_DIRECTORY
+    buckets = int(argv[2]) if len(argv) > 2 else 24
+
+    archive = TelemetryArchive(directory)
+    first, last, count = archive.span()
+    if not count:
+        print(f"Nessun campione in {directory}")
+        return 1
+
+    print(f"{count} campioni dal {time.ctime(first)} al {time.ctime(last)}")
+    for row in archive.downsample(first, last, buckets):
+        if row is None:
+            continue
+        t, low, mean, high, n = row
+        print(f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(t))}  RSSI min {low:5d}  media {mean:7.1f}  max {high:5d}  ({n})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main(sys.argv))
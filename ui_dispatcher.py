@@ -0,0 +1,148 @@
+# *
+# * Project Name: Radio User Interface
+# * File: ui_dispatcher.py
+# *
+# * Copyright (C) 2024 Fabrizio Palumbo (IU0IJV)
+# *
+# * This program is distributed under the terms of the MIT license.
+# * You can obtain a copy of the license at:
+# * https://opensource.org/licenses/MIT
+# *
+# * DESCRIPTION:
+# * Dispatcher degli aggiornamenti grafici con limite di frame al secondo.
+# *
+# * NOTES:
+# * - I thread di elaborazione chiamano post(): per ogni destinazione resta solo l'ultimo valore.
+# * - Un unico ciclo root.after applica gli aggiornamenti una volta per frame, saltando quelli
+# *   che non cambiano nulla rispetto all'ultimo valore visualizzato.
+# * - L'ultimo valore è quello applicato dal dispatcher: se l'utente cambia direttamente un
+# *   widget (slider, Entry) il gestore deve chiamare invalidate(chiave), altrimenti una
+# *   lettura uguale alla precedente verrebbe scartata e il widget resterebbe sul valore
+# *   dell'utente anche se la radio non lo ha accettato.
+
+import threading
+import time
+
+
+#-------------------------------------------------------------------------------------------------------------------------
+# Dispatcher
+#-------------------------------------------------------------------------------------------------------------------------
+#
+class UiDispatcher:
+    """
+    Raccoglie gli aggiornamenti destinati ai widget e li applica dal thread Tk a frequenza limitata.
+
+    fps: numero massimo di aggiornamenti dello schermo al secondo.
+    lag: istogramma opzionale (metodo observe) del ritardo, in secondi, con cui Tk esegue
+         il ciclo rispetto all'istante programmato: misura quanto il thread Tk è occupato.
+    """
+
+    def __init__(self, fps=30):
+        self.interval_ms = max(1, int(1000 / fps))
+        self.root = None
+
+        self.received = 0               # Aggiornamenti ricevuti con post()
+        self.coalesced = 0              # Sostituiti da un valore più recente prima del frame
+        self.skipped = 0                # Scartati perché uguali all'ultimo valore visualizzato
+        self.rendered = 0               # Effettivamente applicati ai widget
+        self.frames = 0                 # Frame in cui è stato applicato almeno un aggiornamento
+
+        self._pending = {}              # destinazione -> (funzione, argomenti, forza)
+        self._last = {}                 # destinazione -> ultimi argomenti visualizzati
+        self._lock = threading.Lock()
+        self._after_id = None
+        self._due = 0.0                 # Istante previsto del prossimo ciclo
+        self.lag = None
+
+    # -----------------------------------------------------------------------------
+    def start(self, root):
+        """
+        Avvia il ciclo di aggiornamento sul root Tk (da chiamare dal thread Tk).
+        """
+        self.root = root
+        if self._after_id is None:
+            self._schedule()
+
+    # -----------------------------------------------------------------------------
+    def stop(self):
+        if self.root is not None and self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+        self._after_id = None
+
+    # -----------------------------------------------------------------------------
+    def post(self, key, fn, *args, force=False):
+        """
+        Registra l'aggiornamento `fn(*args)` per la destinazione `key`. Thread-safe.
+        force=True applica l'aggiornamento anche se il valore non è cambiato.
+
+        Un widget modificato direttamente dall'utente non passa di qui: il suo gestore deve
+        chiamare invalidate(key) perché la lettura successiva della radio venga applicata.
+        """
+        with self._lock:
+            self.received += 1
+            if key in self._pending:
+                self.coalesced += 1
+            self._pending[key] = (fn, args, force)
+
+    # -----------------------------------------------------------------------------
+    def invalidate(self, key=None):
+        """
+        Dimentica l'ultimo valore visualizzato (es. dopo che un widget è stato ricreato o
+        modificato dall'utente). Utilizzabile da qualsiasi thread.
+        """
+        if key is None:
+            self._last.clear()
+        else:
+            self._last.pop(key, None)
+
+    # -----------------------------------------------------------------------------
+    def flush(self):
+        """
+        Applica gli aggiornamenti in attesa. Da chiamare solo dal thread Tk.
+        """
+        with self._lock:
+            if not self._pending:
+                return 0
+            pending = self._pending
+            self._pending = {}
+
+        rendered = 0
+        last = self._last
+        for key, (fn, args, force) in pending.items():
+            if not force and last.get(key) == args:
+                self.skipped += 1
+                continue
+            try:
+                fn(*args)
+            except Exception as e:
+                print(f"Errore durante l'aggiornamento di '{key}': {e}")
+                continue
+            last[key] = args
+            rendered += 1
+
+        if rendered:
+            self.rendered += rendered
+            self.frames += 1
+        return rendered
+
+    # -----------------------------------------------------------------------------
+    def _schedule(self):
+        self._due = time.perf_counter() + self.interval_ms / 1000
+        self._after_id = self.root.after(self.interval_ms, self._tick)
+
+    # -----------------------------------------------------------------------------
+    def _tick(self):
+        if self.lag is not None:
+            self.lag.observe(max(0.0, time.perf_counter() - self._due))
+        self.flush()
+        self._schedule()
+
+    # -----------------------------------------------------------------------------
+    def stats(self):
+        return {
+            "received": self.received,
+            "coalesced": self.coalesced,
+            "skipped": self.skipped,
+            "rendered": self.rendered,
+            "frames": self.frames,
+        }